@@ -10,15 +10,60 @@ filter_sentiment_words = True
 filter_stopwords = True
 
 embedding_size = 300
-max_sequence_length = 15
+# the percentage of training sentences mconf.max_sequence_length is selected to cover, if set
+max_sequence_length_percentile = None  # set by runtime param
+# the shortest length the percentile may select, e.g. the widest filter of the classifier's convolutions
+min_sequence_length = 1
+
+# subword tokenization, enabled at training time by --bpe-merges-file-path and restored with the model
+bpe_merges_file_path = None  # set by runtime param
+bpe_max_sequence_length = 25  # in subwords, replaces mconf.max_sequence_length when subwords are used
 validation_interval = 1
+logging_interval = 10  # training updates between loss logs and summaries
+summary_flush_seconds = 30
+# mid-epoch checkpoints, every so many updates or seconds, in addition to the one at the end of every epoch
+checkpoint_interval_steps = 0
+checkpoint_interval_seconds = 0
+max_checkpoints_to_keep = 5
+training_workers = 1  # data-parallel worker threads, each running a shard of every batch
+
+# multi-node training, the cluster spec maps the "chief", "worker" and "ps" jobs to host:port lists
+cluster_spec = None  # set by runtime param
+job_name = None  # set by runtime param
+task_index = 0  # set by runtime param
+sync_replicas = False  # aggregate the gradients of all replicas before every update
 tsne_sample_limit = 1000
 
+# session threading, 0 lets tensorflow pick
+intra_op_parallelism_threads = 0
+inter_op_parallelism_threads = 0
+cpu_affinity = None  # e.g. "0-7,16-23"
+use_xla_jit = False
+
+# inference decoding, a beam width of 1 decodes greedily
+beam_width = 1
+length_penalty_weight = 0.0
+sampling = False
+sampling_temperature = 1.0
+sampling_top_k = 0
+sampling_top_p = 1.0
+
+# shortlist decoding: greedy transforms decode over this many vocabulary ids per batch (0 disables)
+shortlist_size = 0
+shortlist_comparison = False  # also decode with the full vocabulary and report differences
+
+# per-row decode length cap of ceil(ratio * source length) + slack (a ratio of 0 disables)
+max_decode_length_ratio = 0.0
+max_decode_length_slack = 2
+
 save_directory = "./saved-models/{}".format(experiment_timestamp)
 classifier_save_directory = "./saved-models-classifier/{}".format(experiment_timestamp)
 
 log_directory = "./tensorflow-logs/{}".format(experiment_timestamp)
 
+# tokenized training corpora, shared by all runs
+dataset_cache_directory = "./dataset-cache"
+
 all_style_embeddings_path = save_directory + "/all_style_embeddings.npy"
 all_content_embeddings_path = save_directory + "/all_content_embeddings.npy"
 all_shuffled_labels_path = save_directory + "/all_shuffled_labels_path.pkl"
@@ -62,9 +107,18 @@ label_to_index_dict_file = "label_to_index_dict.json"
 index_to_label_dict_path = save_directory + "/" + index_to_label_dict_file
 label_to_index_dict_path = save_directory + "/" + label_to_index_dict_file
 
+bpe_merges_file = "bpe_merges.txt"
+bpe_merges_save_path = save_directory + "/" + bpe_merges_file
+
 average_label_embeddings_file = "average_label_embeddings.pkl"
 average_label_embeddings_path = save_directory + "/" + average_label_embeddings_file
 
+training_state_file = "training_state.pkl"
+
+# raw copies of a checkpoint's weights that inference workers map read-only, in a folder named after the checkpoint
+shared_weights_folder = "shared_weights"
+shared_weights_index_file = "index.json"
+
 style_coordinates_file = "style_coordinates.pkl"
 content_coordinates_file = "content_coordinates.pkl"
 style_coordinates_path = save_directory + "/" + style_coordinates_file
@@ -73,4 +127,27 @@ content_coordinates_path = save_directory + "/" + content_coordinates_file
 validation_scores_file = "validation_scores.txt"
 validation_scores_path = save_directory + "/" + validation_scores_file
 
+# early stopping on the weighted mean of the aggregate validation scores, a patience of 0 disables it
+validation_score_weights = {"style-transfer": 1.0, "content-preservation": 1.0, "word-overlap": 1.0}
+early_stopping_patience = 0  # in validations without an improvement
+early_stopping_min_delta = 0.0
+best_model_save_directory = save_directory + "/best"
+best_model_save_path = best_model_save_directory + "/" + model_save_file
+best_validation_scores_file = "best_validation_scores.json"
+
+training_metrics_file = "training_metrics.jsonl"
+training_metrics_path = save_directory + "/" + training_metrics_file
+inference_metrics_file = "inference_metrics.jsonl"
+inference_metrics_path = None  # set by runtime param, in the output folder of the run
+
+profile_steps = None  # set by runtime param, the [start, end) steps to trace
+profile_directory = "output/{}-profile".format(experiment_timestamp)
+
+session_config_file = "session_config.json"
+
+inference_job_manifest_file = "manifest.json"
+inference_job_input_shards_folder = "input-shards"
+inference_job_output_shards_folder = "output-shards"
+inference_job_shard_file = "shard-{:05d}.txt"
+
 sentiment_words_file_path = "data/opinion-lexicon/sentiment-words.txt"
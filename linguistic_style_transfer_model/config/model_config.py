@@ -3,6 +3,12 @@ class ModelConfig():
     def __init__(self):
         # batch settings
         self.batch_size = 128
+        # micro-batches of batch_size whose gradients are accumulated into a single update
+        self.gradient_accumulation_steps = 1
+
+        # sequences are padded to (or truncated at) this many tokens, including the EOS token
+        # selected from the training corpus with --max-sequence-length-percentile, otherwise 25 for subwords
+        self.max_sequence_length = 15
 
         # layer sizes
         self.encoder_rnn_size = 256
@@ -28,12 +34,30 @@ class ModelConfig():
         self.style_kl_lambda = 0.03
         self.content_kl_lambda = 0.03
 
-        # training iterations
+        # training iterations, counted in updates
         self.kl_anneal_iterations = 20000
 
+        # adversary schedule: the adversaries are updated on every k-th autoencoder update, n times each,
+        # in their own session runs unless both are 1
+        self.adversary_update_interval = 1
+        self.adversary_steps_per_autoencoder_step = 1
+
         # noise
         self.epsilon = 1e-8
 
+        # decoder
+        # inference decoders project the latent vector once per sequence; training keeps per-step dropout
+        self.precompute_decoder_latent_projection = True
+
+        # sampled training losses for large vocabularies: None, "sampled_softmax" or "nce"
+        # inference always uses the full vocabulary projection
+        self.reconstruction_sampled_loss = None
+        self.bow_sampled_loss = None
+        self.num_sampled_words = 1024
+        self.num_sampled_bow_words = 512
+        self.num_true_bow_words = 8
+        self.content_adversary_hidden_size = None  # defaults to the BoW size
+
     def init_from_dict(self, previous_config):
         for key in previous_config:
             setattr(self, key, previous_config[key])
@@ -25,3 +25,42 @@ class Options(argparse.Namespace):
         self.evaluation_label_file_path = None
         self.num_sentences_to_generate = None
         self.label_index = None
+        self.stream = None
+        self.job_directory = None
+        self.shard_size = None
+        self.workers = None
+        self.intra_op_parallelism_threads = None
+        self.inter_op_parallelism_threads = None
+        self.cpu_affinity = None
+        self.xla_jit = None
+        self.beam_width = None
+        self.length_penalty_weight = None
+        self.generation_batch_size = None
+        self.sampling = None
+        self.sampling_temperature = None
+        self.sampling_top_k = None
+        self.sampling_top_p = None
+        self.shortlist_size = None
+        self.compare_shortlist = None
+        self.bpe_merges_file_path = None
+        self.max_decode_length_ratio = None
+        self.max_decode_length_slack = None
+        self.training_workers = None
+        self.cluster_spec = None
+        self.job_name = None
+        self.task_index = None
+        self.sync_replicas = None
+        self.logging_interval = None
+        self.profile_steps = None
+        self.checkpoint_interval_steps = None
+        self.checkpoint_interval_seconds = None
+        self.max_checkpoints_to_keep = None
+        self.resume_from = None
+        self.dataset_cache_directory = None
+        self.deduplicate_corpus = None
+        self.max_sequence_length_percentile = None
+        self.early_stopping_patience = None
+        self.early_stopping_min_delta = None
+        self.validation_score_weights = None
+        self.experiment_name = None
+        self.model_config_overrides = None
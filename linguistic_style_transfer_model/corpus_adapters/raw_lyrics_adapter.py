@@ -27,6 +27,8 @@ all_genres_file_path = "data/lyrics_raw/genre-all.txt"
 
 dev_proportion = 0.01
 test_proportion = 0.05
+# in words, the default max_sequence_length of the model config
+max_line_length = 15
 
 whitelisted_artists = {
     "Ella Fitzgerald",
@@ -69,7 +71,6 @@ def get_stanzas_from_song(song_text):
     return song_text.split('\n\n')
 
 
-max_line_length = global_config.max_sequence_length
 all_lyrics_tuples = list()
 with open(raw_lyrics_file_path, 'r') as lyrics_file:
     next(lyrics_file)
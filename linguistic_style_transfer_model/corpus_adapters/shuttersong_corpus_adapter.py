@@ -25,6 +25,8 @@ song_artists_file_path = "data/shuttersong/song_artists.tsv"
 
 dev_proportion = 0.01
 test_proportion = 0.05
+# in words, the default max_sequence_length of the model config
+max_line_length = 15
 
 
 def clean_text(string):
@@ -52,7 +54,6 @@ def get_stanzas_from_song(song_text):
     return song_text.split('\n\n')
 
 
-max_line_length = global_config.max_sequence_length
 all_lyric_tuples = list()
 count = 0
 song_artists = dict()
@@ -10,7 +10,7 @@ from types import SimpleNamespace
 from linguistic_style_transfer_model.config import global_config
 from linguistic_style_transfer_model.evaluators import \
     style_transfer, content_preservation, language_fluency
-from linguistic_style_transfer_model.utils import log_initializer
+from linguistic_style_transfer_model.utils import log_initializer, tf_session_helper
 
 logger = logging.getLogger(global_config.logger_name)
 
@@ -23,6 +23,10 @@ class Options(SimpleNamespace):
         self.inference_path = None
         self.embeddings_path = None
         self.language_model_path = None
+        self.intra_op_parallelism_threads = None
+        self.inter_op_parallelism_threads = None
+        self.cpu_affinity = None
+        self.xla_jit = None
 
 
 def main(argv):
@@ -33,11 +37,15 @@ def main(argv):
     parser.add_argument("--inference-path", type=str, required=True)
     parser.add_argument("--embeddings-path", type=str, required=True)
     parser.add_argument("--language-model-path", type=str, required=True)
+    tf_session_helper.add_session_arguments(parser)
     parser.parse_known_args(args=argv, namespace=options)
 
     global logger
     logger = log_initializer.setup_custom_logger(global_config.logger_name, "INFO")
     logger.info(options)
+    tf_session_helper.configure_session(
+        options.intra_op_parallelism_threads, options.inter_op_parallelism_threads,
+        options.cpu_affinity, options.xla_jit)
 
     index_label_file_path = os.path.join(options.training_path, global_config.index_to_label_dict_file)
     with open(index_label_file_path, 'r') as index_label_file:
@@ -30,14 +30,9 @@ def get_style_transfer_score(classifier_saved_model_path, text_file_path, label,
     trimmed_sequences = [
         [x if x < vocab_size else word_index[global_config.unk_token] for x in sequence]
         for sequence in actual_sequences]
-    text_sequences = tf.keras.preprocessing.sequence.pad_sequences(
-        trimmed_sequences, maxlen=global_config.max_sequence_length, padding='post',
-        truncating='post', value=word_index[global_config.eos_token])
-
-    x_test = np.asarray(text_sequences)
 
     if label:
-        y_test = np.asarray([int(label)] * len(text_sequences))
+        y_test = np.asarray([int(label)] * len(trimmed_sequences))
     else:
         label_to_index_dict = None
         labels = list()
@@ -62,6 +57,13 @@ def get_style_transfer_score(classifier_saved_model_path, text_file_path, label,
 
             # Get the placeholders from the graph by name
             input_x = graph.get_operation_by_name("input_x").outputs[0]
+
+            # the classifier's input length is fixed when it is trained, independently of the
+            # sequence length (or tokenization) of the style transfer model
+            text_sequences = tf.keras.preprocessing.sequence.pad_sequences(
+                trimmed_sequences, maxlen=int(input_x.shape[1]), padding='post',
+                truncating='post', value=word_index[global_config.eos_token])
+            x_test = np.asarray(text_sequences)
             # input_y = graph.get_operation_by_name("input_y").outputs[0]
             dropout_keep_prob = graph.get_operation_by_name("dropout_keep_prob").outputs[0]
 
@@ -98,11 +100,15 @@ def main(argv):
     parser.add_argument("--text-file-path", type=str, required=True)
     parser.add_argument("--label-index", type=str, required=False)
     parser.add_argument("--label-file-path", type=str, required=False)
+    tf_session_helper.add_session_arguments(parser)
     args_namespace = parser.parse_args(argv)
     command_line_args = vars(args_namespace)
 
     global logger
     logger = log_initializer.setup_custom_logger(global_config.logger_name, "INFO")
+    tf_session_helper.configure_session(
+        command_line_args['intra_op_parallelism_threads'], command_line_args['inter_op_parallelism_threads'],
+        command_line_args['cpu_affinity'], command_line_args['xla_jit'])
 
     if not command_line_args['label_file_path'] and not command_line_args['label_index']:
         raise Exception("Provide either label-index or label_file_path")
@@ -4,46 +4,88 @@ import argparse
 import json
 import numpy as np
 import os
-import pickle
-import tensorflow as tf
+import shutil
 
 from linguistic_style_transfer_model.config import global_config
 from linguistic_style_transfer_model.config.model_config import mconf
 from linguistic_style_transfer_model.config.options import Options
 from linguistic_style_transfer_model.models import adversarial_autoencoder
-from linguistic_style_transfer_model.utils import bleu_scorer, \
-    data_processor, log_initializer, word_embedder, tf_session_helper
+from linguistic_style_transfer_model.utils import bleu_scorer, bpe_tokenizer, cluster_helper, \
+    checkpoint_writer, data_processor, dataset_cache, log_initializer, word_embedder, tf_session_helper, \
+    inference_helper, inference_job, inference_pool, step_profiler
 
 logger = None
 
 
-def get_data(options):
-    [word_index, padded_sequences, text_sequence_lengths,
-     text_tokenizer, inverse_word_index] = \
-        data_processor.get_text_sequences(
-            options.text_file_path, options.vocab_size, global_config.vocab_save_path)
+def get_data(options, saved_word_index=None):
+    # a cached corpus skips tokenization, for a resumed model only if it was tokenized with the same vocab
+    cache_path = dataset_cache.get_cache_path(options.text_file_path, options.vocab_size)
+    cached_dataset = dataset_cache.load_dataset(cache_path)
+    if cached_dataset is not None and saved_word_index is not None and cached_dataset[0] != saved_word_index:
+        cached_dataset = None
+
+    if cached_dataset is not None:
+        logger.info("Loaded the tokenized corpus from {}".format(cache_path))
+        [word_index, padded_sequences, text_sequence_lengths] = cached_dataset
+        global_config.vocab_size = len(word_index)
+        data_processor.populate_word_blacklist(word_index)
+        text_tokenizer = inference_helper.get_text_tokenizer(word_index)
+        inverse_word_index = {v: k for k, v in word_index.items()}
+        if cluster_helper.is_chief() and not options.resume_from:
+            with open(global_config.vocab_save_path, 'w') as json_file:
+                json.dump(word_index, json_file)
+    elif saved_word_index is not None:
+        word_index = saved_word_index
+        text_tokenizer = inference_helper.get_text_tokenizer(word_index)
+        inverse_word_index = {v: k for k, v in word_index.items()}
+        [_, _, padded_sequences, text_sequence_lengths] = data_processor.get_test_sequences(
+            options.text_file_path, text_tokenizer, word_index, inverse_word_index)
+    else:
+        [word_index, padded_sequences, text_sequence_lengths,
+         text_tokenizer, inverse_word_index] = \
+            data_processor.get_text_sequences(
+                options.text_file_path, options.vocab_size,
+                global_config.vocab_save_path if cluster_helper.is_chief() else None)
+        dataset_cache.save_dataset(cache_path, word_index, padded_sequences, text_sequence_lengths)
     logger.debug("text_sequence_lengths: {}".format(text_sequence_lengths.shape))
     logger.debug("padded_sequences: {}".format(padded_sequences.shape))
 
-    [one_hot_labels, num_labels] = \
-        data_processor.get_labels(options.label_file_path, True, global_config.save_directory)
+    if options.resume_from:
+        [one_hot_labels, num_labels] = \
+            data_processor.get_saved_labels(options.label_file_path, options.resume_from)
+    else:
+        [one_hot_labels, num_labels] = data_processor.get_labels(
+            options.label_file_path, cluster_helper.is_chief(), global_config.save_directory)
     logger.debug("one_hot_labels.shape: {}".format(one_hot_labels.shape))
 
     return [word_index, padded_sequences, text_sequence_lengths, one_hot_labels, num_labels,
             text_tokenizer, inverse_word_index]
 
 
+def configure_experiment_name(experiment_name):
+    """Names the folders of a run after `experiment_name` instead of its timestamp, e.g. for sweep trials"""
+    experiment_timestamp = global_config.experiment_timestamp
+    for name, value in list(vars(global_config).items()):
+        if isinstance(value, str) and experiment_timestamp in value:
+            setattr(global_config, name, value.replace(experiment_timestamp, experiment_name))
+
+
+def configure_save_directory(save_directory):
+    """Points every path in the model folder at `save_directory`, e.g. to resume training in place"""
+    default_save_directory = global_config.save_directory
+    for name, value in list(vars(global_config).items()):
+        if isinstance(value, str) and value.startswith(default_save_directory + "/"):
+            setattr(global_config, name, save_directory + value[len(default_save_directory):])
+    global_config.save_directory = save_directory
+
+
 def execute_post_inference_operations(
         actual_word_lists, generated_sequences, final_sequence_lengths, inverse_word_index,
         timestamped_file_suffix, label):
     logger.debug("Minimum generated sentence length: {}".format(min(final_sequence_lengths)))
 
-    # first trims the generates sentences down to the length the decoder returns
-    # then trim any <eos> token
-    trimmed_generated_sequences = \
-        [[index for index in sequence
-          if index != global_config.predefined_word_index[global_config.eos_token]]
-         for sequence in [x[:(y - 1)] for (x, y) in zip(generated_sequences, final_sequence_lengths)]]
+    trimmed_generated_sequences = data_processor.trim_generated_sequences(
+        generated_sequences, final_sequence_lengths)
 
     generated_word_lists = \
         [data_processor.generate_words_from_indices(x, inverse_word_index)
@@ -71,27 +113,6 @@ def execute_post_inference_operations(
             output_file.write(sentence + "\n")
 
 
-def get_word_embeddings(embedding_model_path, word_index):
-    encoder_embedding_matrix = np.random.uniform(
-        size=(global_config.vocab_size, global_config.embedding_size),
-        low=-0.05, high=0.05).astype(dtype=np.float32)
-    logger.debug("encoder_embedding_matrix: {}".format(encoder_embedding_matrix.shape))
-
-    decoder_embedding_matrix = np.random.uniform(
-        size=(global_config.vocab_size, global_config.embedding_size),
-        low=-0.05, high=0.05).astype(dtype=np.float32)
-    logger.debug("decoder_embedding_matrix: {}".format(decoder_embedding_matrix.shape))
-
-    if embedding_model_path:
-        logger.info("Loading pretrained embeddings")
-        encoder_embedding_matrix, decoder_embedding_matrix = \
-            word_embedder.add_word_vectors_to_embeddings(
-                word_index, encoder_embedding_matrix, decoder_embedding_matrix,
-                embedding_model_path)
-
-    return encoder_embedding_matrix, decoder_embedding_matrix
-
-
 def main(argv):
     options = Options()
 
@@ -101,6 +122,7 @@ def main(argv):
     run_mode.add_argument("--train-model", action="store_true", default=False)
     run_mode.add_argument("--transform-text", action="store_true", default=False)
     run_mode.add_argument("--generate-novel-text", action="store_true", default=False)
+    tf_session_helper.add_session_arguments(parser)
 
     parser.parse_known_args(args=argv, namespace=options)
     if options.train_model:
@@ -114,17 +136,136 @@ def main(argv):
         parser.add_argument("--validation-embeddings-file-path", type=str, required=True)
         parser.add_argument("--dump-embeddings", action="store_true", default=False)
         parser.add_argument("--classifier-saved-model-path", type=str, required=True)
+        parser.add_argument("--bpe-merges-file-path", type=str)
+        parser.add_argument("--training-workers", type=int, default=1)
+        parser.add_argument("--logging-interval", type=int)
+        parser.add_argument("--profile-steps", type=str)
+        parser.add_argument("--checkpoint-interval-steps", type=int)
+        parser.add_argument("--checkpoint-interval-seconds", type=int)
+        parser.add_argument("--max-checkpoints-to-keep", type=int)
+        parser.add_argument("--resume-from", type=str)
+        parser.add_argument("--dataset-cache-directory", type=str)
+        parser.add_argument("--deduplicate-corpus", action="store_true", default=False)
+        parser.add_argument("--max-sequence-length-percentile", type=float)
+        parser.add_argument("--early-stopping-patience", type=int)
+        parser.add_argument("--early-stopping-min-delta", type=float)
+        parser.add_argument("--validation-score-weights", type=float, nargs=3,
+                            metavar=("STYLE_TRANSFER", "CONTENT_PRESERVATION", "WORD_OVERLAP"))
+        parser.add_argument("--experiment-name", type=str)
+        parser.add_argument("--model-config-overrides", type=str)
+        parser.add_argument("--cluster-spec", type=str)
+        parser.add_argument("--job-name", type=str, choices=["chief", "worker", "ps"])
+        parser.add_argument("--task-index", type=int, default=0)
+        parser.add_argument("--sync-replicas", action="store_true", default=False)
     if options.transform_text:
         parser.add_argument("--saved-model-path", type=str, required=True)
-        parser.add_argument("--evaluation-text-file-path", type=str, required=True)
-        parser.add_argument("--evaluation-label-file-path", type=str, required=True)
+        parser.add_argument("--evaluation-text-file-path", type=str)
+        parser.add_argument("--evaluation-label-file-path", type=str)
+        parser.add_argument("--stream", action="store_true", default=False)
+        parser.add_argument("--label-index", type=int)
+        parser.add_argument("--job-directory", type=str)
+        parser.add_argument("--shard-size", type=int, default=100000)
+        parser.add_argument("--workers", type=int, default=1)
+        parser.add_argument("--beam-width", type=int, default=1)
+        parser.add_argument("--length-penalty-weight", type=float, default=0.0)
+        parser.add_argument("--shortlist-size", type=int, default=0)
+        parser.add_argument("--compare-shortlist", action="store_true", default=False)
+        parser.add_argument("--max-decode-length-ratio", type=float, default=0.0)
+        parser.add_argument("--max-decode-length-slack", type=int, default=2)
+        parser.add_argument("--profile-steps", type=str)
     if options.generate_novel_text:
         parser.add_argument("--saved-model-path", type=str, required=True)
         parser.add_argument("--num-sentences-to-generate", type=int, default=1000, required=True)
-        parser.add_argument("--label-index", type=int, default=1000, required=False)
+        parser.add_argument("--label-index", type=int, required=False)
+        parser.add_argument("--beam-width", type=int, default=1)
+        parser.add_argument("--length-penalty-weight", type=float, default=0.0)
+        parser.add_argument("--generation-batch-size", type=int, default=1000)
+        parser.add_argument("--sampling", action="store_true", default=False)
+        parser.add_argument("--sampling-temperature", type=float, default=1.0)
+        parser.add_argument("--sampling-top-k", type=int, default=0)
+        parser.add_argument("--sampling-top-p", type=float, default=1.0)
+        parser.add_argument("--profile-steps", type=str)
 
     parser.parse_known_args(args=argv, namespace=options)
 
+    if options.transform_text:
+        if (options.stream or options.job_directory) and options.label_index is None:
+            parser.error("--stream and --job-directory require --label-index")
+        if options.job_directory and not options.evaluation_text_file_path:
+            parser.error("--job-directory requires --evaluation-text-file-path")
+        if not (options.stream or options.job_directory) and not \
+                (options.evaluation_text_file_path and options.evaluation_label_file_path):
+            parser.error("--transform-text requires --evaluation-text-file-path and "
+                         "--evaluation-label-file-path unless --stream or --job-directory is used")
+        if options.shortlist_size and options.beam_width > 1:
+            parser.error("--shortlist-size only applies to greedy decoding")
+        if options.compare_shortlist and not options.shortlist_size:
+            parser.error("--compare-shortlist requires --shortlist-size")
+
+    # overrides of model config fields as a JSON object, e.g. by a hyperparameter sweep
+    if options.train_model and options.model_config_overrides:
+        try:
+            model_config_overrides = json.loads(options.model_config_overrides)
+        except ValueError:
+            model_config_overrides = None
+        if not isinstance(model_config_overrides, dict):
+            parser.error("--model-config-overrides expects a JSON object")
+        unknown_fields = [x for x in model_config_overrides if not hasattr(mconf, x)]
+        if unknown_fields:
+            parser.error("Unknown model config fields: {}".format(", ".join(unknown_fields)))
+        mconf.init_from_dict(model_config_overrides)
+
+    has_adversary_schedule = mconf.adversary_update_interval > 1 or mconf.adversary_steps_per_autoencoder_step > 1
+    if options.train_model and has_adversary_schedule and \
+            (options.training_workers > 1 or mconf.gradient_accumulation_steps > 1):
+        parser.error("An adversary schedule does not support --training-workers or gradient_accumulation_steps "
+                     "above 1")
+
+    if options.train_model and options.cluster_spec:
+        options.cluster_spec = cluster_helper.load_cluster_spec(options.cluster_spec)
+        if not options.job_name:
+            parser.error("--cluster-spec requires --job-name")
+        if options.task_index >= len(options.cluster_spec.get(options.job_name, [])):
+            parser.error("--task-index {} is not in the {} job of the cluster spec".format(
+                options.task_index, options.job_name))
+        if len(options.cluster_spec.get("chief", [])) != 1 or not options.cluster_spec.get("ps"):
+            parser.error("--cluster-spec requires exactly one chief and at least one ps task")
+        if options.training_workers > 1:
+            parser.error("--training-workers and --cluster-spec are mutually exclusive")
+        if options.sync_replicas and mconf.gradient_accumulation_steps > 1:
+            parser.error("--sync-replicas does not support gradient_accumulation_steps above 1")
+        if options.sync_replicas and has_adversary_schedule:
+            parser.error("--sync-replicas does not support an adversary schedule")
+    elif options.train_model and (options.job_name or options.sync_replicas):
+        parser.error("--job-name and --sync-replicas require --cluster-spec")
+
+    if options.validation_score_weights and (
+            min(options.validation_score_weights) < 0 or not sum(options.validation_score_weights)):
+        parser.error("--validation-score-weights must be non-negative and not all 0")
+
+    if options.train_model and options.resume_from:
+        if checkpoint_writer.get_resumable_checkpoint(options.resume_from) is None:
+            parser.error("--resume-from requires a model folder with a checkpoint and its training state")
+        if options.bpe_merges_file_path:
+            parser.error("--resume-from reuses the subwords of the saved model, drop --bpe-merges-file-path")
+        if options.max_sequence_length_percentile:
+            parser.error("--resume-from reuses the sequence length of the saved model, "
+                         "drop --max-sequence-length-percentile")
+
+    if options.max_sequence_length_percentile is not None and not 0 < options.max_sequence_length_percentile <= 100:
+        parser.error("--max-sequence-length-percentile must be in (0, 100]")
+
+    if options.profile_steps:
+        try:
+            options.profile_steps = step_profiler.parse_profile_steps(options.profile_steps)
+        except ValueError:
+            parser.error("--profile-steps expects START:END with 0 <= START < END")
+        if options.transform_text and options.workers > 1:
+            parser.error("--profile-steps requires a single worker")
+
+    if options.generate_novel_text and options.sampling and options.beam_width > 1:
+        parser.error("--sampling and --beam-width are mutually exclusive")
+
     global logger
     logger = log_initializer.setup_custom_logger(global_config.logger_name, options.logging_level)
 
@@ -132,75 +273,153 @@ def main(argv):
         logger.info("Nothing to do. Exiting ...")
         sys.exit(0)
 
+    if options.experiment_name:
+        configure_experiment_name(options.experiment_name)
+
+    # a session config recorded by the autotuner is the default, explicit flags override it
+    if options.saved_model_path:
+        tf_session_helper.configure_session(
+            **tf_session_helper.load_session_config(options.saved_model_path))
+    tf_session_helper.configure_session(
+        options.intra_op_parallelism_threads, options.inter_op_parallelism_threads,
+        options.cpu_affinity, options.xla_jit)
+
+    inference_helper.configure_decoding(
+        options.beam_width, options.length_penalty_weight, options.sampling,
+        options.sampling_temperature, options.sampling_top_k, options.sampling_top_p,
+        options.shortlist_size, options.compare_shortlist,
+        options.max_decode_length_ratio, options.max_decode_length_slack)
+
+    # every inference process appends its batch metrics to the same file
+    if options.transform_text:
+        global_config.inference_metrics_path = "output/{}-inference/{}".format(
+            global_config.experiment_timestamp, global_config.inference_metrics_file)
+    elif options.generate_novel_text:
+        global_config.inference_metrics_path = "output/{}-generation/{}".format(
+            global_config.experiment_timestamp, global_config.inference_metrics_file)
+
+    global_config.profile_steps = options.profile_steps
     global_config.training_epochs = options.training_epochs
+    if options.training_workers:
+        global_config.training_workers = options.training_workers
+    if options.logging_interval:
+        global_config.logging_interval = options.logging_interval
+    if options.checkpoint_interval_steps:
+        global_config.checkpoint_interval_steps = options.checkpoint_interval_steps
+    if options.checkpoint_interval_seconds:
+        global_config.checkpoint_interval_seconds = options.checkpoint_interval_seconds
+    if options.max_checkpoints_to_keep:
+        global_config.max_checkpoints_to_keep = options.max_checkpoints_to_keep
+    if options.dataset_cache_directory:
+        global_config.dataset_cache_directory = options.dataset_cache_directory
+    if options.max_sequence_length_percentile:
+        global_config.max_sequence_length_percentile = options.max_sequence_length_percentile
+    if options.early_stopping_patience:
+        global_config.early_stopping_patience = options.early_stopping_patience
+    if options.early_stopping_min_delta:
+        global_config.early_stopping_min_delta = options.early_stopping_min_delta
+    if options.validation_score_weights:
+        global_config.validation_score_weights = dict(zip(
+            ["style-transfer", "content-preservation", "word-overlap"], options.validation_score_weights))
+    if options.cluster_spec:
+        cluster_helper.configure_cluster(
+            options.cluster_spec, options.job_name, options.task_index, options.sync_replicas)
     logger.info("experiment_timestamp: {}".format(global_config.experiment_timestamp))
 
     # Train and save model
-    if options.train_model:
-        os.makedirs(global_config.save_directory)
-        with open(global_config.model_config_file_path, 'w') as model_config_file:
-            json.dump(obj=mconf.__dict__, fp=model_config_file, indent=4)
-        logger.info("Saved model config to {}".format(global_config.model_config_file_path))
+    if options.train_model and options.job_name == "ps":
+        # parameter servers only host variables, until they are stopped
+        cluster_helper.run_parameter_server()
+
+    elif options.train_model:
+        # the other tasks of a cluster do not save anything
+        bpe_merges_file_path = options.bpe_merges_file_path
+        saved_word_index = None
+        if options.resume_from:
+            # training continues in the saved model folder, with its config, vocab, labels and subwords
+            configure_save_directory(os.path.normpath(options.resume_from))
+            [saved_word_index, _, _] = inference_helper.load_inference_artifacts(options.resume_from)
+            logger.info("Resuming training of {}".format(options.resume_from))
+        elif cluster_helper.is_chief():
+            os.makedirs(global_config.save_directory)
+            if options.bpe_merges_file_path:
+                shutil.copyfile(options.bpe_merges_file_path, global_config.bpe_merges_save_path)
+                bpe_merges_file_path = global_config.bpe_merges_save_path
+        if bpe_merges_file_path:
+            bpe_tokenizer.configure_subword_tokenization(bpe_merges_file_path)
 
         # Retrieve all data
         logger.info("Reading data ...")
         [word_index, padded_sequences, text_sequence_lengths, one_hot_labels, num_labels,
-         text_tokenizer, inverse_word_index] = get_data(options)
+         text_tokenizer, inverse_word_index] = get_data(options, saved_word_index)
+        # the model config is saved once tokenization has selected the sequence length
+        if cluster_helper.is_chief() and not options.resume_from:
+            with open(global_config.model_config_file_path, 'w') as model_config_file:
+                json.dump(obj=mconf.__dict__, fp=model_config_file, indent=4)
+            logger.info("Saved model config to {}".format(global_config.model_config_file_path))
+        # every unique sentence is trained on once an epoch, with its losses weighted by its number of copies
+        if options.deduplicate_corpus:
+            [padded_sequences, text_sequence_lengths, one_hot_labels, example_weights] = \
+                data_processor.deduplicate_examples(padded_sequences, text_sequence_lengths, one_hot_labels)
+        else:
+            example_weights = np.ones(shape=len(padded_sequences), dtype=np.float32)
         data_size = padded_sequences.shape[0]
 
         encoder_embedding_matrix, decoder_embedding_matrix = \
-            get_word_embeddings(options.training_embeddings_file_path, word_index)
+            word_embedder.get_word_embeddings(options.training_embeddings_file_path, word_index)
 
         # Build model
         logger.info("Building model architecture ...")
         network = adversarial_autoencoder.AdversarialAutoencoder()
-        network.build_model(
-            word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels)
+        with cluster_helper.get_device_scope():
+            network.build_model(
+                word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels)
+            network.build_training_operations()
 
         logger.info("Training model ...")
-        sess = tf_session_helper.get_tensorflow_session()
-
-        [_, validation_actual_word_lists, validation_sequences, validation_sequence_lengths] = \
-            data_processor.get_test_sequences(
-                options.validation_text_file_path, text_tokenizer, word_index, inverse_word_index)
-        [_, validation_labels] = \
-            data_processor.get_test_labels(options.validation_label_file_path, global_config.save_directory)
+        if cluster_helper.is_distributed():
+            sess = cluster_helper.create_training_session(
+                cluster_helper.start_server(), network.sync_replicas_optimizer,
+                checkpoint_writer.get_resumable_checkpoint(options.resume_from)[0] if options.resume_from else None)
+        else:
+            sess = tf_session_helper.get_tensorflow_session()
+
+        validation_actual_word_lists, validation_sequences, validation_sequence_lengths, validation_labels = \
+            None, None, None, None
+        if cluster_helper.is_chief():
+            [_, validation_actual_word_lists, validation_sequences, validation_sequence_lengths] = \
+                data_processor.get_test_sequences(
+                    options.validation_text_file_path, text_tokenizer, word_index, inverse_word_index)
+            [_, validation_labels] = \
+                data_processor.get_test_labels(options.validation_label_file_path, global_config.save_directory)
 
         network.train(
-            sess, data_size, padded_sequences, text_sequence_lengths, one_hot_labels, num_labels,
-            word_index, encoder_embedding_matrix, decoder_embedding_matrix, validation_sequences,
+            sess, data_size, padded_sequences, text_sequence_lengths, one_hot_labels, example_weights,
+            num_labels, word_index, encoder_embedding_matrix, decoder_embedding_matrix, validation_sequences,
             validation_sequence_lengths, validation_labels, inverse_word_index, validation_actual_word_lists,
             options)
         sess.close()
 
         logger.info("Training complete!")
 
+    elif options.transform_text and options.stream:
+        # Transform an unbounded stream of sentences in constant memory
+        inference_helper.stream_transformed_text(
+            options.saved_model_path, options.label_index, options.evaluation_text_file_path)
+
+    elif options.transform_text and options.job_directory:
+        # Transform a large corpus as a resumable, sharded job
+        inference_job.run_inference_job(options)
+
     elif options.transform_text:
         # Enforce a particular style embedding and regenerate text
         logger.info("Transforming text style ...")
 
-        with open(os.path.join(options.saved_model_path,
-                               global_config.model_config_file), 'r') as json_file:
-            model_config_dict = json.load(json_file)
-            mconf.init_from_dict(model_config_dict)
-            logger.info("Restored model config from saved JSON")
-
-        with open(os.path.join(options.saved_model_path,
-                               global_config.vocab_save_file), 'r') as json_file:
-            word_index = json.load(json_file)
-        with open(os.path.join(options.saved_model_path,
-                               global_config.index_to_label_dict_file), 'r') as json_file:
-            index_to_label_map = json.load(json_file)
-        with open(os.path.join(options.saved_model_path,
-                               global_config.average_label_embeddings_file), 'rb') as pickle_file:
-            average_label_embeddings = pickle.load(pickle_file)
-
-        global_config.vocab_size = len(word_index)
+        [word_index, index_to_label_map, average_label_embeddings] = \
+            inference_helper.load_inference_artifacts(options.saved_model_path)
 
         num_labels = len(index_to_label_map)
-        text_tokenizer = tf.keras.preprocessing.text.Tokenizer(
-            num_words=global_config.vocab_size, filters=global_config.tokenizer_filters)
-        text_tokenizer.word_index = word_index
+        text_tokenizer = inference_helper.get_text_tokenizer(word_index)
 
         inverse_word_index = {v: k for k, v in word_index.items()}
         [actual_sequences, _, padded_sequences, text_sequence_lengths] = \
@@ -209,13 +428,12 @@ def main(argv):
         [label_sequences, _] = \
             data_processor.get_test_labels(options.evaluation_label_file_path, options.saved_model_path)
 
-        logger.info("Building model architecture ...")
-        network = adversarial_autoencoder.AdversarialAutoencoder()
-        encoder_embedding_matrix, decoder_embedding_matrix = get_word_embeddings(None, word_index)
-        network.build_model(
-            word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels)
-
-        sess = tf_session_helper.get_tensorflow_session()
+        pool = None
+        if options.workers > 1:
+            pool = inference_pool.create_worker_pool(
+                options.saved_model_path, options.workers, options.logging_level)
+        else:
+            inference_pool.load_worker_state(options.saved_model_path)
 
         total_nll = 0
         for i in range(num_labels):
@@ -232,9 +450,9 @@ def main(argv):
 
             style_embedding = np.asarray(average_label_embeddings[i])
             [generated_sequences, final_sequence_lengths, _, _, _, cross_entropy_scores] = \
-                network.transform_sentences(
-                    sess, filtered_padded_sequences, filtered_text_sequence_lengths, style_embedding,
-                    num_labels, os.path.join(options.saved_model_path, global_config.model_save_file))
+                inference_pool.transform_sentences(
+                    pool, options.workers, filtered_padded_sequences, filtered_text_sequence_lengths,
+                    style_embedding)
             nll = -np.mean(a=cross_entropy_scores, axis=0)
             total_nll += nll
             logger.info("NLL: {}".format(nll))
@@ -253,9 +471,8 @@ def main(argv):
 
         logger.info("Predicting labels from latent spaces ...")
         _, _, overall_label_predictions, style_label_predictions, adversarial_label_predictions, _ = \
-            network.transform_sentences(
-                sess, padded_sequences, text_sequence_lengths, average_label_embeddings[0],
-                num_labels, os.path.join(options.saved_model_path, global_config.model_save_file))
+            inference_pool.transform_sentences(
+                pool, options.workers, padded_sequences, text_sequence_lengths, average_label_embeddings[0])
 
         # write label predictions to file
         output_file_path = "output/{}-inference/overall_labels_prediction.txt".format(
@@ -281,72 +498,40 @@ def main(argv):
 
         logger.info("Inference run complete")
 
-        sess.close()
+        if pool:
+            pool.close()
+            pool.join()
+        else:
+            inference_pool.worker_state["sess"].close()
 
     elif options.generate_novel_text:
         logger.info("Generating novel text")
 
-        with open(os.path.join(options.saved_model_path,
-                               global_config.model_config_file), 'r') as json_file:
-            model_config_dict = json.load(json_file)
-            mconf.init_from_dict(model_config_dict)
-            logger.info("Restored model config from saved JSON")
-
-        with open(os.path.join(options.saved_model_path,
-                               global_config.vocab_save_file), 'r') as json_file:
-            word_index = json.load(json_file)
-        with open(os.path.join(options.saved_model_path,
-                               global_config.index_to_label_dict_file), 'r') as json_file:
-            index_to_label_map = json.load(json_file)
-        with open(os.path.join(options.saved_model_path,
-                               global_config.average_label_embeddings_file), 'rb') as pickle_file:
-            average_label_embeddings = pickle.load(pickle_file)
-
-        global_config.vocab_size = len(word_index)
+        [network, sess, word_index, index_to_label_map, average_label_embeddings] = \
+            inference_helper.restore_inference_network(options.saved_model_path)
         inverse_word_index = {v: k for k, v in word_index.items()}
-
         num_labels = len(index_to_label_map)
-        text_tokenizer = tf.keras.preprocessing.text.Tokenizer(
-            num_words=global_config.vocab_size, filters=global_config.tokenizer_filters)
-        text_tokenizer.word_index = word_index
-        data_processor.populate_word_blacklist(word_index)
-
-        logger.info("Building model architecture ...")
-        network = adversarial_autoencoder.AdversarialAutoencoder()
-        encoder_embedding_matrix, decoder_embedding_matrix = get_word_embeddings(None, word_index)
-        network.build_model(
-            word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels)
-
-        sess = tf_session_helper.get_tensorflow_session()
 
         for label_index in index_to_label_map:
-            if options.label_index and label_index != options.label_index:
+            if options.label_index is not None and int(label_index) != options.label_index:
                 continue
 
-            style_embedding = np.asarray(average_label_embeddings[int(label_index)])
-            generated_sequences, final_sequence_lengths = \
-                network.generate_novel_sentences(
-                    sess, style_embedding, options.num_sentences_to_generate, num_labels,
-                    os.path.join(options.saved_model_path, global_config.model_save_file))
-
-            # first trims the generates sentences down to the length the decoder returns
-            # then trim any <eos> token
-            trimmed_generated_sequences = \
-                [[index for index in sequence
-                  if index != global_config.predefined_word_index[global_config.eos_token]]
-                 for sequence in [x[:(y - 1)] for (x, y) in zip(generated_sequences, final_sequence_lengths)]]
-
-            generated_word_lists = \
-                [data_processor.generate_words_from_indices(x, inverse_word_index)
-                 for x in trimmed_generated_sequences]
-
-            generated_sentences = [" ".join(x) for x in generated_word_lists]
             output_file_path = "output/{}-generation/generated_sentences_{}.txt".format(
                 global_config.experiment_timestamp, label_index)
             os.makedirs(os.path.dirname(output_file_path), exist_ok=True)
+
+            style_embedding = np.asarray(average_label_embeddings[int(label_index)])
             with open(output_file_path, 'w') as output_file:
-                for sentence in generated_sentences:
-                    output_file.write(sentence + "\n")
+                # each batch is written out as soon as it is decoded
+                for generated_sequences, final_sequence_lengths in network.generate_novel_sentences(
+                        sess, style_embedding, options.num_sentences_to_generate, num_labels,
+                        options.generation_batch_size):
+                    trimmed_generated_sequences = data_processor.trim_generated_sequences(
+                        generated_sequences, final_sequence_lengths)
+                    for sequence in trimmed_generated_sequences:
+                        output_file.write(" ".join(
+                            data_processor.generate_words_from_indices(sequence, inverse_word_index)) + "\n")
+                    output_file.flush()
 
             logger.info("Generated {} sentences of label {} at path {}".format(
                 options.num_sentences_to_generate, index_to_label_map[label_index], output_file_path
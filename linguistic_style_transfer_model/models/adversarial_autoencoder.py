@@ -1,20 +1,30 @@
+import concurrent.futures
 import json
 import logging
 import numpy as np
 import os
 import pickle
 import tensorflow as tf
+import threading
+import time
 
 from linguistic_style_transfer_model.config import global_config
 from linguistic_style_transfer_model.config.model_config import mconf
 from linguistic_style_transfer_model.evaluators import content_preservation, style_transfer
-from linguistic_style_transfer_model.utils import data_processor, custom_decoder
+from linguistic_style_transfer_model.utils import checkpoint_writer, cluster_helper, data_processor, \
+    custom_decoder, early_stopping, gradient_accumulator, lexicon_helper, step_metrics, step_profiler
 
 logger = logging.getLogger(global_config.logger_name)
 
 
 class AdversarialAutoencoder:
 
+    def __init__(self):
+        # replaced by each training or inference run, which reports its own steps
+        self.step_metrics = step_metrics.StepMetrics("unreported")
+        self.step_profiler = step_profiler.StepProfiler(None, global_config.profile_directory)
+        self.num_profiled_runs = 0
+
     def get_sentence_embedding(self, encoder_embedded_sequence):
 
         scope_name = "sentence_embedding"
@@ -79,15 +89,25 @@ class AdversarialAutoencoder:
 
         content_adversary_mlp = tf.nn.dropout(
             x=tf.layers.dense(
-                inputs=style_embedding, units=global_config.bow_size,
+                inputs=style_embedding,
+                units=mconf.content_adversary_hidden_size or global_config.bow_size,
                 activation=tf.nn.leaky_relu, name="content_adversary_mlp"),
             keep_prob=self.fully_connected_keep_prob)
 
-        content_adversary_prediction = tf.layers.dense(
-            inputs=content_adversary_mlp, units=global_config.bow_size,
-            activation=tf.nn.softmax, name="content_adversary_prediction")
-
-        return content_adversary_prediction
+        if mconf.bow_sampled_loss:
+            # the sampled loss needs a linear output layer, whose pre-activation logits it scores
+            content_adversary_layer = tf.layers.Dense(
+                units=global_config.bow_size, name="content_adversary_prediction")
+            content_adversary_logits = content_adversary_layer(content_adversary_mlp)
+            content_adversary_prediction = tf.nn.softmax(content_adversary_logits)
+        else:
+            content_adversary_layer = tf.layers.Dense(
+                units=global_config.bow_size, activation=tf.nn.softmax, name="content_adversary_prediction")
+            content_adversary_prediction = content_adversary_layer(content_adversary_mlp)
+            content_adversary_logits = content_adversary_prediction
+
+        return [content_adversary_prediction, content_adversary_logits, content_adversary_mlp,
+                content_adversary_layer]
 
     def get_style_adversary_prediction(self, content_embedding, num_labels):
 
@@ -106,8 +126,9 @@ class AdversarialAutoencoder:
     def generate_output_sequence(self, embedded_sequence, generative_embedding,
                                  decoder_embeddings, word_index, batch_size):
 
+        gru_cell = tf.contrib.rnn.GRUCell(num_units=mconf.decoder_rnn_size)
         decoder_cell = tf.nn.rnn_cell.DropoutWrapper(
-            cell=tf.contrib.rnn.GRUCell(num_units=mconf.decoder_rnn_size),
+            cell=gru_cell,
             input_keep_prob=self.recurrent_state_keep_prob,
             output_keep_prob=self.recurrent_state_keep_prob,
             state_keep_prob=self.recurrent_state_keep_prob)
@@ -125,56 +146,204 @@ class AdversarialAutoencoder:
             training_decoder = custom_decoder.CustomBasicDecoder(
                 cell=decoder_cell, helper=training_helper,
                 initial_state=init_state,
-                latent_vector=generative_embedding,
-                output_layer=projection_layer)
+                latent_vector=generative_embedding)
             training_decoder.initialize(training_decoder_scope_name)
 
             training_decoder_output, _, _ = tf.contrib.seq2seq.dynamic_decode(
                 decoder=training_decoder, impute_finished=True,
-                maximum_iterations=global_config.max_sequence_length,
+                maximum_iterations=mconf.max_sequence_length,
                 scope=training_decoder_scope_name)
 
+            # the vocabulary projection is applied to all time-steps at once, outside the decoding loop,
+            # so that a sampled reconstruction loss can skip it; the variable scope keeps its weights' names
+            with tf.variable_scope(training_decoder_scope_name):
+                training_output = projection_layer(training_decoder_output.rnn_output)
+
+        # the other decoders only run in inference and generation mode, without dropout, so they can
+        # project the latent vector through the GRU kernels once per sequence instead of at every step
+        if mconf.precompute_decoder_latent_projection:
+            decoder_cell = custom_decoder.LatentProjectionGRUCell(
+                cell=gru_cell, latent_size=int(generative_embedding.shape[-1]))
+            latent_vector = decoder_cell.project_latent_vector(generative_embedding)
+        else:
+            latent_vector = generative_embedding
+
         inference_decoder_scope_name = "inference_decoder"
         with tf.name_scope(inference_decoder_scope_name):
-            greedy_embedding_helper = tf.contrib.seq2seq.GreedyEmbeddingHelper(
-                embedding=decoder_embeddings,
-                start_tokens=tf.fill(dims=[batch_size],
-                                     value=word_index[global_config.sos_token]),
-                end_token=word_index[global_config.eos_token])
+            if global_config.sampling:
+                inference_helper = custom_decoder.FilteredSamplingEmbeddingHelper(
+                    embedding=decoder_embeddings,
+                    start_tokens=tf.fill(dims=[batch_size],
+                                         value=word_index[global_config.sos_token]),
+                    end_token=word_index[global_config.eos_token],
+                    temperature=global_config.sampling_temperature,
+                    top_k=global_config.sampling_top_k,
+                    top_p=global_config.sampling_top_p)
+            else:
+                inference_helper = tf.contrib.seq2seq.GreedyEmbeddingHelper(
+                    embedding=decoder_embeddings,
+                    start_tokens=tf.fill(dims=[batch_size],
+                                         value=word_index[global_config.sos_token]),
+                    end_token=word_index[global_config.eos_token])
 
             inference_decoder = custom_decoder.CustomBasicDecoder(
-                cell=decoder_cell, helper=greedy_embedding_helper,
+                cell=decoder_cell, helper=inference_helper,
                 initial_state=init_state,
-                latent_vector=generative_embedding,
-                output_layer=projection_layer)
+                latent_vector=latent_vector,
+                output_layer=projection_layer,
+                maximum_lengths=self.max_decode_lengths)
             inference_decoder.initialize(inference_decoder_scope_name)
 
             inference_decoder_output, _, final_sequence_lengths = \
                 tf.contrib.seq2seq.dynamic_decode(
                     decoder=inference_decoder, impute_finished=True,
-                    maximum_iterations=global_config.max_sequence_length,
+                    maximum_iterations=mconf.max_sequence_length,
                     scope=inference_decoder_scope_name)
+            inference_output = inference_decoder_output.sample_id
+
+        if global_config.beam_width > 1:
+            inference_output, final_sequence_lengths = self.generate_beam_search_sequence(
+                decoder_cell, projection_layer, latent_vector, decoder_embeddings,
+                word_index, batch_size)
+
+        if self.shortlist_ids is not None:
+            self.shortlist_inference_output, self.shortlist_final_sequence_lengths = \
+                self.generate_shortlist_sequence(
+                    decoder_cell, projection_layer, latent_vector, decoder_embeddings,
+                    word_index, batch_size)
+
+        return [training_output, training_decoder_output.rnn_output, projection_layer,
+                inference_output, final_sequence_lengths]
 
-        return [training_decoder_output.rnn_output, inference_decoder_output.sample_id, final_sequence_lengths]
+    def generate_beam_search_sequence(self, decoder_cell, projection_layer, latent_vector,
+                                      decoder_embeddings, word_index, batch_size):
+
+        beam_search_decoder_scope_name = "beam_search_decoder"
+        with tf.name_scope(beam_search_decoder_scope_name):
+            # all beams of the batch are decoded as one batch of size batch_size * beam_width,
+            # so the latent vector is tiled once here instead of being copied at every step
+            beam_decoder_cell = custom_decoder.LatentVectorConcatenationWrapper(
+                cell=decoder_cell,
+                latent_vector=tf.contrib.seq2seq.tile_batch(
+                    latent_vector, multiplier=global_config.beam_width))
+
+            beam_search_decoder = tf.contrib.seq2seq.BeamSearchDecoder(
+                cell=beam_decoder_cell, embedding=decoder_embeddings,
+                start_tokens=tf.fill(dims=[batch_size],
+                                     value=word_index[global_config.sos_token]),
+                end_token=word_index[global_config.eos_token],
+                initial_state=beam_decoder_cell.zero_state(
+                    batch_size=batch_size * global_config.beam_width, dtype=tf.float32),
+                beam_width=global_config.beam_width,
+                output_layer=projection_layer,
+                length_penalty_weight=global_config.length_penalty_weight)
+
+            beam_search_decoder_output, beam_search_decoder_state, _ = \
+                tf.contrib.seq2seq.dynamic_decode(
+                    decoder=beam_search_decoder, impute_finished=False,
+                    maximum_iterations=mconf.max_sequence_length,
+                    scope=beam_search_decoder_scope_name)
+
+        # beams are ranked best-first, and the state lengths follow the beam reordering
+        return [beam_search_decoder_output.predicted_ids[:, :, 0], beam_search_decoder_state.lengths[:, 0]]
+
+    def generate_shortlist_sequence(self, decoder_cell, projection_layer, latent_vector,
+                                    decoder_embeddings, word_index, batch_size):
+
+        shortlist_decoder_scope_name = "shortlist_decoder"
+        with tf.name_scope(shortlist_decoder_scope_name):
+            # tokens are decoded as positions in the shortlist; it starts with all the predefined tokens,
+            # so the positions of <sos> and <eos> equal their vocabulary ids
+            shortlist_helper = tf.contrib.seq2seq.GreedyEmbeddingHelper(
+                embedding=lambda positions: tf.nn.embedding_lookup(
+                    params=decoder_embeddings, ids=tf.gather(self.shortlist_ids, positions)),
+                start_tokens=tf.fill(dims=[batch_size],
+                                     value=word_index[global_config.sos_token]),
+                end_token=word_index[global_config.eos_token])
+
+            shortlist_decoder = custom_decoder.CustomBasicDecoder(
+                cell=decoder_cell, helper=shortlist_helper,
+                initial_state=decoder_cell.zero_state(batch_size=batch_size, dtype=tf.float32),
+                latent_vector=latent_vector,
+                output_layer=custom_decoder.ShortlistProjection(
+                    kernel=tf.gather(projection_layer.kernel, self.shortlist_ids, axis=1)),
+                maximum_lengths=self.max_decode_lengths)
+            shortlist_decoder.initialize(shortlist_decoder_scope_name)
+
+            shortlist_decoder_output, _, final_sequence_lengths = \
+                tf.contrib.seq2seq.dynamic_decode(
+                    decoder=shortlist_decoder, impute_finished=True,
+                    maximum_iterations=mconf.max_sequence_length,
+                    scope=shortlist_decoder_scope_name)
+
+        return [tf.gather(self.shortlist_ids, shortlist_decoder_output.sample_id), final_sequence_lengths]
+
+    def get_sampled_loss(self, loss_type, output_layer, labels, inputs, num_sampled, sampled_values=None):
+        """Per-example sampled softmax or NCE loss against the weights of a dense output layer.
+        Candidates are drawn log-uniformly, i.e. class indices are assumed to be in frequency order,
+        unless `sampled_values` fixes them. The layer must be linear, as its activation could not be applied
+        to the sampled logits, which would then differ from the logits of the full softmax loss.
+        """
+        if output_layer.activation is not None:
+            raise Exception("Sampled losses require a linear output layer: {}".format(output_layer.name))
+        if sampled_values is not None:
+            num_sampled = int(sampled_values[0].shape[0])
+        else:
+            num_sampled = min(num_sampled, output_layer.units - 1)
+
+        weights = tf.transpose(output_layer.kernel)
+        if output_layer.bias is not None:
+            biases = output_layer.bias
+        else:
+            biases = tf.zeros(shape=[output_layer.units])
+
+        if loss_type == "nce":
+            loss_function = tf.nn.nce_loss
+        elif loss_type == "sampled_softmax":
+            loss_function = tf.nn.sampled_softmax_loss
+        else:
+            raise Exception("Unknown sampled loss: {}".format(loss_type))
+
+        return loss_function(
+            weights=weights, biases=biases, labels=labels, inputs=inputs,
+            num_sampled=num_sampled, num_classes=output_layer.units,
+            num_true=int(labels.shape[1]), sampled_values=sampled_values)
+
+    def get_sampled_bow_loss(self, output_layer, inputs):
+        # the BoW distribution is approximated by words drawn from it
+        bow_labels = tf.multinomial(
+            logits=tf.log(self.input_bow_representations + mconf.epsilon),
+            num_samples=mconf.num_true_bow_words)
+        bow_losses = self.get_sampled_loss(
+            mconf.bow_sampled_loss, output_layer, bow_labels, inputs, mconf.num_sampled_bow_words)
+
+        # sentences without any BoW words carry no target
+        has_bow_words = tf.cast(tf.reduce_sum(self.input_bow_representations, axis=1) > 0, tf.float32)
+
+        return tf.losses.compute_weighted_loss(
+            losses=bow_losses, weights=has_bow_words * self.example_weights, reduction=tf.losses.Reduction.MEAN)
 
     def get_kl_loss(self, mu, log_sigma):
-        return tf.reduce_mean(
-            input_tensor=-0.5 * tf.reduce_sum(
+        return tf.losses.compute_weighted_loss(
+            losses=-0.5 * tf.reduce_sum(
                 input_tensor=1 + log_sigma - tf.square(mu) - tf.exp(log_sigma),
-                axis=1))
+                axis=1),
+            weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
 
     def sample_prior(self, mu, log_sigma):
         epsilon = tf.random_normal(tf.shape(log_sigma), name="epsilon")
         return mu + epsilon * tf.exp(log_sigma)
 
     def compute_batch_entropy(self, x):
-        return tf.reduce_mean(input_tensor=tf.reduce_sum(input_tensor=-x * tf.log(x + mconf.epsilon), axis=1))
+        return tf.losses.compute_weighted_loss(
+            losses=tf.reduce_sum(input_tensor=-x * tf.log(x + mconf.epsilon), axis=1),
+            weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
 
     def build_model(self, word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels):
 
         # model inputs
         self.input_sequence = tf.placeholder(
-            dtype=tf.int32, shape=[None, global_config.max_sequence_length],
+            dtype=tf.int32, shape=[None, mconf.max_sequence_length],
             name="input_sequence")
         logger.debug("input_sequence: {}".format(self.input_sequence))
 
@@ -189,6 +358,12 @@ class AdversarialAutoencoder:
             dtype=tf.int32, shape=[None], name="sequence_lengths")
         logger.debug("sequence_lengths: {}".format(self.sequence_lengths))
 
+        # the number of copies of every sentence in a deduplicated corpus,
+        # so that all batch losses are means over the original corpus
+        self.example_weights = tf.placeholder_with_default(
+            input=tf.ones(shape=[batch_size]), shape=[None], name="example_weights")
+        logger.debug("example_weights: {}".format(self.example_weights))
+
         self.input_bow_representations = tf.placeholder(
             dtype=tf.float32, shape=[None, global_config.bow_size],
             name="input_bow_representations")
@@ -200,6 +375,23 @@ class AdversarialAutoencoder:
         self.generation_mode = tf.placeholder(dtype=tf.bool, name="generation_mode")
         logger.debug("generation_mode: {}".format(self.generation_mode))
 
+        # per-row decode length caps, only fed when enabled
+        self.max_decode_lengths = tf.placeholder_with_default(
+            input=tf.fill(dims=[batch_size], value=mconf.max_sequence_length),
+            shape=[None], name="max_decode_lengths")
+        logger.debug("max_decode_lengths: {}".format(self.max_decode_lengths))
+
+        self.shortlist_ids = None
+        if global_config.shortlist_size:
+            # the shortlist always covers the predefined tokens and the style lexicon
+            self.shortlist_size = min(global_config.shortlist_size, global_config.vocab_size)
+            self.shortlist_required_ids = np.union1d(
+                list(global_config.predefined_word_index.values()),
+                [word_index[word] for word in lexicon_helper.get_sentiment_words() if word in word_index])
+            self.shortlist_ids = tf.placeholder(
+                dtype=tf.int32, shape=[self.shortlist_size], name="shortlist_ids")
+            logger.debug("shortlist_ids: {}".format(self.shortlist_ids))
+
         self.recurrent_state_keep_prob = tf.cond(
             pred=tf.math.logical_or(self.inference_mode, self.generation_mode),
             true_fn=lambda: 1.0,
@@ -220,8 +412,10 @@ class AdversarialAutoencoder:
             name="conditioning_embedding")
         logger.debug("conditioning_embedding: {}".format(self.conditioning_embedding))
 
-        self.sampled_content_embedding = tf.placeholder(
-            dtype=tf.float32, shape=[None, mconf.content_embedding_size],
+        # content vectors for novel text are drawn in the graph unless explicitly fed
+        self.sampled_content_embedding = tf.placeholder_with_default(
+            input=tf.random_normal(shape=[batch_size, mconf.content_embedding_size]),
+            shape=[None, mconf.content_embedding_size],
             name="sampled_content_embedding")
         logger.debug("sampled_content_embedding: {}".format(self.sampled_content_embedding))
 
@@ -238,6 +432,7 @@ class AdversarialAutoencoder:
             values=[tf.fill(dims=[batch_size, 1], value=word_index[global_config.sos_token]),
                     self.input_sequence], axis=1, name="decoder_input")
 
+        # in a cluster, this only sets the device type of the parameter server holding the embeddings
         with tf.device('/cpu:0'):
             with tf.variable_scope("embeddings", reuse=tf.AUTO_REUSE):
                 # word embeddings matrices
@@ -280,6 +475,7 @@ class AdversarialAutoencoder:
 
         # content embedding
         content_embedding_mu, content_embedding_sigma = self.get_content_embedding(sentence_embedding)
+        self.content_embedding_mu = content_embedding_mu
         unweighted_content_kl_loss = self.get_kl_loss(content_embedding_mu, content_embedding_sigma)
         self.content_kl_loss = unweighted_content_kl_loss * self.content_kl_weight
         sampled_content_embedding = self.sample_prior(content_embedding_mu, content_embedding_sigma)
@@ -304,7 +500,8 @@ class AdversarialAutoencoder:
 
         # sequence predictions
         with tf.name_scope('sequence_prediction'):
-            training_output, self.inference_output, self.final_sequence_lengths = \
+            training_output, training_decoder_states, projection_layer, \
+                self.inference_output, self.final_sequence_lengths = \
                 self.generate_output_sequence(
                     decoder_embedded_sequence, generative_embedding, decoder_embeddings,
                     word_index, batch_size)
@@ -325,19 +522,25 @@ class AdversarialAutoencoder:
 
             self.style_adversary_loss = tf.losses.softmax_cross_entropy(
                 onehot_labels=self.input_label, logits=style_adversary_prediction,
-                label_smoothing=0.1)
+                label_smoothing=0.1, weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
             logger.debug("style_adversary_loss: {}".format(self.style_adversary_loss))
 
             # content adversary
-            content_adversary_prediction = self.get_content_adversary_prediction(self.style_embedding)
+            content_adversary_prediction, content_adversary_logits, content_adversary_mlp, \
+                content_adversary_layer = self.get_content_adversary_prediction(self.style_embedding)
             logger.debug("content_adversary_prediction: {}".format(content_adversary_prediction))
 
+            # the entropy the autoencoder maximizes still needs the full BoW distribution
             self.content_adversary_entropy = self.compute_batch_entropy(content_adversary_prediction)
             logger.debug("content_adversary_entropy: {}".format(self.content_adversary_entropy))
 
-            self.content_adversary_loss = tf.losses.softmax_cross_entropy(
-                onehot_labels=self.input_bow_representations, logits=content_adversary_prediction,
-                label_smoothing=0.1)
+            if mconf.bow_sampled_loss:
+                self.content_adversary_loss = self.get_sampled_bow_loss(
+                    content_adversary_layer, content_adversary_mlp)
+            else:
+                self.content_adversary_loss = tf.losses.softmax_cross_entropy(
+                    onehot_labels=self.input_bow_representations, logits=content_adversary_logits,
+                    label_smoothing=0.1, weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
             logger.debug("content_adversary_loss: {}".format(self.content_adversary_loss))
 
         # multi-task objectives
@@ -354,20 +557,31 @@ class AdversarialAutoencoder:
                 logits=style_multitask_prediction, name="quantized_style_multitask_prediction")
 
             self.style_multitask_loss = tf.losses.softmax_cross_entropy(
-                onehot_labels=self.input_label, logits=style_multitask_prediction, label_smoothing=0.1)
+                onehot_labels=self.input_label, logits=style_multitask_prediction, label_smoothing=0.1,
+                weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
             logger.debug("style_multitask_loss: {}".format(self.style_multitask_loss))
 
             # bow multitask
-            content_multitask_prediction = tf.nn.dropout(
-                x=tf.layers.dense(
-                    inputs=content_embedding_mu, units=global_config.bow_size,
-                    activation=tf.nn.leaky_relu, name="content_multitask_prediction"),
-                keep_prob=self.fully_connected_keep_prob)
-            logger.debug("content_multitask_prediction: {}".format(content_multitask_prediction))
-
-            self.content_multitask_loss = tf.losses.softmax_cross_entropy(
-                onehot_labels=self.input_bow_representations, logits=content_multitask_prediction,
-                label_smoothing=0.1)
+            if mconf.bow_sampled_loss:
+                # a linear output layer without output dropout, whose pre-activation logits are sampled
+                content_multitask_layer = tf.layers.Dense(
+                    units=global_config.bow_size, name="content_multitask_prediction")
+                content_multitask_prediction = content_multitask_layer(content_embedding_mu)
+                logger.debug("content_multitask_prediction: {}".format(content_multitask_prediction))
+
+                self.content_multitask_loss = self.get_sampled_bow_loss(
+                    content_multitask_layer, content_embedding_mu)
+            else:
+                content_multitask_prediction = tf.nn.dropout(
+                    x=tf.layers.dense(
+                        inputs=content_embedding_mu, units=global_config.bow_size,
+                        activation=tf.nn.leaky_relu, name="content_multitask_prediction"),
+                    keep_prob=self.fully_connected_keep_prob)
+                logger.debug("content_multitask_prediction: {}".format(content_multitask_prediction))
+
+                self.content_multitask_loss = tf.losses.softmax_cross_entropy(
+                    onehot_labels=self.input_bow_representations, logits=content_multitask_prediction,
+                    label_smoothing=0.1, weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
             logger.debug("content_multitask_loss: {}".format(self.content_multitask_loss))
 
         # overall latent space classifier
@@ -385,7 +599,8 @@ class AdversarialAutoencoder:
             logits=style_overall_prediction, name="quantized_style_overall_prediction")
 
         self.style_overall_prediction_loss = tf.losses.softmax_cross_entropy(
-            onehot_labels=self.input_label, logits=style_overall_prediction, label_smoothing=0.1)
+            onehot_labels=self.input_label, logits=style_overall_prediction, label_smoothing=0.1,
+            weights=self.example_weights, reduction=tf.losses.Reduction.MEAN)
         logger.debug("style_overall_prediction_loss: {}".format(self.style_overall_prediction_loss))
 
         # reconstruction loss
@@ -406,10 +621,23 @@ class AdversarialAutoencoder:
                 lengths=tf.add(x=self.sequence_lengths, y=1),
                 maxlen=batch_maxlen,
                 dtype=tf.float32)
-
-            self.reconstruction_loss = tf.contrib.seq2seq.sequence_loss(
-                logits=training_output, targets=target_sequence,
-                weights=output_sequence_mask)
+            output_step_weights = output_sequence_mask * tf.expand_dims(self.example_weights, axis=1)
+
+            if mconf.reconstruction_sampled_loss:
+                # only the unpadded time-steps are scored
+                unpadded_steps = tf.cast(output_sequence_mask, tf.bool)
+                self.reconstruction_loss = tf.losses.compute_weighted_loss(
+                    losses=self.get_sampled_loss(
+                        mconf.reconstruction_sampled_loss, projection_layer,
+                        labels=tf.expand_dims(tf.boolean_mask(target_sequence, unpadded_steps), axis=1),
+                        inputs=tf.boolean_mask(training_decoder_states, unpadded_steps),
+                        num_sampled=mconf.num_sampled_words),
+                    weights=tf.boolean_mask(output_step_weights, unpadded_steps),
+                    reduction=tf.losses.Reduction.MEAN)
+            else:
+                self.reconstruction_loss = tf.contrib.seq2seq.sequence_loss(
+                    logits=training_output, targets=target_sequence,
+                    weights=output_step_weights)
             logger.debug("reconstruction_loss: {}".format(self.reconstruction_loss))
 
         # tensorboard logging variable summaries
@@ -433,22 +661,19 @@ class AdversarialAutoencoder:
     def run_batch(self, sess, start_index, end_index, fetches, padded_sequences,
                   one_hot_labels, text_sequence_lengths,
                   conditioning_embedding, inference_mode, generation_mode,
-                  style_kl_weight, content_kl_weight, current_epoch):
+                  style_kl_weight, content_kl_weight, current_epoch, shortlist_ids=None, example_weights=None,
+                  feed_overrides=None):
 
-        if not inference_mode and not generation_mode:
-            conditioning_embedding = np.random.uniform(
-                size=(end_index - start_index, mconf.style_embedding_size),
-                low=-0.05, high=0.05).astype(dtype=np.float32)
+        with self.step_metrics.time_phase("batch_preparation"):
+            if not inference_mode and not generation_mode:
+                conditioning_embedding = np.random.uniform(
+                    size=(end_index - start_index, mconf.style_embedding_size),
+                    low=-0.05, high=0.05).astype(dtype=np.float32)
 
-        sampled_content_embedding = np.random.normal(
-            size=(end_index - start_index, mconf.content_embedding_size)).astype(dtype=np.float32)
+            bow_representations = data_processor.get_bow_representations(
+                padded_sequences[start_index: end_index])
 
-        bow_representations = data_processor.get_bow_representations(
-            padded_sequences[start_index: end_index])
-
-        ops = sess.run(
-            fetches=fetches,
-            feed_dict={
+            feed_dict = {
                 self.input_sequence: padded_sequences[start_index: end_index],
                 self.input_label: one_hot_labels[start_index: end_index],
                 self.sequence_lengths: text_sequence_lengths[start_index: end_index],
@@ -456,11 +681,23 @@ class AdversarialAutoencoder:
                 self.inference_mode: inference_mode,
                 self.generation_mode: generation_mode,
                 self.conditioning_embedding: conditioning_embedding,
-                self.sampled_content_embedding: sampled_content_embedding,
                 self.style_kl_weight: style_kl_weight,
                 self.content_kl_weight: content_kl_weight,
                 self.epoch: current_epoch
-            })
+            }
+            if shortlist_ids is not None:
+                feed_dict[self.shortlist_ids] = shortlist_ids
+            if example_weights is not None:
+                feed_dict[self.example_weights] = example_weights[start_index: end_index]
+            if inference_mode and global_config.max_decode_length_ratio:
+                feed_dict[self.max_decode_lengths] = data_processor.get_decode_length_caps(
+                    text_sequence_lengths[start_index: end_index])
+            # fed intermediate tensors, e.g. cached encoder outputs, cut off the graph above them
+            if feed_overrides:
+                feed_dict.update(feed_overrides)
+
+        with self.step_metrics.time_phase("session_run"):
+            ops = self.step_profiler.run(sess, fetches, feed_dict)
 
         return ops
 
@@ -470,12 +707,7 @@ class AdversarialAutoencoder:
             (mconf.kl_anneal_iterations / 3))
                 + 1) * lambda_weight
 
-    def train(self, sess, data_size, padded_sequences, text_sequence_lengths, one_hot_labels, num_labels,
-              word_index, encoder_embedding_matrix, decoder_embedding_matrix, validation_sequences,
-              validation_sequence_lengths, validation_labels, inverse_word_index, validation_actual_word_lists,
-              options):
-
-        writer = tf.summary.FileWriter(logdir=global_config.log_directory, graph=sess.graph)
+    def build_training_operations(self):
 
         trainable_variables = tf.trainable_variables()
         logger.debug("trainable_variables: {}".format(trainable_variables))
@@ -491,6 +723,15 @@ class AdversarialAutoencoder:
         tf.summary.scalar(tensor=self.composite_loss, name="composite_loss_summary")
         self.all_summaries = tf.summary.merge_all()
 
+        # fetched as a single tensor on every training step
+        self.training_losses = tf.stack(
+            values=[self.reconstruction_loss,
+                    self.style_multitask_loss, self.content_multitask_loss,
+                    self.style_adversary_loss, self.style_adversary_entropy,
+                    self.content_adversary_loss, self.content_adversary_entropy,
+                    self.style_kl_loss, self.content_kl_loss,
+                    self.composite_loss], name="training_losses")
+
         # optimize adversarial classification
         style_adversary_variable_labels = ["style_adversary"]
         content_adversary_variable_labels = ["content_adversary"]
@@ -502,9 +743,6 @@ class AdversarialAutoencoder:
                 scope in x.name for scope in style_adversary_variable_labels)]
         logger.debug("style_adversary_training_optimizer.variables: {}".format(
             style_adversary_training_variables))
-        style_adversary_training_operation = style_adversary_training_optimizer.minimize(
-            loss=self.style_adversary_loss,
-            var_list=style_adversary_training_variables)
         # content
         content_adversary_training_optimizer = tf.train.RMSPropOptimizer(
             learning_rate=mconf.content_adversary_learning_rate)
@@ -513,9 +751,6 @@ class AdversarialAutoencoder:
                 scope in x.name for scope in content_adversary_variable_labels)]
         logger.debug("content_adversary_training_optimizer.variables: {}".format(
             content_adversary_training_variables))
-        content_adversary_training_operation = content_adversary_training_optimizer.minimize(
-            loss=self.content_adversary_loss,
-            var_list=content_adversary_training_variables)
 
         # optimize overall latent space classification
         style_overall_variable_labels = ["style_overall"]
@@ -524,9 +759,6 @@ class AdversarialAutoencoder:
         style_overall_training_variables = [
             x for x in trainable_variables if any(scope in x.name for scope in style_overall_variable_labels)]
         logger.debug("style_overall_training_variables: {}".format(style_overall_training_variables))
-        style_overall_training_operation = style_overall_optimizer.minimize(
-            loss=self.style_overall_prediction_loss,
-            var_list=style_overall_training_variables)
 
         # optimize reconstruction
         reconstruction_training_optimizer = tf.train.AdamOptimizer(
@@ -538,11 +770,75 @@ class AdversarialAutoencoder:
                  content_adversary_variable_labels +
                  style_overall_variable_labels))]
         logger.debug("reconstruction_training_optimizer.variables: {}".format(reconstruction_training_variables))
-        reconstruction_training_operation = reconstruction_training_optimizer.minimize(
-            loss=self.composite_loss, var_list=reconstruction_training_variables)
 
-        sess.run(tf.global_variables_initializer())
-        saver = tf.train.Saver()
+        training_objectives = [
+            ("reconstruction", reconstruction_training_optimizer,
+             self.composite_loss, reconstruction_training_variables),
+            ("style_adversary", style_adversary_training_optimizer,
+             self.style_adversary_loss, style_adversary_training_variables),
+            ("content_adversary", content_adversary_training_optimizer,
+             self.content_adversary_loss, content_adversary_training_variables),
+            ("style_overall", style_overall_optimizer,
+             self.style_overall_prediction_loss, style_overall_training_variables),
+        ]
+
+        # counts updates of the reconstruction objective, shared by all replicas of a cluster
+        self.global_step = tf.train.get_or_create_global_step()
+
+        self.apply_operations = list()
+        self.sync_replicas_optimizer = None
+        self.adversary_training_operation = None
+        if global_config.training_workers > 1 or mconf.gradient_accumulation_steps > 1:
+            # each worker thread accumulates the gradients of its shard of every micro-batch,
+            # and the averaged gradients of each objective are then applied once per update
+            with tf.device(cluster_helper.get_local_device()):
+                gradient_accumulators = [
+                    gradient_accumulator.GradientAccumulator(
+                        optimizer, loss, variables, name + "_accumulator",
+                        self.global_step if name == "reconstruction" else None)
+                    for (name, optimizer, loss, variables) in training_objectives]
+            training_operations = [x.accumulate_operation for x in gradient_accumulators]
+            self.apply_operations = [x.apply_operation for x in gradient_accumulators]
+        elif global_config.sync_replicas:
+            # the gradients of every objective are aggregated over all replicas and applied together
+            all_grads_and_vars = list()
+            for (_, optimizer, loss, variables) in training_objectives:
+                all_grads_and_vars.extend(
+                    (gradient, variable) for (gradient, variable)
+                    in optimizer.compute_gradients(loss=loss, var_list=variables) if gradient is not None)
+            num_replicas = cluster_helper.get_num_replicas()
+            self.sync_replicas_optimizer = tf.train.SyncReplicasOptimizer(
+                cluster_helper.ObjectiveRoutingOptimizer(
+                    [(optimizer, variables) for (_, optimizer, _, variables) in training_objectives]),
+                replicas_to_aggregate=num_replicas, total_num_replicas=num_replicas)
+            training_operations = [self.sync_replicas_optimizer.apply_gradients(
+                all_grads_and_vars, global_step=self.global_step)]
+        else:
+            training_operations = [
+                optimizer.minimize(
+                    loss=loss, var_list=variables,
+                    global_step=self.global_step if name == "reconstruction" else None)
+                for (name, optimizer, loss, variables) in training_objectives]
+
+            # the adversaries can be updated on a schedule of their own, by separate session runs
+            if mconf.adversary_update_interval > 1 or mconf.adversary_steps_per_autoencoder_step > 1:
+                adversary_objectives = ["style_adversary", "content_adversary"]
+                self.adversary_training_operation = tf.group(*[
+                    operation for (operation, (name, _, _, _)) in zip(training_operations, training_objectives)
+                    if name in adversary_objectives])
+                training_operations = [
+                    operation for (operation, (name, _, _, _)) in zip(training_operations, training_objectives)
+                    if name not in adversary_objectives]
+        self.training_operation = tf.group(*training_operations)
+
+    def train(self, sess, data_size, padded_sequences, text_sequence_lengths, one_hot_labels, example_weights,
+              num_labels, word_index, encoder_embedding_matrix, decoder_embedding_matrix, validation_sequences,
+              validation_sequence_lengths, validation_labels, inverse_word_index, validation_actual_word_lists,
+              options):
+
+        # only the chief writes summaries, checkpoints and validation results
+        is_chief = cluster_helper.is_chief()
+        self.start_training(sess, options, is_chief)
 
         num_batches = data_size // mconf.batch_size
         if data_size % mconf.batch_size:
@@ -550,105 +846,444 @@ class AdversarialAutoencoder:
         logger.debug("Training - texts shape: {}; labels shape {}"
                      .format(padded_sequences.shape, one_hot_labels.shape))
 
-        iteration = 0
-        style_kl_weight, content_kl_weight = 0, 0
-        for current_epoch in range(1, options.training_epochs + 1):
+        # the replicas of a cluster take turns over the batches of a shared shuffle,
+        # and all of them run the same number of steps per epoch
+        num_replicas = cluster_helper.get_num_replicas()
+        replica_index = cluster_helper.get_replica_index()
+        num_replica_batches = -(-num_batches // num_replicas)
+        logger.info("Effective batch size: {}".format(
+            mconf.batch_size * mconf.gradient_accumulation_steps * num_replicas))
+
+        [iteration, first_epoch, first_replica_batch_number, resumed_rng_state] = self.get_training_start(
+            sess, options, num_replica_batches)
+        num_updates = 0
+        interval_losses = list()
+        average_label_embeddings = dict()
+        for current_epoch in range(first_epoch, options.training_epochs + 1):
 
             all_style_embeddings = list()
             all_content_embeddings = list()
+            all_one_hot_labels = list()
+            all_example_weights = list()
 
-            shuffle_indices = np.random.permutation(np.arange(data_size))
-
+            [shuffle_indices, epoch_rng_state] = self.get_epoch_shuffle(current_epoch, data_size, resumed_rng_state)
+            resumed_rng_state = None
             shuffled_padded_sequences = padded_sequences[shuffle_indices]
             shuffled_one_hot_labels = one_hot_labels[shuffle_indices]
             shuffled_text_sequence_lengths = text_sequence_lengths[shuffle_indices]
+            shuffled_example_weights = example_weights[shuffle_indices]
 
-            for batch_number in range(num_batches):
+            for replica_batch_number in range(first_replica_batch_number, num_replica_batches):
+                batch_number = (replica_index + replica_batch_number * num_replicas) % num_batches
                 (start_index, end_index) = self.get_batch_indices(
                     batch_number=batch_number, data_limit=data_size)
-
-                if iteration < mconf.kl_anneal_iterations:
-                    style_kl_weight = self.get_annealed_weight(iteration, mconf.style_kl_lambda)
-                    content_kl_weight = self.get_annealed_weight(iteration, mconf.content_kl_lambda)
-
-                fetches = \
-                    [reconstruction_training_operation,
-                     style_adversary_training_operation,
-                     content_adversary_training_operation,
-                     style_overall_training_operation,
-                     self.reconstruction_loss,
-                     self.style_multitask_loss,
-                     self.content_multitask_loss,
-                     self.style_adversary_loss,
-                     self.style_adversary_entropy,
-                     self.content_adversary_loss,
-                     self.content_adversary_entropy,
-                     self.style_kl_loss,
-                     self.content_kl_loss,
-                     self.composite_loss,
-                     self.style_embedding,
-                     self.content_embedding,
-                     self.all_summaries]
-
-                [_, _, _, _,
-                 reconstruction_loss,
-                 style_multitask_loss, content_multitask_loss,
-                 style_adversary_crossentropy, style_adversary_entropy,
-                 content_adversary_crossentropy, content_adversary_entropy,
-                 style_kl_loss, content_kl_loss,
-                 composite_loss,
-                 style_embeddings, content_embedding,
-                 all_summaries] = \
-                    self.run_batch(
-                        sess, start_index, end_index, fetches,
-                        shuffled_padded_sequences, shuffled_one_hot_labels,
-                        shuffled_text_sequence_lengths, None, False, False,
-                        style_kl_weight, content_kl_weight, current_epoch)
-
-                log_msg = "[R: {:.2f}, " \
-                          "SMT: {:.2f}, CMT: {:.2f}, " \
-                          "SCE: {:.2f}, SE: {:.2f}, " \
-                          "CCE: {:.2f}, CE: {:.2f}, " \
-                          "SKL: {:.2f}, CKL: {:.2f}] " \
-                          "Epoch {}-{}: {:.4f}"
-                logger.info(log_msg.format(
-                    reconstruction_loss,
-                    style_multitask_loss, content_multitask_loss,
-                    style_adversary_crossentropy, style_adversary_entropy,
-                    content_adversary_crossentropy, content_adversary_entropy,
-                    style_kl_loss, content_kl_loss,
-                    current_epoch, batch_number, composite_loss))
-
-                all_style_embeddings.extend(style_embeddings)
-                all_content_embeddings.extend(content_embedding)
-
-                iteration += 1
-
-                writer.add_summary(all_summaries, iteration)
-                writer.flush()
-
-            saver.save(sess=sess, save_path=global_config.model_save_path)
-
-            np.save(file=global_config.all_style_embeddings_path, arr=np.asarray(all_style_embeddings))
+                [is_update_step, is_logging_step, is_adversary_step] = self.get_step_schedule(
+                    replica_batch_number, num_replica_batches, num_updates, iteration)
+
+                [shard_results, batch_losses] = self.run_training_step(
+                    sess, start_index, end_index, shuffled_padded_sequences, shuffled_one_hot_labels,
+                    shuffled_text_sequence_lengths, shuffled_example_weights, iteration, current_epoch,
+                    self.get_training_fetches(is_chief, options.dump_embeddings, is_logging_step),
+                    is_update_step, is_adversary_step)
+                interval_losses.append(batch_losses)
+                if is_chief:
+                    all_style_embeddings.extend(np.concatenate([x["style_embedding"] for x in shard_results]))
+                    if options.dump_embeddings:
+                        all_content_embeddings.extend(
+                            np.concatenate([x["content_embedding"] for x in shard_results]))
+                    all_one_hot_labels.extend(shuffled_one_hot_labels[start_index: end_index])
+                    all_example_weights.extend(shuffled_example_weights[start_index: end_index])
+
+                # KL annealing counts updates rather than micro-batches
+                if is_update_step:
+                    num_updates += 1
+                    if cluster_helper.is_distributed():
+                        iteration = sess.run(self.global_step)
+                    else:
+                        iteration += 1
+
+                if is_logging_step:
+                    with self.step_metrics.time_phase("logging"):
+                        self.log_training_losses(np.mean(interval_losses, axis=0), current_epoch, batch_number)
+                        interval_losses = list()
+
+                        # the writer serializes events on its own thread and flushes them periodically
+                        if self.summary_writer is not None:
+                            self.summary_writer.add_summary(shard_results[0]["summaries"], iteration)
+
+                if is_update_step and self.is_checkpoint_due(num_updates):
+                    with self.step_metrics.time_phase("checkpoint"):
+                        partial_average_label_embeddings = data_processor.get_partial_average_label_embeddings(
+                            all_style_embeddings, all_one_hot_labels, all_example_weights, average_label_embeddings)
+                        self.save_checkpoint(
+                            sess, iteration, word_index, partial_average_label_embeddings, self.get_training_state(
+                                current_epoch, replica_batch_number + 1, iteration, epoch_rng_state))
+
+                self.step_metrics.end_step(
+                    iteration, end_index - start_index,
+                    np.sum(shuffled_text_sequence_lengths[start_index: end_index]), is_logging_step)
+
+                if self.termination_event.is_set():
+                    break
+
+            first_replica_batch_number = 0
+            if not is_chief:
+                continue
+
+            if self.termination_event.is_set():
+                logger.info("Saving a final checkpoint before terminating ...")
+                self.save_checkpoint(
+                    sess, iteration, word_index, data_processor.get_partial_average_label_embeddings(
+                        all_style_embeddings, all_one_hot_labels, all_example_weights, average_label_embeddings),
+                    self.get_training_state(current_epoch, replica_batch_number + 1, iteration, epoch_rng_state),
+                    wait=True)
+                break
+
+            average_label_embeddings = self.save_epoch_embeddings(
+                all_style_embeddings, all_content_embeddings, all_one_hot_labels, all_example_weights,
+                options.dump_embeddings, current_epoch)
+
+            # validation comes first, so that the checkpoint of the epoch records its early stopping state
+            [validation_record, is_best_validation] = self.run_scheduled_validation(
+                sess, options, current_epoch, num_labels, validation_sequences, validation_sequence_lengths,
+                validation_labels, validation_actual_word_lists, average_label_embeddings, inverse_word_index)
+
+            self.save_checkpoint(sess, iteration, word_index, average_label_embeddings, self.get_training_state(
+                current_epoch, num_replica_batches, iteration, epoch_rng_state))
+
+            if is_best_validation:
+                logger.info("New best validation score: {:.4f}".format(validation_record["composite"]))
+                self.best_checkpointer.save(sess, iteration, self.get_best_checkpoint_artifacts(
+                    word_index, average_label_embeddings, validation_record))
+
+            if self.early_stopping.should_stop():
+                logger.info("Stopping early after {} validations without an improvement".format(
+                    self.early_stopping.validations_without_improvement))
+                break
+
+        self.finish_training()
+
+    def start_training(self, sess, options, is_chief):
+        """
+        Sets up what a training run reports to and checkpoints with, and initializes the session,
+        restoring all variables of the run to resume from if there is one.
+        """
+        self.summary_writer = None
+        if is_chief:
+            self.summary_writer = tf.summary.FileWriter(
+                logdir=global_config.log_directory, graph=sess.graph,
+                flush_secs=global_config.summary_flush_seconds)
+
+        self.step_metrics = step_metrics.StepMetrics(
+            "training", global_config.training_metrics_path if is_chief else None, self.summary_writer)
+        self.start_profiling("training")
+
+        self.worker_pool = None
+        if global_config.training_workers > 1:
+            self.worker_pool = concurrent.futures.ThreadPoolExecutor(max_workers=global_config.training_workers)
+
+        # a cluster session is initialized by the chief when it is created
+        if not cluster_helper.is_distributed():
+            sess.run(tf.global_variables_initializer())
+            sess.run(tf.local_variables_initializer())
+            if options.resume_from:
+                # the optimizer slots and the global step are restored along with the model
+                [checkpoint_path, _] = checkpoint_writer.get_resumable_checkpoint(options.resume_from)
+                tf.train.Saver().restore(sess=sess, save_path=checkpoint_path)
+
+        # checkpoints are written in the background, and SIGTERM stops training with a final one
+        self.checkpointer = None
+        self.best_checkpointer = None
+        self.termination_event = threading.Event()
+        if is_chief:
+            self.checkpointer = checkpoint_writer.CheckpointWriter(
+                tf.global_variables(), global_config.model_save_path, global_config.max_checkpoints_to_keep)
+            self.best_checkpointer = checkpoint_writer.CheckpointWriter(
+                tf.global_variables(), global_config.best_model_save_path, 1)
+            self.termination_event = checkpoint_writer.get_termination_event()
+        self.last_checkpoint_time = time.time()
+        self.early_stopping = early_stopping.EarlyStopping(
+            global_config.early_stopping_patience, global_config.early_stopping_min_delta)
+
+    def finish_training(self):
+        self.step_metrics.log_summary()
+        self.step_metrics.close()
+        self.step_profiler.close()
+        if self.checkpointer is not None:
+            self.checkpointer.close()
+            self.best_checkpointer.close()
+        if self.worker_pool is not None:
+            self.worker_pool.shutdown()
+        if self.summary_writer is not None:
+            self.summary_writer.close()
+
+    def get_training_start(self, sess, options, num_replica_batches):
+        """Returns the global step, the epoch and replica batch to start training at, and the RNG state to resume"""
+        iteration = sess.run(self.global_step)
+        if not options.resume_from:
+            return [iteration, 1, 0, None]
+
+        [first_epoch, first_replica_batch_number, resumed_rng_state] = self.get_resume_position(
+            options.resume_from, num_replica_batches, iteration)
+        if self.early_stopping.should_stop():
+            logger.info("Training has already stopped early")
+            first_epoch = options.training_epochs + 1
+
+        return [iteration, first_epoch, first_replica_batch_number, resumed_rng_state]
+
+    def get_epoch_shuffle(self, current_epoch, data_size, resumed_rng_state):
+        """
+        Returns the shuffle of an epoch along with the RNG state before it was drawn.
+        The replicas of a cluster share a shuffle seeded by the epoch.
+        """
+        epoch_rng_state = np.random.get_state()
+        if cluster_helper.is_distributed():
+            shuffle_indices = np.random.RandomState(current_epoch).permutation(np.arange(data_size))
+        else:
+            shuffle_indices = np.random.permutation(np.arange(data_size))
+        if resumed_rng_state is not None:
+            np.random.set_state(resumed_rng_state)
+
+        return [shuffle_indices, epoch_rng_state]
+
+    def get_kl_weights(self, iteration):
+        """The KL weights are annealed over `kl_anneal_iterations` updates, and keep their final values after that"""
+        if mconf.kl_anneal_iterations <= 0:
+            return 0, 0
+
+        iteration = min(iteration, mconf.kl_anneal_iterations - 1)
+        return (self.get_annealed_weight(iteration, mconf.style_kl_lambda),
+                self.get_annealed_weight(iteration, mconf.content_kl_lambda))
+
+    def get_step_schedule(self, replica_batch_number, num_replica_batches, num_updates, iteration):
+        """Returns whether a training step applies the accumulated gradients, logs, and updates the adversaries"""
+        # accumulated gradients are applied every few micro-batches and at the end of every epoch
+        is_update_step = not (replica_batch_number + 1) % mconf.gradient_accumulation_steps or \
+            replica_batch_number + 1 == num_replica_batches
+        is_logging_step = is_update_step and not (num_updates + 1) % global_config.logging_interval
+        is_adversary_step = self.adversary_training_operation is not None and \
+            not iteration % mconf.adversary_update_interval
+
+        return [is_update_step, is_logging_step, is_adversary_step]
+
+    def get_training_fetches(self, is_chief, dump_embeddings, is_logging_step):
+        fetches = {"training_operation": self.training_operation, "losses": self.training_losses}
+        # embeddings are only fetched for the per-epoch artifacts the chief writes
+        if is_chief:
+            fetches["style_embedding"] = self.style_embedding
+            if dump_embeddings:
+                fetches["content_embedding"] = self.content_embedding
+            if is_logging_step:
+                fetches["summaries"] = self.all_summaries
+        # the adversaries train on the encoder outputs of the autoencoder run
+        if self.adversary_training_operation is not None:
+            fetches["style_embedding"] = self.style_embedding
+            fetches["content_embedding_mu"] = self.content_embedding_mu
+
+        return fetches
+
+    def run_training_step(self, sess, start_index, end_index, padded_sequences, one_hot_labels,
+                          text_sequence_lengths, example_weights, iteration, current_epoch, fetches,
+                          is_update_step, is_adversary_step):
+        """
+        Runs the autoencoder on a batch, then the updates due at this step.
+        Returns the fetched values of each shard and the losses of the batch.
+        """
+        self.step_metrics.start_step()
+        self.step_profiler.start_step()
+        style_kl_weight, content_kl_weight = self.get_kl_weights(iteration)
+
+        [shard_results, shard_sizes] = self.run_training_batch(
+            sess, self.worker_pool, start_index, end_index, fetches, padded_sequences, one_hot_labels,
+            text_sequence_lengths, example_weights, style_kl_weight, content_kl_weight, current_epoch)
+        if self.apply_operations and is_update_step:
+            with self.step_metrics.time_phase("session_run"):
+                self.step_profiler.run(sess, self.apply_operations, None)
+        if is_adversary_step:
+            self.run_adversary_updates(
+                sess, start_index, end_index, shard_results[0], padded_sequences, one_hot_labels,
+                text_sequence_lengths, example_weights, style_kl_weight, content_kl_weight, current_epoch)
+        self.step_profiler.end_step()
+
+        # losses are averaged over the shards, weighted by the number of examples they stand for
+        return [shard_results, np.average([x["losses"] for x in shard_results], axis=0, weights=shard_sizes)]
+
+    def is_checkpoint_due(self, num_updates):
+        if self.checkpointer is None:
+            return False
+
+        return bool((global_config.checkpoint_interval_steps and
+                     not num_updates % global_config.checkpoint_interval_steps) or
+                    (global_config.checkpoint_interval_seconds and
+                     time.time() - self.last_checkpoint_time >= global_config.checkpoint_interval_seconds))
+
+    def save_checkpoint(self, sess, iteration, word_index, average_label_embeddings, training_state, wait=False):
+        self.checkpointer.save(
+            sess, iteration, self.get_checkpoint_artifacts(word_index, average_label_embeddings),
+            {global_config.training_state_file: training_state}, wait=wait)
+        self.last_checkpoint_time = time.time()
+
+    def save_epoch_embeddings(self, all_style_embeddings, all_content_embeddings, all_one_hot_labels,
+                              all_example_weights, dump_embeddings, current_epoch):
+        """Saves the embeddings of an epoch and returns the weighted average style embedding of each label"""
+        # in a cluster, the label embeddings are averaged over the batches of the chief
+        np.save(file=global_config.all_style_embeddings_path, arr=np.asarray(all_style_embeddings))
+        if dump_embeddings:
             np.save(file=global_config.all_content_embeddings_path, arr=all_content_embeddings)
-            with open(global_config.all_shuffled_labels_path, 'wb') as pickle_file:
-                pickle.dump(shuffled_one_hot_labels, pickle_file)
-
-            average_label_embeddings = data_processor.get_average_label_embeddings(
-                data_size, options.dump_embeddings, current_epoch)
-            with open(global_config.average_label_embeddings_path, 'wb') as pickle_file:
-                pickle.dump(average_label_embeddings, pickle_file)
-
-            if not current_epoch % global_config.validation_interval:
-                self.run_validation(options, num_labels, validation_sequences, validation_sequence_lengths,
-                                    validation_labels, validation_actual_word_lists, all_style_embeddings,
-                                    shuffled_one_hot_labels, inverse_word_index, current_epoch, sess)
-
-        writer.close()
+        with open(global_config.all_shuffled_labels_path, 'wb') as pickle_file:
+            pickle.dump(np.asarray(all_one_hot_labels), pickle_file)
+
+        return data_processor.get_average_label_embeddings(
+            len(all_one_hot_labels), dump_embeddings, current_epoch, all_example_weights)
+
+    def run_scheduled_validation(self, sess, options, current_epoch, num_labels, validation_sequences,
+                                 validation_sequence_lengths, validation_labels, validation_actual_word_lists,
+                                 average_label_embeddings, inverse_word_index):
+        """
+        Validates every `validation_interval` epochs and updates the early stopping state with the composite score.
+        Returns the validation record, if any, and whether it is the best so far.
+        """
+        if current_epoch % global_config.validation_interval:
+            return [None, False]
+
+        validation_record = self.run_validation(
+            options, num_labels, validation_sequences, validation_sequence_lengths,
+            validation_labels, validation_actual_word_lists, average_label_embeddings,
+            inverse_word_index, current_epoch, sess)
+
+        return [validation_record, self.early_stopping.update(validation_record["composite"])]
+
+    def get_checkpoint_artifacts(self, word_index, average_label_embeddings):
+        """Maps the names of the files inference and resumed training need besides the variables to their contents"""
+        checkpoint_artifacts = {
+            global_config.vocab_save_file: word_index,
+            global_config.index_to_label_dict_file: dict(data_processor.index_to_label_map),
+            global_config.label_to_index_dict_file: dict(data_processor.label_to_index_map),
+        }
+        if average_label_embeddings:
+            checkpoint_artifacts[global_config.average_label_embeddings_file] = average_label_embeddings
+
+        return checkpoint_artifacts
+
+    def get_best_checkpoint_artifacts(self, word_index, average_label_embeddings, validation_record):
+        """The best checkpoint also gets the model config and subwords, so that its folder is a saved model"""
+        best_checkpoint_artifacts = self.get_checkpoint_artifacts(word_index, average_label_embeddings)
+        best_checkpoint_artifacts[global_config.model_config_file] = mconf.__dict__
+        best_checkpoint_artifacts[global_config.best_validation_scores_file] = validation_record
+        if global_config.bpe_merges_file_path:
+            with open(global_config.bpe_merges_file_path) as bpe_merges_file:
+                best_checkpoint_artifacts[global_config.bpe_merges_file] = bpe_merges_file.read()
+
+        return best_checkpoint_artifacts
+
+    def get_training_state(self, current_epoch, epoch_batches, iteration, epoch_rng_state):
+        """
+        Records how far training got, with the RNG state before the current epoch was shuffled,
+        so that a resumed run shuffles an interrupted epoch the same way, and the current RNG state to continue with.
+        """
+        return {
+            "epoch": current_epoch,
+            "epoch_batches": epoch_batches,
+            "global_step": int(iteration),
+            "epoch_rng_state": epoch_rng_state,
+            "rng_state": np.random.get_state(),
+            "early_stopping": self.early_stopping.get_state(),
+        }
+
+    def get_resume_position(self, saved_model_path, num_replica_batches, iteration):
+        """
+        Returns the epoch and replica batch to resume training from, along with the RNG state to restore
+        once an interrupted epoch has been shuffled again. The early stopping state is restored as well.
+        """
+        [_, training_state] = checkpoint_writer.get_resumable_checkpoint(saved_model_path)
+        # resuming the position of another step would replay or skip batches
+        if training_state["global_step"] != iteration:
+            raise Exception("The training state of step {} does not match the restored checkpoint of step {}".format(
+                training_state["global_step"], iteration))
+        self.early_stopping = early_stopping.EarlyStopping(
+            global_config.early_stopping_patience, global_config.early_stopping_min_delta,
+            **training_state.get("early_stopping", dict()))
+
+        if training_state["epoch_batches"] < num_replica_batches:
+            logger.info("Resuming epoch {} at batch {}".format(
+                training_state["epoch"], training_state["epoch_batches"]))
+            np.random.set_state(training_state["epoch_rng_state"])
+            return [training_state["epoch"], training_state["epoch_batches"], training_state["rng_state"]]
+
+        logger.info("Resuming at epoch {}".format(training_state["epoch"] + 1))
+        np.random.set_state(training_state["rng_state"])
+        return [training_state["epoch"] + 1, 0, None]
+
+    def log_training_losses(self, training_losses, current_epoch, batch_number):
+        [reconstruction_loss,
+         style_multitask_loss, content_multitask_loss,
+         style_adversary_crossentropy, style_adversary_entropy,
+         content_adversary_crossentropy, content_adversary_entropy,
+         style_kl_loss, content_kl_loss,
+         composite_loss] = training_losses
+
+        log_msg = "[R: {:.2f}, " \
+                  "SMT: {:.2f}, CMT: {:.2f}, " \
+                  "SCE: {:.2f}, SE: {:.2f}, " \
+                  "CCE: {:.2f}, CE: {:.2f}, " \
+                  "SKL: {:.2f}, CKL: {:.2f}] " \
+                  "Epoch {}-{}: {:.4f}"
+        logger.info(log_msg.format(
+            reconstruction_loss,
+            style_multitask_loss, content_multitask_loss,
+            style_adversary_crossentropy, style_adversary_entropy,
+            content_adversary_crossentropy, content_adversary_entropy,
+            style_kl_loss, content_kl_loss,
+            current_epoch, batch_number, composite_loss))
+
+    def run_adversary_updates(self, sess, start_index, end_index, autoencoder_results, padded_sequences,
+                              one_hot_labels, text_sequence_lengths, example_weights, style_kl_weight,
+                              content_kl_weight, current_epoch):
+        """
+        Updates the adversaries `adversary_steps_per_autoencoder_step` times on a batch, feeding them the
+        encoder outputs fetched by its autoencoder run, so that the encoder is not run again.
+        These outputs precede the autoencoder update of that run, i.e. they are one update behind.
+        """
+        cached_encoder_outputs = {
+            self.style_embedding: autoencoder_results["style_embedding"],
+            self.content_embedding_mu: autoencoder_results["content_embedding_mu"],
+        }
+        for _ in range(mconf.adversary_steps_per_autoencoder_step):
+            self.run_batch(
+                sess, start_index, end_index, self.adversary_training_operation, padded_sequences,
+                one_hot_labels, text_sequence_lengths, None, False, False, style_kl_weight, content_kl_weight,
+                current_epoch, example_weights=example_weights, feed_overrides=cached_encoder_outputs)
+
+    def run_training_batch(self, sess, worker_pool, start_index, end_index, fetches, padded_sequences,
+                           one_hot_labels, text_sequence_lengths, example_weights, style_kl_weight,
+                           content_kl_weight, current_epoch):
+        """
+        Runs a training batch, split into contiguous shards across the worker threads if there is a pool.
+        Returns the fetched values and the summed example weights of each shard, in order.
+        """
+        if worker_pool is None:
+            return [[self.run_batch(
+                sess, start_index, end_index, fetches, padded_sequences, one_hot_labels, text_sequence_lengths,
+                None, False, False, style_kl_weight, content_kl_weight, current_epoch,
+                example_weights=example_weights)],
+                [np.sum(example_weights[start_index: end_index])]]
+
+        shard_boundaries = np.linspace(start_index, end_index, num=global_config.training_workers + 1).astype(int)
+        shards = [(shard_start_index, shard_end_index) for (shard_start_index, shard_end_index)
+                  in zip(shard_boundaries[:-1], shard_boundaries[1:]) if shard_end_index > shard_start_index]
+        shard_futures = [
+            worker_pool.submit(
+                self.run_batch, sess, shard_start_index, shard_end_index, fetches,
+                padded_sequences, one_hot_labels, text_sequence_lengths,
+                None, False, False, style_kl_weight, content_kl_weight, current_epoch,
+                example_weights=example_weights)
+            for (shard_start_index, shard_end_index) in shards]
+
+        return [[x.result() for x in shard_futures], [np.sum(example_weights[x: y]) for (x, y) in shards]]
 
     def run_validation(self, options, num_labels, validation_sequences, validation_sequence_lengths,
-                       validation_labels, validation_actual_word_lists, all_style_embeddings,
-                       shuffled_one_hot_labels, inverse_word_index, current_epoch, sess):
+                       validation_labels, validation_actual_word_lists, average_label_embeddings,
+                       inverse_word_index, current_epoch, sess):
 
         logger.info("Running Validation {}:".format(current_epoch // global_config.validation_interval))
 
@@ -661,22 +1296,24 @@ class AdversarialAutoencoder:
 
             logger.info("validating label {}".format(i))
 
-            label_embeddings = list()
             validation_sequences_to_transfer = list()
             validation_labels_to_transfer = list()
             validation_sequence_lengths_to_transfer = list()
 
-            for k in range(len(all_style_embeddings)):
-                if shuffled_one_hot_labels[k].tolist().index(1) == i:
-                    label_embeddings.append(all_style_embeddings[k])
-
             for k in range(len(validation_sequences)):
                 if validation_labels[k].tolist().index(1) != i:
                     validation_sequences_to_transfer.append(validation_sequences[k])
                     validation_labels_to_transfer.append(validation_labels[k])
                     validation_sequence_lengths_to_transfer.append(validation_sequence_lengths[k])
 
-            style_embedding = np.mean(np.asarray(label_embeddings), axis=0)
+            # the weighted average of the epoch, as used for inference
+            style_embedding = np.asarray(average_label_embeddings[i])
+
+            sorted_indices = data_processor.get_length_sorted_indices(validation_sequence_lengths_to_transfer)
+            validation_sequences_to_transfer = [validation_sequences_to_transfer[k] for k in sorted_indices]
+            validation_labels_to_transfer = [validation_labels_to_transfer[k] for k in sorted_indices]
+            validation_sequence_lengths_to_transfer = \
+                [validation_sequence_lengths_to_transfer[k] for k in sorted_indices]
 
             validation_batches = len(validation_sequences_to_transfer) // mconf.batch_size
             if len(validation_sequences_to_transfer) % mconf.batch_size:
@@ -702,11 +1339,13 @@ class AdversarialAutoencoder:
                 validation_generated_sequences.extend(validation_generated_sequences_batch)
                 validation_generated_sequence_lengths.extend(validation_sequence_lengths_batch)
 
-            trimmed_generated_sequences = \
-                [[index for index in sequence
-                  if index != global_config.predefined_word_index[global_config.eos_token]]
-                 for sequence in [x[:(y - 1)] for (x, y) in zip(
-                    validation_generated_sequences, validation_generated_sequence_lengths)]]
+            validation_generated_sequences = data_processor.restore_original_order(
+                validation_generated_sequences, sorted_indices)
+            validation_generated_sequence_lengths = data_processor.restore_original_order(
+                validation_generated_sequence_lengths, sorted_indices)
+
+            trimmed_generated_sequences = data_processor.trim_generated_sequences(
+                validation_generated_sequences, validation_generated_sequence_lengths)
 
             generated_word_lists = \
                 [data_processor.generate_words_from_indices(x, inverse_word_index)
@@ -747,22 +1386,46 @@ class AdversarialAutoencoder:
         aggregate_word_overlap = np.mean(np.asarray(validation_word_overlap_scores))
         logger.info("Aggregate Word Overlap: {}".format(aggregate_word_overlap))
 
+        validation_record = {
+            "epoch": current_epoch,
+            "style-transfer": aggregate_style_transfer,
+            "content-preservation": aggregate_content_preservation,
+            "word-overlap": aggregate_word_overlap
+        }
+        validation_record["composite"] = early_stopping.get_composite_score(validation_record)
+        logger.info("Composite Validation Score: {}".format(validation_record["composite"]))
+
         with open(global_config.validation_scores_path, 'a+') as validation_scores_file:
-            validation_record = {
-                "epoch": current_epoch,
-                "style-transfer": aggregate_style_transfer,
-                "content-preservation": aggregate_content_preservation,
-                "word-overlap": aggregate_word_overlap
-            }
             validation_scores_file.write(json.dumps(validation_record) + "\n")
 
-    def transform_sentences(self, sess, padded_sequences, text_sequence_lengths, style_embedding,
-                            num_labels, model_save_path):
+        return validation_record
+
+    def start_profiling(self, run_name):
+        """Replaces the profiler with one that counts the steps of a new run, reporting to a folder of its own"""
+        self.num_profiled_runs += 1
+        self.step_profiler = step_profiler.StepProfiler(
+            global_config.profile_steps, os.path.join(
+                global_config.profile_directory, "{:02d}-{}".format(self.num_profiled_runs, run_name)))
 
+    def restore_model(self, sess, model_save_path):
         sess.run(tf.global_variables_initializer())
         saver = tf.train.Saver()
         saver.restore(sess=sess, save_path=model_save_path)
 
+    def transform_sentences(self, sess, padded_sequences, text_sequence_lengths, style_embedding,
+                            num_labels, model_save_path):
+
+        self.restore_model(sess, model_save_path)
+
+        return self.run_transformation(sess, padded_sequences, text_sequence_lengths, style_embedding, num_labels)
+
+    def run_transformation(self, sess, padded_sequences, text_sequence_lengths, style_embedding, num_labels):
+
+        # batch similar lengths together so that no batch decodes to the length of a single long outlier
+        sorted_indices = data_processor.get_length_sorted_indices(text_sequence_lengths)
+        padded_sequences = np.asarray(padded_sequences)[sorted_indices]
+        text_sequence_lengths = np.asarray(text_sequence_lengths)[sorted_indices]
+
         data_size = len(padded_sequences)
         generated_sequences = list()
         final_sequence_lengths = list()
@@ -782,70 +1445,210 @@ class AdversarialAutoencoder:
         style_kl_weight = 0
         content_kl_weight = 0
         current_epoch = 0
-        for batch_number in range(num_batches):
-            (start_index, end_index) = self.get_batch_indices(
-                batch_number=batch_number, data_limit=data_size)
-
-            conditioning_embedding = np.tile(A=style_embedding, reps=(end_index - start_index, 1))
-
-            generated_sequences_batch, final_sequence_lengths_batch, \
-            overall_label_predictions_batch, style_label_predictions_batch, \
-            adversarial_label_predictions_batch, cross_entropy_score = \
-                self.run_batch(
-                    sess, start_index, end_index,
-                    [self.inference_output, self.final_sequence_lengths,
-                     self.quantized_style_overall_prediction,
-                     self.quantized_style_multitask_prediction,
-                     self.quantized_style_adversary_prediction,
-                     self.reconstruction_loss],
-                    padded_sequences, one_hot_labels_placeholder, text_sequence_lengths,
-                    conditioning_embedding, True, False, style_kl_weight, content_kl_weight, current_epoch)
-
-            generated_sequences.extend(generated_sequences_batch)
-            final_sequence_lengths.extend(final_sequence_lengths_batch)
-            overall_label_predictions.extend(overall_label_predictions_batch)
-            style_label_predictions.extend(style_label_predictions_batch)
-            adversarial_label_predictions.extend(adversarial_label_predictions_batch)
-            cross_entropy_scores.append(cross_entropy_score)
-
-        return generated_sequences, final_sequence_lengths, overall_label_predictions, \
-               style_label_predictions, adversarial_label_predictions, cross_entropy_scores
-
-    def generate_novel_sentences(self, sess, style_embedding, data_size, num_labels, model_save_path):
-        sess.run(tf.global_variables_initializer())
-        saver = tf.train.Saver()
-        saver.restore(sess=sess, save_path=model_save_path)
-
-        generated_sequences = list()
-        final_sequence_lengths = list()
+        num_shortlist_batches = 0
+        num_differing_rows = 0
+        num_compared_rows = 0
+        full_decoding_time = 0
+        shortlist_decoding_time = 0
+        self.step_metrics = step_metrics.StepMetrics("transformation", global_config.inference_metrics_path)
+        self.start_profiling("transformation")
+        try:
+            for batch_number in range(num_batches):
+                self.step_metrics.start_step()
+                self.step_profiler.start_step()
+                (start_index, end_index) = self.get_batch_indices(
+                    batch_number=batch_number, data_limit=data_size)
 
-        num_batches = data_size // mconf.batch_size
-        if data_size % mconf.batch_size:
+                conditioning_embedding = np.tile(A=style_embedding, reps=(end_index - start_index, 1))
+
+                shortlist_ids = None
+                if self.shortlist_ids is not None:
+                    shortlist_ids = data_processor.get_shortlist_ids(
+                        self.shortlist_required_ids, padded_sequences[start_index:end_index],
+                        self.shortlist_size)
+                if shortlist_ids is None:
+                    decoding_fetches = [self.inference_output, self.final_sequence_lengths]
+                else:
+                    decoding_fetches = [self.shortlist_inference_output, self.shortlist_final_sequence_lengths]
+                    num_shortlist_batches += 1
+
+                generated_sequences_batch, final_sequence_lengths_batch, \
+                overall_label_predictions_batch, style_label_predictions_batch, \
+                adversarial_label_predictions_batch, cross_entropy_score = \
+                    self.run_batch(
+                        sess, start_index, end_index,
+                        decoding_fetches +
+                        [self.quantized_style_overall_prediction,
+                         self.quantized_style_multitask_prediction,
+                         self.quantized_style_adversary_prediction,
+                         self.reconstruction_loss],
+                        padded_sequences, one_hot_labels_placeholder, text_sequence_lengths,
+                        conditioning_embedding, True, False, style_kl_weight, content_kl_weight, current_epoch,
+                        shortlist_ids)
+
+                if shortlist_ids is not None and global_config.shortlist_comparison:
+                    differing_rows, full_time, shortlist_time = self.compare_shortlist_decoding(
+                        sess, start_index, end_index, padded_sequences, one_hot_labels_placeholder,
+                        text_sequence_lengths, conditioning_embedding, shortlist_ids)
+                    num_differing_rows += differing_rows
+                    num_compared_rows += end_index - start_index
+                    full_decoding_time += full_time
+                    shortlist_decoding_time += shortlist_time
+                self.step_profiler.end_step()
+
+                generated_sequences.extend(generated_sequences_batch)
+                final_sequence_lengths.extend(final_sequence_lengths_batch)
+                overall_label_predictions.extend(overall_label_predictions_batch)
+                style_label_predictions.extend(style_label_predictions_batch)
+                adversarial_label_predictions.extend(adversarial_label_predictions_batch)
+                cross_entropy_scores.append(cross_entropy_score)
+
+                self.step_metrics.end_step(
+                    batch_number, end_index - start_index, np.sum(final_sequence_lengths_batch))
+        finally:
+            self.step_profiler.close()
+
+        self.step_metrics.log_summary()
+        self.step_metrics.close()
+
+        if global_config.max_decode_length_ratio:
+            num_capped_rows = data_processor.count_capped_sequences(
+                generated_sequences, final_sequence_lengths,
+                data_processor.get_decode_length_caps(text_sequence_lengths))
+            logger.info("{}/{} rows hit their decode length cap".format(num_capped_rows, data_size))
+
+        if self.shortlist_ids is not None:
+            logger.info("Decoded {}/{} batches over a {}-word shortlist".format(
+                num_shortlist_batches, num_batches, self.shortlist_size))
+        if num_compared_rows:
+            logger.info("Shortlist decoding differed from full-vocabulary decoding on {}/{} rows ({:.2%}), "
+                        "speedup: {:.2f}x".format(
+                            num_differing_rows, num_compared_rows, num_differing_rows / num_compared_rows,
+                            full_decoding_time / shortlist_decoding_time))
+
+        return data_processor.restore_original_order(generated_sequences, sorted_indices), \
+               data_processor.restore_original_order(final_sequence_lengths, sorted_indices), \
+               data_processor.restore_original_order(overall_label_predictions, sorted_indices), \
+               data_processor.restore_original_order(style_label_predictions, sorted_indices), \
+               data_processor.restore_original_order(adversarial_label_predictions, sorted_indices), \
+               cross_entropy_scores
+
+    def compare_shortlist_decoding(self, sess, start_index, end_index, padded_sequences, one_hot_labels,
+                                   text_sequence_lengths, conditioning_embedding, shortlist_ids):
+        """
+        Decodes a batch over the full vocabulary and over the shortlist.
+        Returns the number of rows whose outputs differ, and the time taken by each decode.
+        """
+        decoded_batches = list()
+        decoding_times = list()
+        for fetches, batch_shortlist_ids in \
+                [([self.inference_output, self.final_sequence_lengths], None),
+                 ([self.shortlist_inference_output, self.shortlist_final_sequence_lengths], shortlist_ids)]:
+            start_time = time.time()
+            decoded_batches.append(self.run_batch(
+                sess, start_index, end_index, fetches, padded_sequences, one_hot_labels,
+                text_sequence_lengths, conditioning_embedding, True, False, 0, 0, 0, batch_shortlist_ids))
+            decoding_times.append(time.time() - start_time)
+
+        [[full_sequences, full_lengths], [shortlist_sequences, shortlist_lengths]] = decoded_batches
+        num_differing_rows = 0
+        for full_sequence, full_length, shortlist_sequence, shortlist_length in \
+                zip(full_sequences, full_lengths, shortlist_sequences, shortlist_lengths):
+            if full_length != shortlist_length or \
+                    not np.array_equal(full_sequence[:full_length], shortlist_sequence[:shortlist_length]):
+                num_differing_rows += 1
+
+        return [num_differing_rows] + decoding_times
+
+    def transform_sentence_stream(self, sess, sequence_batches, style_embedding, num_labels):
+        """
+        Transforms an iterable of sequence batches one batch at a time.
+        Expects the model to have already been restored via `restore_model`.
+        Yields the actual and generated sequences of each batch as soon as it is decoded.
+        """
+        style_kl_weight = 0
+        content_kl_weight = 0
+        current_epoch = 0
+        self.step_metrics = step_metrics.StepMetrics("transformation", global_config.inference_metrics_path)
+        batch_number = 0
+        self.step_metrics.start_step()
+        self.start_profiling("stream")
+        self.step_profiler.start_step()
+        # the profiler is also closed when the consumer stops iterating early
+        try:
+            for [actual_sequences, padded_sequences, text_sequence_lengths] in sequence_batches:
+                batch_size = len(padded_sequences)
+
+                conditioning_embedding = np.tile(A=style_embedding, reps=(batch_size, 1))
+                one_hot_labels_placeholder = np.zeros(shape=(batch_size, num_labels), dtype=np.int32)
+
+                generated_sequences_batch, final_sequence_lengths_batch = \
+                    self.run_batch(
+                        sess, 0, batch_size,
+                        [self.inference_output, self.final_sequence_lengths],
+                        padded_sequences, one_hot_labels_placeholder, text_sequence_lengths,
+                        conditioning_embedding, True, False, style_kl_weight, content_kl_weight, current_epoch)
+
+                if global_config.max_decode_length_ratio:
+                    logger.debug("{}/{} rows hit their decode length cap".format(
+                        data_processor.count_capped_sequences(
+                            generated_sequences_batch, final_sequence_lengths_batch,
+                            data_processor.get_decode_length_caps(text_sequence_lengths)),
+                        batch_size))
+
+                # the time spent reading the next batch counts towards it, the time spent by the consumer does not
+                self.step_metrics.end_step(batch_number, batch_size, np.sum(final_sequence_lengths_batch))
+                self.step_profiler.end_step()
+                yield actual_sequences, generated_sequences_batch, final_sequence_lengths_batch
+                batch_number += 1
+                self.step_metrics.start_step()
+                self.step_profiler.start_step()
+        finally:
+            self.step_profiler.close()
+
+        self.step_metrics.log_summary()
+        self.step_metrics.close()
+
+    def generate_novel_sentences(self, sess, style_embedding, data_size, num_labels, batch_size):
+        """
+        Generates novel sentences one batch at a time.
+        Expects the model to have already been restored via `restore_model`.
+        """
+        num_batches = data_size // batch_size
+        if data_size % batch_size:
             num_batches += 1
 
-        end_index = None
         style_kl_weight = 0
         content_kl_weight = 0
         current_epoch = 0
 
-        dummy_sequences = np.zeros(shape=(data_size, global_config.max_sequence_length))
-        dummy_oh_labels = np.zeros(shape=(data_size, num_labels))  # oh = one hot
-        dummy_ts_lengths = np.zeros(shape=(data_size))  # ts = text sequence
+        self.step_metrics = step_metrics.StepMetrics("generation", global_config.inference_metrics_path)
+        self.start_profiling("generation")
+        try:
+            for batch_number in range(num_batches):
+                self.step_metrics.start_step()
+                self.step_profiler.start_step()
+                current_batch_size = min(batch_size, data_size - batch_number * batch_size)
 
-        for batch_number in range(num_batches):
-            (start_index, end_index) = self.get_batch_indices(
-                batch_number=batch_number, data_limit=data_size)
+                # only the batch size of these inputs matters, content vectors are sampled in the graph
+                dummy_sequences = np.zeros(shape=(current_batch_size, mconf.max_sequence_length))
+                dummy_oh_labels = np.zeros(shape=(current_batch_size, num_labels))  # oh = one hot
+                dummy_ts_lengths = np.zeros(shape=current_batch_size)  # ts = text sequence
 
-            conditioning_embedding = np.tile(A=style_embedding, reps=(end_index - start_index, 1))
+                conditioning_embedding = np.tile(A=style_embedding, reps=(current_batch_size, 1))
 
-            generated_sequences_batch, final_sequence_lengths_batch = \
-                self.run_batch(
-                    sess, start_index, end_index,
-                    [self.inference_output, self.final_sequence_lengths],
-                    dummy_sequences, dummy_oh_labels, dummy_ts_lengths,
-                    conditioning_embedding, False, True, style_kl_weight, content_kl_weight, current_epoch)
+                generated_sequences_batch, final_sequence_lengths_batch = \
+                    self.run_batch(
+                        sess, 0, current_batch_size,
+                        [self.inference_output, self.final_sequence_lengths],
+                        dummy_sequences, dummy_oh_labels, dummy_ts_lengths,
+                        conditioning_embedding, False, True, style_kl_weight, content_kl_weight, current_epoch)
 
-            generated_sequences.extend(generated_sequences_batch)
-            final_sequence_lengths.extend(final_sequence_lengths_batch)
+                self.step_profiler.end_step()
+                self.step_metrics.end_step(batch_number, current_batch_size, np.sum(final_sequence_lengths_batch))
+                yield generated_sequences_batch, final_sequence_lengths_batch
+        finally:
+            self.step_profiler.close()
 
-        return generated_sequences, final_sequence_lengths
+        self.step_metrics.log_summary()
+        self.step_metrics.close()
@@ -0,0 +1,50 @@
+import argparse
+import sys
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import bpe_tokenizer, file_helper, log_initializer
+
+logger = None
+
+
+def train_bpe_model(text_file_path, merges_file_path, num_merges, min_frequency, encoded_text_file_path):
+    logger.info("Counting words ...")
+    word_counts = bpe_tokenizer.get_word_counts(text_file_path)
+    logger.info("Distinct words: {}".format(len(word_counts)))
+
+    logger.info("Learning merges ...")
+    merges = bpe_tokenizer.learn_merges(word_counts, num_merges, min_frequency)
+    bpe_tokenizer.save_merges(merges, merges_file_path)
+    logger.info("Saved {} merges to {}".format(len(merges), merges_file_path))
+
+    # e.g. to train word embeddings over the same subwords
+    if encoded_text_file_path:
+        text_tokenizer = bpe_tokenizer.SubwordTokenizer(merges)
+        with open(text_file_path) as text_file, \
+                file_helper.atomic_open(encoded_text_file_path) as encoded_text_file:
+            for line in text_file:
+                encoded_text_file.write(" ".join(text_tokenizer.text_to_subwords(line)) + "\n")
+        logger.info("Encoded text written to {}".format(encoded_text_file_path))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--text-file-path", type=str, required=True)
+    parser.add_argument("--merges-file-path", type=str, required=True)
+    parser.add_argument("--num-merges", type=int, default=16000)
+    parser.add_argument("--min-frequency", type=int, default=2)
+    parser.add_argument("--encoded-text-file-path", type=str)
+    parser.add_argument("--logging-level", type=str, default="INFO")
+
+    options = vars(parser.parse_args(args=argv))
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, options['logging_level'])
+
+    train_bpe_model(options['text_file_path'], options['merges_file_path'], options['num_merges'],
+                    options['min_frequency'], options['encoded_text_file_path'])
+
+    logger.info("Training Complete!")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -14,6 +14,8 @@ from linguistic_style_transfer_model.utils import data_processor, log_initialize
 
 logger = None
 
+filter_sizes = [3, 4, 5]
+
 
 def train_classifier_model(options):
     # Load data
@@ -50,7 +52,7 @@ def train_classifier_model(options):
             num_classes=y_train.shape[1],
             vocab_size=options['vocab_size'],
             embedding_size=128,
-            filter_sizes=list(map(int, [3, 4, 5])),
+            filter_sizes=filter_sizes,
             num_filters=128,
             l2_reg_lambda=0.0)
 
@@ -149,11 +151,25 @@ def main(argv):
     parser.add_argument("--label-file-path", type=str, required=True)
     parser.add_argument("--vocab-size", type=int, default=1000)
     parser.add_argument("--training-epochs", type=int, default=10)
+    parser.add_argument("--max-sequence-length-percentile", type=float)
     parser.add_argument("--logging-level", type=str, default="INFO")
+    tf_session_helper.add_session_arguments(parser)
 
     options = vars(parser.parse_args(args=argv))
+    if options['max_sequence_length_percentile'] is not None and \
+            not 0 < options['max_sequence_length_percentile'] <= 100:
+        parser.error("--max-sequence-length-percentile must be in (0, 100]")
+
     global logger
     logger = log_initializer.setup_custom_logger(global_config.logger_name, options['logging_level'])
+    tf_session_helper.configure_session(
+        options['intra_op_parallelism_threads'], options['inter_op_parallelism_threads'],
+        options['cpu_affinity'], options['xla_jit'])
+
+    # the classifier graph keeps its input length, which the style transfer evaluation pads to;
+    # its convolutions need inputs at least as long as their widest filter
+    global_config.max_sequence_length_percentile = options['max_sequence_length_percentile']
+    global_config.min_sequence_length = max(filter_sizes)
 
     os.makedirs(global_config.classifier_save_directory)
 
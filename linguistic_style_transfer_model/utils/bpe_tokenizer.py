@@ -0,0 +1,185 @@
+import collections
+import heapq
+import logging
+import tensorflow as tf
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import file_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+end_of_word_marker = "</w>"
+continuation_marker = "@@"
+
+
+def text_to_words(text):
+    # same word splitting as the keras tokenizer used by the word-level pipeline
+    return tf.keras.preprocessing.text.text_to_word_sequence(
+        text, filters=global_config.tokenizer_filters, lower=True)
+
+
+def get_word_counts(text_file_path):
+    word_counts = collections.Counter()
+    with open(text_file_path) as text_file:
+        for line in text_file:
+            word_counts.update(text_to_words(line))
+
+    return word_counts
+
+
+def merge_symbol_pair(symbols, pair, merged_symbol):
+    merged_symbols = list()
+    i = 0
+    while i < len(symbols):
+        if i < len(symbols) - 1 and symbols[i] == pair[0] and symbols[i + 1] == pair[1]:
+            merged_symbols.append(merged_symbol)
+            i += 2
+        else:
+            merged_symbols.append(symbols[i])
+            i += 1
+
+    return merged_symbols
+
+
+def learn_merges(word_counts, num_merges, min_frequency):
+    """
+    Learns up to `num_merges` byte-pair merges from a word frequency table.
+    Pair counts are only updated for the words that contain each merged pair,
+    and the most frequent pair is popped from a max-heap whose stale entries are skipped.
+    """
+    words = [list(word[:-1]) + [word[-1] + end_of_word_marker] for word in word_counts]
+    counts = list(word_counts.values())
+
+    pair_counts = collections.defaultdict(int)
+    pair_words = collections.defaultdict(set)
+    for i, symbols in enumerate(words):
+        for pair in zip(symbols, symbols[1:]):
+            pair_counts[pair] += counts[i]
+            pair_words[pair].add(i)
+
+    pair_heap = [(-count, pair) for pair, count in pair_counts.items()]
+    heapq.heapify(pair_heap)
+
+    merges = list()
+    while pair_heap and len(merges) < num_merges:
+        negative_count, pair = heapq.heappop(pair_heap)
+        if -negative_count != pair_counts.get(pair):
+            continue
+        if -negative_count < min_frequency:
+            break
+        merges.append(pair)
+
+        merged_symbol = pair[0] + pair[1]
+        changed_pairs = set()
+        for i in pair_words.pop(pair):
+            symbols = words[i]
+            for old_pair in zip(symbols, symbols[1:]):
+                pair_counts[old_pair] -= counts[i]
+                changed_pairs.add(old_pair)
+            symbols = merge_symbol_pair(symbols, pair, merged_symbol)
+            for new_pair in zip(symbols, symbols[1:]):
+                pair_counts[new_pair] += counts[i]
+                pair_words[new_pair].add(i)
+                changed_pairs.add(new_pair)
+            words[i] = symbols
+
+        for changed_pair in changed_pairs:
+            if pair_counts[changed_pair] > 0:
+                heapq.heappush(pair_heap, (-pair_counts[changed_pair], changed_pair))
+            else:
+                del pair_counts[changed_pair]
+                pair_words.pop(changed_pair, None)
+
+        if len(merges) % 1000 == 0:
+            logger.info("Learned {} merges".format(len(merges)))
+
+    return merges
+
+
+def save_merges(merges, merges_file_path):
+    with file_helper.atomic_open(merges_file_path) as merges_file:
+        for pair in merges:
+            merges_file.write("{} {}\n".format(*pair))
+
+
+def load_merges(merges_file_path):
+    with open(merges_file_path) as merges_file:
+        return [tuple(line.split()) for line in merges_file if line.strip()]
+
+
+def merge_subwords(subwords):
+    """Joins subwords back into words, i.e. the inverse of `SubwordTokenizer.encode_word`"""
+    words = list()
+    current_word = ""
+    for subword in subwords:
+        if subword.endswith(continuation_marker):
+            current_word += subword[:-len(continuation_marker)]
+        else:
+            words.append(current_word + subword)
+            current_word = ""
+    if current_word:
+        words.append(current_word)
+
+    return words
+
+
+class SubwordTokenizer:
+    """
+    Byte-pair encoding tokenizer, usable wherever the pipeline expects a keras `Tokenizer`.
+    Every subword but the last of a word carries the continuation marker, e.g. "lov@@ ely".
+    """
+
+    def __init__(self, merges):
+        self.merge_ranks = {pair: rank for rank, pair in enumerate(merges)}
+        self.word_counts = collections.Counter()
+        self.word_index = dict()
+        self.subword_cache = dict()
+
+    def encode_word(self, word):
+        if word in self.subword_cache:
+            return self.subword_cache[word]
+
+        symbols = list(word[:-1]) + [word[-1] + end_of_word_marker]
+        while len(symbols) > 1:
+            best_pair = min(zip(symbols, symbols[1:]),
+                            key=lambda pair: self.merge_ranks.get(pair, len(self.merge_ranks)))
+            if best_pair not in self.merge_ranks:
+                break
+            symbols = merge_symbol_pair(symbols, best_pair, best_pair[0] + best_pair[1])
+
+        subwords = [symbol[:-len(end_of_word_marker)] if symbol.endswith(end_of_word_marker)
+                    else symbol + continuation_marker for symbol in symbols]
+        self.subword_cache[word] = subwords
+
+        return subwords
+
+    def text_to_subwords(self, text):
+        return [subword for word in text_to_words(text) for subword in self.encode_word(word)]
+
+    def texts_to_subwords(self, texts):
+        return [self.text_to_subwords(text) for text in texts]
+
+    def fit_on_texts(self, texts):
+        for text in texts:
+            self.word_counts.update(self.text_to_subwords(text))
+
+        # most frequent first, as with the keras tokenizer
+        sorted_subwords = sorted(self.word_counts, key=lambda subword: -self.word_counts[subword])
+        self.word_index = {subword: i + 1 for i, subword in enumerate(sorted_subwords)}
+
+    def texts_to_sequences(self, texts):
+        unk_index = self.word_index.get(global_config.unk_token)
+        sequences = list()
+        for subwords in map(self.text_to_subwords, texts):
+            sequence = [self.word_index.get(subword, unk_index) for subword in subwords]
+            sequences.append([x for x in sequence if x is not None])
+
+        return sequences
+
+
+def configure_subword_tokenization(merges_file_path):
+    # subword sequences are longer than word sequences
+    global_config.bpe_merges_file_path = merges_file_path
+    mconf.max_sequence_length = global_config.bpe_max_sequence_length
+    logger.info("Using subword tokenization with merges from {}".format(merges_file_path))
@@ -0,0 +1,163 @@
+import concurrent.futures
+import json
+import logging
+import os
+import pickle
+import re
+import signal
+import tensorflow as tf
+import threading
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import file_helper, tf_session_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def get_latest_checkpoint_path(saved_model_path):
+    # checkpoints are located relative to the model folder, wherever it was trained
+    checkpoint_state = tf.train.get_checkpoint_state(saved_model_path)
+    if checkpoint_state is None:
+        return os.path.join(saved_model_path, global_config.model_save_file)
+
+    return os.path.join(saved_model_path, os.path.basename(checkpoint_state.model_checkpoint_path))
+
+
+def get_checkpoint_step(checkpoint_path):
+    return int(checkpoint_path.rsplit("-", 1)[-1])
+
+
+def get_step_artifact_path(checkpoint_directory, file_name, global_step):
+    """Names the artifact of a single checkpoint after its global step, e.g. training_state-1200.pkl"""
+    [file_root, file_extension] = os.path.splitext(file_name)
+    return os.path.join(checkpoint_directory, "{}-{}{}".format(file_root, global_step, file_extension))
+
+
+def load_training_state(saved_model_path, global_step):
+    training_state_path = get_step_artifact_path(saved_model_path, global_config.training_state_file, global_step)
+    if not os.path.exists(training_state_path):
+        return None
+
+    with open(training_state_path, 'rb') as pickle_file:
+        return pickle.load(pickle_file)
+
+
+def get_resumable_checkpoint(saved_model_path):
+    """
+    Returns the path of the latest checkpoint of a model folder that has a training state, along with that state.
+    The training state of a checkpoint is only written once the checkpoint itself has been saved, so a run
+    stopped in between resumes from the checkpoint before. Returns None if no checkpoint has a training state.
+    """
+    checkpoint_state = tf.train.get_checkpoint_state(saved_model_path)
+    if checkpoint_state is None:
+        return None
+
+    for checkpoint_path in reversed(checkpoint_state.all_model_checkpoint_paths):
+        global_step = get_checkpoint_step(checkpoint_path)
+        training_state = load_training_state(saved_model_path, global_step)
+        if training_state is not None and training_state["global_step"] == global_step:
+            return [os.path.join(saved_model_path, os.path.basename(checkpoint_path)), training_state]
+        logger.warning("Checkpoint {} has no training state of its step, skipping it".format(checkpoint_path))
+
+    return None
+
+
+def write_artifact(file_path, artifact):
+    if file_path.endswith(".pkl"):
+        with file_helper.atomic_open(file_path, 'wb') as pickle_file:
+            pickle.dump(artifact, pickle_file)
+    elif file_path.endswith(".json"):
+        with file_helper.atomic_open(file_path) as json_file:
+            json.dump(artifact, json_file)
+    else:
+        with file_helper.atomic_open(file_path) as text_file:
+            text_file.write(artifact)
+
+
+def get_termination_event():
+    """Returns an event that is set on SIGTERM, so that training can stop between steps"""
+    termination_event = threading.Event()
+
+    def handle_termination(signal_number, frame):
+        logger.info("Received SIGTERM, stopping after the current step")
+        termination_event.set()
+
+    signal.signal(signal.SIGTERM, handle_termination)
+
+    return termination_event
+
+
+class CheckpointWriter:
+    """
+    Saves rotating checkpoints of a training session from a background thread.
+    Between training steps, the variables are copied to host memory. The copy is then assigned to variables
+    of a separate graph and saved by its own session, so that training neither waits on the disk
+    nor races with the snapshot. The side artifacts of a checkpoint, mapped from their file names,
+    are atomically replaced in the checkpoint folder just before it. Step artifacts, e.g. the training state,
+    belong to a single checkpoint. They are written under the name of its step once it has been saved,
+    and removed along with it.
+    """
+
+    def __init__(self, variables, checkpoint_path, max_to_keep):
+        self.variables = variables
+        self.checkpoint_path = checkpoint_path
+        self.checkpoint_directory = os.path.dirname(checkpoint_path)
+
+        self.graph = tf.Graph()
+        with self.graph.as_default(), tf.device('/cpu:0'):
+            self.snapshot_placeholders = [
+                tf.placeholder(dtype=x.dtype.base_dtype, shape=x.shape) for x in variables]
+            snapshot_variables = [
+                tf.Variable(initial_value=x, trainable=False, name="snapshot") for x in self.snapshot_placeholders]
+            self.assign_operation = tf.variables_initializer(snapshot_variables)
+            self.saver = tf.train.Saver(
+                var_list={x.op.name: y for x, y in zip(variables, snapshot_variables)},
+                max_to_keep=max_to_keep, save_relative_paths=True)
+        self.sess = tf.Session(graph=self.graph, config=tf_session_helper.get_config_proto())
+
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.pending_save = None
+
+    def save(self, sess, global_step, artifacts, step_artifacts=None, wait=False):
+        # at most one snapshot is held in memory
+        self.wait()
+        variable_values = sess.run(self.variables)
+        self.pending_save = self.executor.submit(
+            self.write_checkpoint, variable_values, global_step, artifacts, step_artifacts or dict())
+        if wait:
+            self.wait()
+
+    def wait(self):
+        if self.pending_save is not None:
+            self.pending_save.result()
+            self.pending_save = None
+
+    def write_checkpoint(self, variable_values, global_step, artifacts, step_artifacts):
+        os.makedirs(self.checkpoint_directory, exist_ok=True)
+        for file_name, artifact in artifacts.items():
+            write_artifact(os.path.join(self.checkpoint_directory, file_name), artifact)
+
+        self.sess.run(self.assign_operation, feed_dict=dict(zip(self.snapshot_placeholders, variable_values)))
+        checkpoint_path = self.saver.save(
+            sess=self.sess, save_path=self.checkpoint_path, global_step=global_step, write_meta_graph=False)
+
+        for file_name, artifact in step_artifacts.items():
+            write_artifact(get_step_artifact_path(self.checkpoint_directory, file_name, global_step), artifact)
+        self.remove_stale_step_artifacts(step_artifacts)
+        logger.info("Saved checkpoint {}".format(checkpoint_path))
+
+    def remove_stale_step_artifacts(self, step_artifacts):
+        """Removes the step artifacts of checkpoints the saver no longer keeps"""
+        kept_steps = set(get_checkpoint_step(x) for x in self.saver.last_checkpoints)
+        for file_name in step_artifacts:
+            [file_root, file_extension] = os.path.splitext(file_name)
+            step_artifact_pattern = re.compile(r"^{}-(\d+){}$".format(re.escape(file_root), re.escape(file_extension)))
+            for existing_file_name in os.listdir(self.checkpoint_directory):
+                step_match = step_artifact_pattern.match(existing_file_name)
+                if step_match and int(step_match.group(1)) not in kept_steps:
+                    os.remove(os.path.join(self.checkpoint_directory, existing_file_name))
+
+    def close(self):
+        self.wait()
+        self.executor.shutdown()
+        self.sess.close()
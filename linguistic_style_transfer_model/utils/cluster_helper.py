@@ -0,0 +1,157 @@
+import json
+import logging
+import os
+import tensorflow as tf
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import tf_session_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+replica_jobs = ["chief", "worker"]
+
+
+def load_cluster_spec(cluster_spec):
+    # either an inline JSON object or the path of a JSON file
+    if os.path.exists(cluster_spec):
+        with open(cluster_spec, 'r') as json_file:
+            return json.load(json_file)
+
+    return json.loads(cluster_spec)
+
+
+def configure_cluster(cluster_spec, job_name, task_index, sync_replicas):
+    global_config.cluster_spec = cluster_spec
+    global_config.job_name = job_name
+    global_config.task_index = task_index
+    global_config.sync_replicas = sync_replicas
+    logger.info("Cluster task {}:{} of {}".format(job_name, task_index, cluster_spec))
+
+
+def is_distributed():
+    return global_config.cluster_spec is not None
+
+
+def is_chief():
+    return not is_distributed() or global_config.job_name == "chief"
+
+
+def get_num_replicas():
+    if not is_distributed():
+        return 1
+
+    return sum(len(global_config.cluster_spec.get(job, [])) for job in replica_jobs)
+
+
+def get_replica_index():
+    # the chief is replica 0, followed by the workers
+    if not is_distributed() or is_chief():
+        return 0
+
+    return len(global_config.cluster_spec.get("chief", [])) + global_config.task_index
+
+
+def get_worker_device():
+    return "/job:{}/task:{}".format(global_config.job_name, global_config.task_index)
+
+
+def get_local_device():
+    # keeps per-task variables, e.g. gradient accumulators, off the parameter servers
+    return get_worker_device() if is_distributed() else ""
+
+
+def start_server():
+    return tf.train.Server(
+        tf.train.ClusterSpec(global_config.cluster_spec), job_name=global_config.job_name,
+        task_index=global_config.task_index, config=tf_session_helper.get_config_proto())
+
+
+def run_parameter_server():
+    server = start_server()
+    logger.info("Parameter server {} started".format(global_config.task_index))
+    server.join()
+
+
+def get_device_setter():
+    """
+    Places variables on the parameter servers and all other operations on this task.
+    The embedding matrices are by far the largest variables, so they are spread greedily by byte size
+    rather than round-robin. The '/cpu:0' pin around them in `build_model` only sets the device type,
+    which merges with the parameter server job for the variables and with this task for their lookups.
+    """
+    if not is_distributed():
+        return None
+
+    num_ps_tasks = len(global_config.cluster_spec["ps"])
+    return tf.train.replica_device_setter(
+        ps_tasks=num_ps_tasks, worker_device=get_worker_device(),
+        cluster=tf.train.ClusterSpec(global_config.cluster_spec),
+        ps_strategy=tf.contrib.training.GreedyLoadBalancingStrategy(
+            num_ps_tasks, tf.contrib.training.byte_size_load_fn))
+
+
+def get_device_scope():
+    # a no-op outside of a cluster
+    return tf.device(get_device_setter())
+
+
+def create_training_session(server, sync_replicas_optimizer, checkpoint_path=None):
+    """
+    The chief initializes the shared variables, or restores them from `checkpoint_path`,
+    while the other workers wait for them.
+    Local variables, e.g. gradient accumulators, are initialized by every task.
+    """
+    local_init_operations = [tf.local_variables_initializer()]
+    ready_for_local_init_operation = None
+    if sync_replicas_optimizer is not None:
+        local_init_operations.append(
+            sync_replicas_optimizer.chief_init_op if is_chief() else sync_replicas_optimizer.local_step_init_op)
+        ready_for_local_init_operation = sync_replicas_optimizer.ready_for_local_init_op
+        init_tokens_operation = sync_replicas_optimizer.get_init_tokens_op()
+        chief_queue_runner = sync_replicas_optimizer.get_chief_queue_runner()
+
+    session_manager = tf.train.SessionManager(
+        local_init_op=tf.group(*local_init_operations),
+        ready_for_local_init_op=ready_for_local_init_operation)
+    if is_chief():
+        sess = session_manager.prepare_session(
+            server.target, init_op=tf.global_variables_initializer(),
+            saver=tf.train.Saver() if checkpoint_path else None, checkpoint_filename_with_path=checkpoint_path,
+            config=tf_session_helper.get_config_proto())
+        if sync_replicas_optimizer is not None:
+            sess.run(init_tokens_operation)
+            chief_queue_runner.create_threads(sess, daemon=True, start=True)
+    else:
+        logger.info("Waiting for the chief to initialize the model ...")
+        sess = session_manager.wait_for_session(server.target, config=tf_session_helper.get_config_proto())
+
+    return sess
+
+
+class ObjectiveRoutingOptimizer(tf.train.Optimizer):
+    """
+    Applies every gradient with the optimizer of the training objective that owns its variable,
+    so that all objectives can be updated by a single `apply_gradients` call, e.g. from a
+    `SyncReplicasOptimizer`, which supports only one update of the global step per aggregated step.
+    """
+
+    def __init__(self, optimizers_and_variables, name="ObjectiveRoutingOptimizer"):
+        super().__init__(use_locking=False, name=name)
+        self.optimizers_and_variables = optimizers_and_variables
+
+    def apply_gradients(self, grads_and_vars, global_step=None, name=None):
+        grads_and_vars = list(grads_and_vars)
+
+        apply_operations = list()
+        for optimizer, variables in self.optimizers_and_variables:
+            variable_ids = set(id(x) for x in variables)
+            objective_grads_and_vars = [(gradient, variable) for (gradient, variable) in grads_and_vars
+                                        if id(variable) in variable_ids]
+            if objective_grads_and_vars:
+                apply_operations.append(optimizer.apply_gradients(objective_grads_and_vars))
+
+        if global_step is None:
+            return tf.group(*apply_operations, name=name)
+        with tf.control_dependencies(apply_operations):
+            with tf.colocate_with(global_step):
+                return tf.assign_add(global_step, 1, name=name).op
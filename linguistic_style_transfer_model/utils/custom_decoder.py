@@ -11,6 +11,10 @@ from tensorflow.python.util import nest
 __all__ = [
     "BasicDecoderOutput",
     "CustomBasicDecoder",
+    "LatentVectorConcatenationWrapper",
+    "FilteredSamplingEmbeddingHelper",
+    "LatentProjectionGRUCell",
+    "ShortlistProjection",
 ]
 
 
@@ -21,7 +25,7 @@ class BasicDecoderOutput(collections.namedtuple("BasicDecoderOutput", ("rnn_outp
 class CustomBasicDecoder(tf.contrib.seq2seq.BasicDecoder):
     """Basic sampling decoder."""
 
-    def __init__(self, cell, helper, initial_state, latent_vector, output_layer=None):
+    def __init__(self, cell, helper, initial_state, latent_vector, output_layer=None, maximum_lengths=None):
         """Initialize BasicDecoder.
         Args:
           cell: An `RNNCell` instance.
@@ -33,6 +37,8 @@ class CustomBasicDecoder(tf.contrib.seq2seq.BasicDecoder):
           output_layer: (Optional) An instance of `tf.layers.Layer`, i.e.,
             `tf.layers.Dense`.  Optional layer to apply to the RNN output prior
             to storing the result or sampling.
+          maximum_lengths: (Optional) A `[batch_size]` int32 tensor. Each row is
+            marked finished once it has decoded this many time-steps.
         Raises:
           TypeError: if `cell`, `helper` or `output_layer` have an incorrect type.
         """
@@ -46,6 +52,7 @@ class CustomBasicDecoder(tf.contrib.seq2seq.BasicDecoder):
         self._initial_state = initial_state
         self._output_layer = output_layer
         self._latent_vector = latent_vector
+        self._maximum_lengths = maximum_lengths
 
     @property
     def batch_size(self):
@@ -93,9 +100,12 @@ class CustomBasicDecoder(tf.contrib.seq2seq.BasicDecoder):
         Returns:
           `(finished, first_inputs, initial_state)`.
         """
+        (finished, first_inputs) = self._helper.initialize()
+        if self._maximum_lengths is not None:
+            finished = tf.logical_or(finished, self._maximum_lengths <= 0)
+
         # Concatenate the latent vector to the 1st input to the decoder LSTM, i.e, the <GO> embedding + latent vector
-        return (self._helper.initialize()[0],
-                tf.concat([self._helper.initialize()[1], self._latent_vector], axis=-1)) + (self._initial_state,)
+        return (finished, tf.concat([first_inputs, self._latent_vector], axis=-1)) + (self._initial_state,)
 
     def step(self, time, inputs, state, name=None):
         """Perform a decoding step.
@@ -120,9 +130,209 @@ class CustomBasicDecoder(tf.contrib.seq2seq.BasicDecoder):
                 state=cell_state,
                 sample_ids=sample_ids)
 
+            if self._maximum_lengths is not None:
+                finished = tf.logical_or(finished, time + 1 >= self._maximum_lengths)
+
             # Concatenate the latent vector to the predicted word's embedding
             next_inputs = tf.concat([next_inputs, self._latent_vector], axis=-1)
 
         outputs = BasicDecoderOutput(cell_outputs, sample_ids)
 
         return (outputs, next_state, next_inputs, finished)
+
+
+class LatentVectorConcatenationWrapper(rnn_cell_impl.RNNCell):
+    """Cell wrapper that concatenates a latent vector to the input of every time-step.
+
+    This lets decoders that drive the cell themselves, e.g. `BeamSearchDecoder`,
+    condition on the latent vector the same way `CustomBasicDecoder` does.
+    """
+
+    def __init__(self, cell, latent_vector):
+        """Initialize LatentVectorConcatenationWrapper.
+        Args:
+          cell: An `RNNCell` instance. Its weights are shared with any other
+            decoder built on the same cell.
+          latent_vector: A `[batch_size, latent_size]` tensor. For beam search it
+            must already be tiled to `batch_size * beam_width` rows, which is done
+            once outside the decoding loop.
+        """
+        super(LatentVectorConcatenationWrapper, self).__init__()
+        rnn_cell_impl.assert_like_rnncell("cell must be an RNNCell, received: %s" % type(cell), cell)
+        self._cell = cell
+        self._latent_vector = latent_vector
+
+    @property
+    def state_size(self):
+        return self._cell.state_size
+
+    @property
+    def output_size(self):
+        return self._cell.output_size
+
+    def zero_state(self, batch_size, dtype):
+        with ops.name_scope(type(self).__name__ + "ZeroState", values=[batch_size]):
+            return self._cell.zero_state(batch_size, dtype)
+
+    def call(self, inputs, state):
+        return self._cell(tf.concat([inputs, self._latent_vector], axis=-1), state)
+
+
+class FilteredSamplingEmbeddingHelper(tf.contrib.seq2seq.GreedyEmbeddingHelper):
+    """Inference helper that samples each token from a temperature-scaled,
+    top-k and nucleus (top-p) filtered distribution, entirely in the graph.
+    """
+
+    def __init__(self, embedding, start_tokens, end_token, temperature=1.0, top_k=0, top_p=1.0, seed=None):
+        """Initializer.
+        Args:
+          embedding: A callable that takes a vector tensor of `ids` (argmax ids),
+            or the `params` argument for `embedding_lookup`.
+          start_tokens: `int32` vector shaped `[batch_size]`, the start tokens.
+          end_token: `int32` scalar, the token that marks end of decoding.
+          temperature: Python float, logits are divided by this before sampling.
+          top_k: Python int, only the `top_k` most likely tokens are sampled from.
+            `0` disables the filter.
+          top_p: Python float, only the smallest set of most likely tokens whose
+            probability mass reaches `top_p` is sampled from. `1.0` disables the filter.
+          seed: (Optional) The sampling seed.
+        """
+        super(FilteredSamplingEmbeddingHelper, self).__init__(embedding, start_tokens, end_token)
+        self._temperature = temperature
+        self._top_k = top_k
+        self._top_p = top_p
+        self._seed = seed
+
+    def filter_logits(self, logits):
+        masked_logits = tf.fill(dims=tf.shape(logits), value=logits.dtype.min)
+
+        if self._top_k > 0:
+            top_k_logits = tf.nn.top_k(logits, k=self._top_k).values
+            logits = tf.where(logits < top_k_logits[:, -1:], masked_logits, logits)
+
+        if self._top_p < 1.0:
+            sorted_logits = tf.nn.top_k(logits, k=tf.shape(logits)[-1]).values
+            # the exclusive cumulative sum always keeps the most likely token
+            preceding_probabilities = tf.cumsum(tf.nn.softmax(sorted_logits), axis=-1, exclusive=True)
+            min_logits = tf.reduce_min(
+                tf.where(preceding_probabilities < self._top_p, sorted_logits,
+                         tf.fill(dims=tf.shape(sorted_logits), value=logits.dtype.max)),
+                axis=-1, keepdims=True)
+            logits = tf.where(logits < min_logits, masked_logits, logits)
+
+        return logits
+
+    def sample(self, time, outputs, state, name=None):
+        del time, state  # unused by sample
+        with ops.name_scope(name, "FilteredSamplingEmbeddingHelperSample", [outputs]):
+            if not isinstance(outputs, ops.Tensor):
+                raise TypeError("Expected outputs to be a single Tensor, got: %s" % type(outputs))
+            logits = self.filter_logits(outputs / self._temperature)
+            sample_ids = tf.multinomial(logits=logits, num_samples=1, seed=self._seed)
+
+            return tf.cast(tf.squeeze(sample_ids, axis=-1), dtype=dtypes.int32)
+
+
+class LatentProjectionGRUCell(rnn_cell_impl.RNNCell):
+    """GRU cell wrapper for decoders that condition every time-step on a constant latent vector.
+
+    Instead of multiplying the concatenated `[embedding, latent vector, state]` by the
+    gate and candidate kernels at every step, the latent rows of both kernels are applied
+    once per sequence by `project_latent_vector`. The decoder then concatenates that
+    projection to the embedding in place of the latent vector, and each step only adds it.
+
+    The wrapper holds no variables of its own: it reuses those of a `GRUCell` fed the
+    concatenated latent vector. It applies no dropout, since dropout on the latent vector
+    could then only be sampled once per sequence, so it is meant for decoding with keep
+    probabilities of 1.
+    """
+
+    def __init__(self, cell, latent_size):
+        """Initialize LatentProjectionGRUCell.
+        Args:
+          cell: A `GRUCell` that has already been built on the concatenated
+            `[embedding, latent vector]` inputs, e.g. by the training decoder.
+          latent_size: int, The size of the latent vector that is projected.
+        """
+        super(LatentProjectionGRUCell, self).__init__()
+        if not cell.built:
+            raise Exception("The GRU cell must be built before its latent rows are projected")
+        self._cell = cell
+        self._num_units = cell.output_size
+
+        # kernel row blocks are sliced once here rather than inside the decoding loop
+        embedding_end = int(cell._gate_kernel.shape[0]) - self._num_units - latent_size
+        latent_end = embedding_end + latent_size
+        self._embedding_gate_kernel = cell._gate_kernel[:embedding_end]
+        self._latent_gate_kernel = cell._gate_kernel[embedding_end:latent_end]
+        self._state_gate_kernel = cell._gate_kernel[latent_end:]
+        self._embedding_candidate_kernel = cell._candidate_kernel[:embedding_end]
+        self._latent_candidate_kernel = cell._candidate_kernel[embedding_end:latent_end]
+        self._state_candidate_kernel = cell._candidate_kernel[latent_end:]
+
+    @property
+    def state_size(self):
+        return self._cell.state_size
+
+    @property
+    def output_size(self):
+        return self._cell.output_size
+
+    @property
+    def latent_projection_size(self):
+        return 3 * self._num_units
+
+    def zero_state(self, batch_size, dtype):
+        with ops.name_scope(type(self).__name__ + "ZeroState", values=[batch_size]):
+            return self._cell.zero_state(batch_size, dtype)
+
+    def project_latent_vector(self, latent_vector):
+        """Applies the latent rows of the gate and candidate kernels, and their biases.
+        Args:
+          latent_vector: A `[batch_size, latent_size]` tensor.
+        Returns:
+          A `[batch_size, latent_projection_size]` tensor, to be concatenated to the
+          embedded input of every time-step.
+        """
+        gate_projection = tf.nn.bias_add(
+            tf.matmul(latent_vector, self._latent_gate_kernel), self._cell._gate_bias)
+        candidate_projection = tf.nn.bias_add(
+            tf.matmul(latent_vector, self._latent_candidate_kernel), self._cell._candidate_bias)
+
+        return tf.concat([gate_projection, candidate_projection], axis=-1)
+
+    def call(self, inputs, state):
+        embedded_inputs = inputs[:, :-self.latent_projection_size]
+        gate_projection = inputs[:, -self.latent_projection_size:-self._num_units]
+        candidate_projection = inputs[:, -self._num_units:]
+
+        gate_inputs = tf.matmul(embedded_inputs, self._embedding_gate_kernel) + \
+            tf.matmul(state, self._state_gate_kernel) + gate_projection
+        value = tf.sigmoid(gate_inputs)
+        r, u = tf.split(value=value, num_or_size_splits=2, axis=1)
+
+        candidate = tf.matmul(embedded_inputs, self._embedding_candidate_kernel) + \
+            tf.matmul(r * state, self._state_candidate_kernel) + candidate_projection
+        c = self._cell._activation(candidate)
+
+        new_h = u * state + (1 - u) * c
+
+        return new_h, new_h
+
+
+class ShortlistProjection(layers_base.Layer):
+    """Output layer that projects onto a subset of a vocabulary projection's columns.
+
+    `kernel` is the already gathered `[num_units, shortlist_size]` sub-matrix. It holds no
+    variables of its own, so gathering happens once per batch rather than at every step.
+    """
+
+    def __init__(self, kernel, name="shortlist_projection"):
+        super(ShortlistProjection, self).__init__(name=name)
+        self._kernel = kernel
+
+    def call(self, inputs):
+        return tf.matmul(inputs, self._kernel)
+
+    def compute_output_shape(self, input_shape):
+        return tensor_shape.TensorShape(input_shape)[:-1].concatenate(self._kernel.shape[-1])
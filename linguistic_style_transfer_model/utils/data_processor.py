@@ -1,3 +1,5 @@
+import hashlib
+import itertools
 import json
 import logging
 import numpy as np
@@ -6,7 +8,8 @@ import pickle
 import tensorflow as tf
 
 from linguistic_style_transfer_model.config import global_config
-from linguistic_style_transfer_model.utils import tsne_interface, lexicon_helper
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import tsne_interface, lexicon_helper, bpe_tokenizer
 
 logger = logging.getLogger(global_config.logger_name)
 
@@ -25,6 +28,9 @@ def populate_word_blacklist(word_index):
 
     global bow_filtered_vocab_indices
     allowed_vocab = word_index.keys() - blacklisted_words
+    if mconf.bow_sampled_loss:
+        # BoW indices follow vocabulary (i.e. frequency) order, which the sampled BoW losses rely on
+        allowed_vocab = sorted(allowed_vocab, key=lambda word: word_index[word])
     i = 0
     for word in allowed_vocab:
         vocab_index = word_index[word]
@@ -38,8 +44,12 @@ def populate_word_blacklist(word_index):
 
 def get_text_sequences(text_file_path, vocab_size, vocab_save_path):
     word_index = global_config.predefined_word_index
-    text_tokenizer = tf.keras.preprocessing.text.Tokenizer(
-        num_words=global_config.vocab_size, filters=global_config.tokenizer_filters)
+    if global_config.bpe_merges_file_path:
+        text_tokenizer = bpe_tokenizer.SubwordTokenizer(
+            bpe_tokenizer.load_merges(global_config.bpe_merges_file_path))
+    else:
+        text_tokenizer = tf.keras.preprocessing.text.Tokenizer(
+            num_words=global_config.vocab_size, filters=global_config.tokenizer_filters)
 
     with open(text_file_path) as text_file:
         text_tokenizer.fit_on_texts(text_file)
@@ -47,6 +57,13 @@ def get_text_sequences(text_file_path, vocab_size, vocab_save_path):
     logger.info("available_vocab: {}".format(available_vocab))
 
     num_predefined_tokens = len(word_index)
+    if global_config.bpe_merges_file_path:
+        # every subword of the corpus is kept, the merge table sets the vocabulary size,
+        # whereas cutting off rare subwords would turn them into <unk> tokens
+        if vocab_size != num_predefined_tokens + available_vocab:
+            logger.info("The subword vocab size is {}, following the merges rather than --vocab-size {}".format(
+                num_predefined_tokens + available_vocab, vocab_size))
+        vocab_size = num_predefined_tokens + available_vocab
     for index, word in enumerate(text_tokenizer.word_index):
         new_index = index + num_predefined_tokens
         if new_index == vocab_size:
@@ -61,27 +78,60 @@ def get_text_sequences(text_file_path, vocab_size, vocab_save_path):
 
     text_sequence_lengths = np.asarray(
         a=[len(x) for x in actual_sequences], dtype=np.int32)
+    if global_config.max_sequence_length_percentile:
+        mconf.max_sequence_length = get_covering_sequence_length(
+            text_sequence_lengths, global_config.max_sequence_length_percentile, global_config.min_sequence_length)
 
     global_config.vocab_size = len(word_index)
     trimmed_sequences = [
         [x if x < vocab_size else word_index[global_config.unk_token] for x in sequence]
         for sequence in actual_sequences]
+    log_unk_rate(trimmed_sequences, word_index)
     inverse_word_index = {v: k for k, v in word_index.items()}
 
     padded_sequences = tf.keras.preprocessing.sequence.pad_sequences(
-        trimmed_sequences, maxlen=global_config.max_sequence_length, padding='post',
+        trimmed_sequences, maxlen=mconf.max_sequence_length, padding='post',
         truncating='post', value=word_index[global_config.eos_token])
 
     text_sequence_lengths = np.asarray(
-        [global_config.max_sequence_length if x >= global_config.max_sequence_length
+        [mconf.max_sequence_length if x >= mconf.max_sequence_length
          else x + 1 for x in text_sequence_lengths])  # x + 1 to accomodate a single EOS token
 
-    with open(vocab_save_path, 'w') as json_file:
-        json.dump(word_index, json_file)
+    if vocab_save_path:
+        with open(vocab_save_path, 'w') as json_file:
+            json.dump(word_index, json_file)
 
     return [word_index, padded_sequences, text_sequence_lengths, text_tokenizer, inverse_word_index]
 
 
+def log_unk_rate(sequences, word_index):
+    unk_index = word_index[global_config.unk_token]
+    num_tokens = sum(len(x) for x in sequences)
+    num_unk_tokens = sum(x.count(unk_index) for x in sequences)
+    logger.info("<unk> rate: {:.2%} of {} tokens".format(num_unk_tokens / max(num_tokens, 1), num_tokens))
+
+
+def get_covering_sequence_length(text_sequence_lengths, percentile, min_sequence_length=1):
+    """
+    Returns the shortest padded length, including the EOS token, that leaves at least `percentile` percent
+    of the sequences untruncated, from the histogram of their lengths in tokens.
+    The length is raised to `min_sequence_length` if it falls short of it.
+    """
+    cumulative_counts = np.cumsum(np.bincount(text_sequence_lengths))
+    covered_length = min(
+        int(np.searchsorted(cumulative_counts, percentile / 100 * len(text_sequence_lengths))),
+        len(cumulative_counts) - 1)
+    logger.info("Sequence lengths in tokens: median {}, 90th percentile {}, longest {}".format(
+        int(np.percentile(text_sequence_lengths, 50)), int(np.percentile(text_sequence_lengths, 90)),
+        len(cumulative_counts) - 1))
+    logger.info("A max_sequence_length of {} covers {:.2f}% of the sequences".format(
+        covered_length + 1, 100 * cumulative_counts[covered_length] / len(text_sequence_lengths)))
+    if covered_length + 1 < min_sequence_length:
+        logger.info("Raising max_sequence_length to the minimum of {}".format(min_sequence_length))
+
+    return max(covered_length + 1, min_sequence_length)
+
+
 def get_test_sequences(text_file_path, text_tokenizer, word_index, inverse_word_index):
     if not bow_filtered_vocab_indices:
         populate_word_blacklist(word_index)
@@ -93,22 +143,46 @@ def get_test_sequences(text_file_path, text_tokenizer, word_index, inverse_word_
         [generate_words_from_indices(x, inverse_word_index)
          for x in actual_sequences]
 
+    [padded_sequences, text_sequence_lengths] = get_padded_sequences(actual_sequences, word_index)
+
+    return [actual_sequences, actual_word_lists, padded_sequences, text_sequence_lengths]
+
+
+def get_padded_sequences(actual_sequences, word_index):
     trimmed_sequences = [
         [x if x < global_config.vocab_size else word_index[global_config.unk_token] for x in sequence]
         for sequence in actual_sequences]
 
     padded_sequences = tf.keras.preprocessing.sequence.pad_sequences(
-        trimmed_sequences, maxlen=global_config.max_sequence_length, padding='post',
+        trimmed_sequences, maxlen=mconf.max_sequence_length, padding='post',
         truncating='post', value=word_index[global_config.eos_token])
 
     text_sequence_lengths = np.asarray(
         a=[len(x) for x in actual_sequences], dtype=np.int32)
 
     text_sequence_lengths = np.asarray(
-        [global_config.max_sequence_length if x >= global_config.max_sequence_length
+        [mconf.max_sequence_length if x >= mconf.max_sequence_length
          else x + 1 for x in text_sequence_lengths])  # x + 1 to accomodate a single EOS token
 
-    return [actual_sequences, actual_word_lists, padded_sequences, text_sequence_lengths]
+    return [padded_sequences, text_sequence_lengths]
+
+
+def stream_test_sequences(text_file, text_tokenizer, word_index, batch_size):
+    """
+    Lazily tokenizes a text file (or stdin) into fixed-size batches,
+    so that only one batch of sequences is held in memory at a time.
+    """
+    if not bow_filtered_vocab_indices:
+        populate_word_blacklist(word_index)
+
+    while True:
+        lines = list(itertools.islice(text_file, batch_size))
+        if not lines:
+            break
+        actual_sequences = text_tokenizer.texts_to_sequences(lines)
+        [padded_sequences, text_sequence_lengths] = get_padded_sequences(actual_sequences, word_index)
+
+        yield [actual_sequences, padded_sequences, text_sequence_lengths]
 
 
 def get_labels(label_file_path, store_labels, store_path):
@@ -161,12 +235,102 @@ def get_test_labels(label_file_path, model_save_directory):
     return [label_sequences, one_hot_labels]
 
 
+def get_saved_labels(label_file_path, model_save_directory):
+    """Maps the training labels with the label maps of a saved model, e.g. to resume training it"""
+    [_, one_hot_labels] = get_test_labels(label_file_path, model_save_directory)
+
+    with open(os.path.join(model_save_directory,
+                           global_config.index_to_label_dict_file), 'r') as json_file:
+        # json keys are strings
+        for index, label in json.load(json_file).items():
+            index_to_label_map[int(index)] = label
+    logger.info("labels: {}".format(label_to_index_map))
+
+    return [np.asarray(one_hot_labels), len(label_to_index_map)]
+
+
+def deduplicate_examples(padded_sequences, text_sequence_lengths, one_hot_labels):
+    """
+    Collapses the examples with the same label and the same tokenized sequence into their first occurrence.
+    Returns the remaining examples and the number of copies of each, to weigh its losses with.
+    """
+    example_indices = dict()
+    unique_indices = list()
+    example_counts = list()
+    for index, (padded_sequence, text_sequence_length, one_hot_label) in \
+            enumerate(zip(padded_sequences, text_sequence_lengths, one_hot_labels)):
+        example_key = hashlib.sha1(
+            np.asarray(padded_sequence).tobytes() + np.asarray(one_hot_label).tobytes() +
+            str(text_sequence_length).encode()).digest()
+        if example_key in example_indices:
+            example_counts[example_indices[example_key]] += 1
+        else:
+            example_indices[example_key] = len(unique_indices)
+            unique_indices.append(index)
+            example_counts.append(1)
+    logger.info("Collapsed {} examples into {} unique ones".format(len(padded_sequences), len(unique_indices)))
+
+    return [padded_sequences[unique_indices], text_sequence_lengths[unique_indices],
+            one_hot_labels[unique_indices], np.asarray(example_counts, dtype=np.float32)]
+
+
 def generate_word(word_embedding):
     return np.argmax(word_embedding)
 
 
+def get_length_sorted_indices(text_sequence_lengths):
+    # a stable sort keeps equal-length sequences in file order
+    return np.argsort(np.asarray(text_sequence_lengths), kind='mergesort')
+
+
+def restore_original_order(sorted_items, sorted_indices):
+    original_order_items = [None] * len(sorted_items)
+    for sorted_position, original_index in enumerate(sorted_indices):
+        original_order_items[original_index] = sorted_items[sorted_position]
+
+    return original_order_items
+
+
+def get_shortlist_ids(required_ids, padded_sequences, shortlist_size):
+    """
+    Returns the sorted vocabulary ids to decode a batch over: the required ids and the batch's own ids,
+    topped up to exactly `shortlist_size` with the most frequent (i.e. lowest) remaining ids.
+    Returns None if the required and batch ids alone exceed `shortlist_size`.
+    """
+    shortlist_ids = np.union1d(required_ids, padded_sequences)
+    if len(shortlist_ids) > shortlist_size:
+        return None
+    frequent_ids = np.setdiff1d(np.arange(shortlist_size), shortlist_ids)[:shortlist_size - len(shortlist_ids)]
+
+    return np.union1d(shortlist_ids, frequent_ids).astype(np.int32)
+
+
+def get_decode_length_caps(text_sequence_lengths):
+    caps = np.ceil(global_config.max_decode_length_ratio * np.asarray(text_sequence_lengths)) + \
+        global_config.max_decode_length_slack
+
+    return np.minimum(caps, mconf.max_sequence_length).astype(np.int32)
+
+
+def count_capped_sequences(generated_sequences, final_sequence_lengths, decode_length_caps):
+    # a capped row stops at its cap without having emitted <eos>
+    eos_index = global_config.predefined_word_index[global_config.eos_token]
+    return sum(1 for (sequence, length, cap) in zip(generated_sequences, final_sequence_lengths, decode_length_caps)
+               if length >= cap and sequence[length - 1] != eos_index)
+
+
+def trim_generated_sequences(generated_sequences, final_sequence_lengths):
+    # first trims the generates sentences down to the length the decoder returns
+    # then trim any <eos> token
+    return [[index for index in sequence
+             if index != global_config.predefined_word_index[global_config.eos_token]]
+            for sequence in [x[:(y - 1)] for (x, y) in zip(generated_sequences, final_sequence_lengths)]]
+
+
 def generate_words_from_indices(index_sequence, inverse_word_index):
     words = [inverse_word_index[x] for x in index_sequence]
+    if global_config.bpe_merges_file_path:
+        words = bpe_tokenizer.merge_subwords(words)
     return words
 
 
@@ -182,25 +346,35 @@ def generate_sentence_from_logits(floating_index_sequence, inverse_word_index):
     return words
 
 
-def get_average_label_embeddings(data_size, dump_embeddings, epoch):
+def get_average_label_embeddings(data_size, dump_embeddings, epoch, example_weights):
+    """
+    Averages the style embeddings of an epoch by label, weighting each by the number of copies of its sentence.
+    The embeddings are read back from the files of the epoch, and `example_weights` follows their order.
+    """
     style_embeddings = np.load(file=global_config.all_style_embeddings_path)
-    content_embeddings = np.load(file=global_config.all_content_embeddings_path)
+    # content embeddings are only saved to be plotted
+    if dump_embeddings:
+        content_embeddings = np.load(file=global_config.all_content_embeddings_path)
     with open(global_config.all_shuffled_labels_path, 'rb') as pickle_file:
         all_one_hot_labels = pickle.load(pickle_file)
 
     style_embedding_map = dict()
     content_embedding_map = dict()
+    example_weight_map = dict()
 
     for i in range(data_size):
         label = all_one_hot_labels[i].tolist().index(1)
 
         if label not in style_embedding_map:
             style_embedding_map[label] = list()
+            example_weight_map[label] = list()
         if label not in content_embedding_map:
             content_embedding_map[label] = list()
 
         style_embedding_map[label].append(style_embeddings[i])
-        content_embedding_map[label].append(content_embeddings[i])
+        example_weight_map[label].append(example_weights[i])
+        if dump_embeddings:
+            content_embedding_map[label].append(content_embeddings[i])
 
     if dump_embeddings:
         if not os.path.exists(global_config.tsne_plot_folder):
@@ -226,11 +400,32 @@ def get_average_label_embeddings(data_size, dump_embeddings, epoch):
 
     average_label_embeddings = dict()
     for label in style_embedding_map:
-        average_label_embeddings[label] = np.mean(style_embedding_map[label], axis=0)
+        average_label_embeddings[label] = np.average(
+            style_embedding_map[label], axis=0, weights=example_weight_map[label])
 
     return average_label_embeddings
 
 
+def get_partial_average_label_embeddings(style_embeddings, one_hot_labels, example_weights, average_label_embeddings):
+    """
+    Averages the style embeddings seen so far in an epoch, for checkpoints written before it ends.
+    Labels without embeddings yet keep their average from the previous epoch.
+    """
+    style_embedding_map = dict()
+    example_weight_map = dict()
+    for style_embedding, one_hot_label, example_weight in zip(style_embeddings, one_hot_labels, example_weights):
+        label = one_hot_label.tolist().index(1)
+        style_embedding_map.setdefault(label, list()).append(style_embedding)
+        example_weight_map.setdefault(label, list()).append(example_weight)
+
+    partial_average_label_embeddings = dict(average_label_embeddings)
+    for label in style_embedding_map:
+        partial_average_label_embeddings[label] = np.average(
+            style_embedding_map[label], axis=0, weights=example_weight_map[label])
+
+    return partial_average_label_embeddings
+
+
 def batch_iter(data, batch_size, num_epochs, shuffle=True):
     """
     Generates a batch iterator for a dataset.
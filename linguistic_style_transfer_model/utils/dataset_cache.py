@@ -0,0 +1,58 @@
+import hashlib
+import json
+import logging
+import numpy as np
+import os
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import file_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def get_file_digest(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(1 << 20), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def get_cache_path(text_file_path, vocab_size):
+    """A tokenized corpus is cached under a key of its contents and every setting its tokenization depends on"""
+    bpe_merges_digest = None
+    if global_config.bpe_merges_file_path:
+        bpe_merges_digest = get_file_digest(global_config.bpe_merges_file_path)
+
+    # a selected sequence length depends on the corpus only, and is restored with the padded sequences
+    max_sequence_length = None if global_config.max_sequence_length_percentile else mconf.max_sequence_length
+    cache_key = json.dumps([
+        get_file_digest(text_file_path), vocab_size, bpe_merges_digest, max_sequence_length,
+        global_config.max_sequence_length_percentile, global_config.tokenizer_filters, global_config.unk_token, global_config.sos_token, global_config.eos_token])
+
+    return os.path.join(
+        global_config.dataset_cache_directory,
+        "{}.npz".format(hashlib.sha1(cache_key.encode()).hexdigest()))
+
+
+def load_dataset(cache_path):
+    if not os.path.exists(cache_path):
+        return None
+
+    with np.load(cache_path) as cached_dataset:
+        padded_sequences = cached_dataset["padded_sequences"]
+        mconf.max_sequence_length = padded_sequences.shape[1]
+
+        return [json.loads(str(cached_dataset["word_index"])),
+                padded_sequences, cached_dataset["text_sequence_lengths"]]
+
+
+def save_dataset(cache_path, word_index, padded_sequences, text_sequence_lengths):
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    # concurrent runs on the same corpus each write a whole file and the last one wins
+    with file_helper.atomic_open(cache_path, 'wb') as cache_file:
+        np.savez(cache_file, word_index=np.asarray(json.dumps(word_index)),
+                 padded_sequences=padded_sequences, text_sequence_lengths=text_sequence_lengths)
+    logger.info("Cached the tokenized corpus to {}".format(cache_path))
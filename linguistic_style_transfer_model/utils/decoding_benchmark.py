@@ -0,0 +1,69 @@
+import sys
+
+import argparse
+import logging
+import multiprocessing
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import inference_helper, log_initializer, session_autotuner, \
+    tf_session_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def measure_decoding_throughput(saved_model_path, text_file_path, num_batches, beam_width, length_penalty_weight,
+                                logging_level):
+    # the decoder is built for one beam width, so every width runs in its own process and graph
+    inference_helper.configure_decoding(beam_width=beam_width, length_penalty_weight=length_penalty_weight)
+
+    return session_autotuner.measure_throughput(
+        saved_model_path, text_file_path, num_batches,
+        tf_session_helper.load_session_config(saved_model_path), logging_level)
+
+
+def benchmark_beam_widths(saved_model_path, text_file_path, num_batches, beam_widths, length_penalty_weight,
+                          logging_level):
+    """Measures transformation throughput for every beam width, relative to greedy decoding"""
+    context = multiprocessing.get_context("spawn")
+
+    results = list()
+    for beam_width in [1] + [x for x in beam_widths if x != 1]:
+        with context.Pool(processes=1) as pool:
+            throughput = pool.apply(
+                measure_decoding_throughput,
+                (saved_model_path, text_file_path, num_batches, beam_width, length_penalty_weight,
+                 logging_level))
+        results.append((beam_width, throughput))
+
+    greedy_throughput = results[0][1]
+    table_rows = ["{:>12}{:>16}{:>16}".format("beam_width", "sentences/s", "vs greedy")]
+    for beam_width, throughput in results:
+        table_rows.append("{:>12}{:>16.1f}{:>15.2f}x".format(beam_width, throughput, throughput / greedy_throughput))
+    logger.info("Decoding throughput over {} batches:\n{}".format(num_batches, "\n".join(table_rows)))
+
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--saved-model-path", type=str, required=True)
+    parser.add_argument("--text-file-path", type=str, required=True)
+    parser.add_argument("--num-batches", type=int, default=20)
+    parser.add_argument("--beam-widths", type=int, nargs="+", default=[4])
+    parser.add_argument("--length-penalty-weight", type=float, default=0.0)
+    parser.add_argument("--logging-level", type=str, default="INFO")
+    options = vars(parser.parse_args(args=argv))
+
+    if min(options['beam_widths']) < 1:
+        parser.error("--beam-widths must be at least 1")
+
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, options['logging_level'])
+
+    benchmark_beam_widths(
+        options['saved_model_path'], options['text_file_path'], options['num_batches'],
+        options['beam_widths'], options['length_penalty_weight'], options['logging_level'])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,48 @@
+import logging
+
+from linguistic_style_transfer_model.config import global_config
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def get_composite_score(validation_record):
+    total_weight = sum(global_config.validation_score_weights.values())
+
+    return sum(weight * validation_record[score]
+               for score, weight in global_config.validation_score_weights.items()) / total_weight
+
+
+class EarlyStopping:
+    """
+    Tracks the best composite validation score. Training should stop once `patience` validations in a row
+    have not improved on it by more than `min_delta`. A patience of 0 never stops.
+    The state is saved with every checkpoint, so that it carries over to resumed training.
+    """
+
+    def __init__(self, patience, min_delta, best_score=None, validations_without_improvement=0):
+        self.patience = patience
+        self.min_delta = min_delta
+        self.best_score = best_score
+        self.validations_without_improvement = validations_without_improvement
+
+    def update(self, score):
+        """Returns whether `score` is the new best"""
+        if self.best_score is None or score > self.best_score + self.min_delta:
+            self.best_score = score
+            self.validations_without_improvement = 0
+            return True
+
+        self.validations_without_improvement += 1
+        logger.info("No validation improvement on {:.4f} for {} validations".format(
+            self.best_score, self.validations_without_improvement))
+
+        return False
+
+    def should_stop(self):
+        return 0 < self.patience <= self.validations_without_improvement
+
+    def get_state(self):
+        return {
+            "best_score": self.best_score,
+            "validations_without_improvement": self.validations_without_improvement,
+        }
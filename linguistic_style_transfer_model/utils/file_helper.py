@@ -0,0 +1,20 @@
+import contextlib
+import os
+
+
+@contextlib.contextmanager
+def atomic_open(file_path, mode='w'):
+    """
+    Writes to a temporary sibling file and renames it over `file_path` on success,
+    so that readers never observe a partially written file.
+    """
+    temp_file_path = "{}.tmp.{}".format(file_path, os.getpid())
+    try:
+        with open(temp_file_path, mode) as temp_file:
+            yield temp_file
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        os.replace(temp_file_path, file_path)
+    finally:
+        if os.path.exists(temp_file_path):
+            os.remove(temp_file_path)
@@ -0,0 +1,48 @@
+import tensorflow as tf
+
+
+class GradientAccumulator:
+    """
+    Sums the gradients of a loss over several runs of `accumulate_operation`, e.g. concurrent
+    batch shards or successive micro-batches, and applies their average with `apply_operation`.
+    The accumulators are local variables, so they are not checkpointed.
+    """
+
+    def __init__(self, optimizer, loss, var_list, name, global_step=None):
+        grads_and_vars = [(gradient, variable) for (gradient, variable)
+                          in optimizer.compute_gradients(loss=loss, var_list=var_list)
+                          if gradient is not None]
+
+        with tf.name_scope(name):
+            self.accumulated_count = tf.Variable(
+                initial_value=0.0, trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                name="accumulated_count")
+            accumulators = [
+                tf.Variable(
+                    initial_value=tf.zeros(shape=variable.shape, dtype=variable.dtype.base_dtype),
+                    trainable=False, collections=[tf.GraphKeys.LOCAL_VARIABLES],
+                    name="accumulator")
+                for (_, variable) in grads_and_vars]
+
+            accumulate_operations = list()
+            for (gradient, _), accumulator in zip(grads_and_vars, accumulators):
+                if isinstance(gradient, tf.IndexedSlices):
+                    accumulate_operations.append(tf.scatter_add(
+                        ref=accumulator, indices=gradient.indices, updates=gradient.values,
+                        use_locking=True))
+                else:
+                    accumulate_operations.append(tf.assign_add(
+                        ref=accumulator, value=gradient, use_locking=True))
+            with tf.control_dependencies(accumulate_operations):
+                self.accumulate_operation = tf.assign_add(
+                    ref=self.accumulated_count, value=1.0, use_locking=True)
+
+            apply_operation = optimizer.apply_gradients(
+                [(accumulator / tf.maximum(self.accumulated_count, 1.0), variable)
+                 for accumulator, (_, variable) in zip(accumulators, grads_and_vars)],
+                global_step=global_step)
+            with tf.control_dependencies([apply_operation]):
+                self.apply_operation = tf.group(
+                    *([tf.assign(ref=accumulator, value=tf.zeros_like(accumulator))
+                       for accumulator in accumulators] +
+                      [tf.assign(ref=self.accumulated_count, value=0.0)]))
@@ -0,0 +1,290 @@
+import sys
+
+import argparse
+import collections
+import json
+import logging
+import numpy as np
+import os
+import signal
+import subprocess
+import time
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import bpe_tokenizer, data_processor, dataset_cache, file_helper, \
+    log_initializer
+
+logger = logging.getLogger(global_config.logger_name)
+
+main_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+poll_seconds = 10
+results_file = "results.tsv"
+
+
+def load_search_space(search_space_file_path):
+    """
+    Loads a JSON object that maps model config fields to their domains, either a list of "values",
+    or a "min" and "max" sampled uniformly, or log-uniformly with "log", and rounded with "integer".
+    """
+    with open(search_space_file_path) as search_space_file:
+        search_space = json.load(search_space_file)
+
+    for field, domain in search_space.items():
+        if not hasattr(mconf, field):
+            raise ValueError("Unknown model config field: {}".format(field))
+        if "values" not in domain and not ("min" in domain and "max" in domain):
+            raise ValueError("The domain of {} needs either values or a min and a max".format(field))
+
+    return search_space
+
+
+def sample_model_config_overrides(search_space, random_state):
+    model_config_overrides = dict()
+    for field, domain in sorted(search_space.items()):
+        if "values" in domain:
+            value = domain["values"][random_state.randint(len(domain["values"]))]
+        elif domain.get("log"):
+            value = float(np.exp(random_state.uniform(np.log(domain["min"]), np.log(domain["max"]))))
+        else:
+            value = float(random_state.uniform(domain["min"], domain["max"]))
+        if domain.get("integer"):
+            value = int(round(value))
+        model_config_overrides[field] = value
+
+    return model_config_overrides
+
+
+def get_cpu_slots(cpu_budget, cpus_per_trial):
+    """Splits the CPUs of the budget into disjoint affinity masks, one for every concurrent trial"""
+    if hasattr(os, "sched_getaffinity"):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count()))
+    cpus = cpus[:cpu_budget or len(cpus)]
+
+    return [",".join(str(x) for x in cpus[i: i + cpus_per_trial])
+            for i in range(0, len(cpus) - cpus_per_trial + 1, cpus_per_trial)]
+
+
+def prepare_dataset_cache(training_args):
+    """Tokenizes the training corpus once, so that every trial loads it from the shared cache"""
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--text-file-path", type=str, required=True)
+    parser.add_argument("--vocab-size", type=int, default=1000)
+    parser.add_argument("--bpe-merges-file-path", type=str)
+    parser.add_argument("--max-sequence-length-percentile", type=float)
+    [training_options, _] = parser.parse_known_args(args=training_args)
+
+    if training_options.bpe_merges_file_path:
+        bpe_tokenizer.configure_subword_tokenization(training_options.bpe_merges_file_path)
+    global_config.max_sequence_length_percentile = training_options.max_sequence_length_percentile
+
+    cache_path = dataset_cache.get_cache_path(training_options.text_file_path, training_options.vocab_size)
+    if os.path.exists(cache_path):
+        logger.info("Trials share the tokenized corpus in {}".format(cache_path))
+        return
+
+    logger.info("Tokenizing the corpus for all trials ...")
+    [word_index, padded_sequences, text_sequence_lengths, _, _] = data_processor.get_text_sequences(
+        training_options.text_file_path, training_options.vocab_size, None)
+    dataset_cache.save_dataset(cache_path, word_index, padded_sequences, text_sequence_lengths)
+
+
+class SuccessiveHalvingPruner:
+    """
+    Asynchronous successive halving over the per-epoch validation scores of the trials.
+    Rungs are at epochs `min_epochs * reduction_factor ** k`. A trial that reaches a rung continues only
+    if its composite score is among the top `1 / reduction_factor` of all scores reported at that rung so far.
+    """
+
+    def __init__(self, min_epochs, reduction_factor):
+        self.min_epochs = min_epochs
+        self.reduction_factor = reduction_factor
+        self.rung_scores = collections.defaultdict(list)
+
+    def is_rung(self, epoch):
+        rung_epoch = self.min_epochs
+        while rung_epoch < epoch:
+            rung_epoch *= self.reduction_factor
+
+        return rung_epoch == epoch
+
+    def report(self, epoch, score):
+        """Returns whether the trial should continue"""
+        if not self.is_rung(epoch):
+            return True
+
+        rung_scores = self.rung_scores[epoch]
+        rung_scores.append(score)
+        num_continuing = max(1, len(rung_scores) // self.reduction_factor)
+
+        return score >= sorted(rung_scores, reverse=True)[num_continuing - 1]
+
+
+class Trial:
+
+    def __init__(self, trial_number, model_config_overrides):
+        self.trial_number = trial_number
+        self.model_config_overrides = model_config_overrides
+        # the training run names its folders after the trial, see `--experiment-name`
+        self.experiment_name = "{}-trial-{:03d}".format(global_config.experiment_timestamp, trial_number)
+        self.save_directory = global_config.save_directory.replace(
+            global_config.experiment_timestamp, self.experiment_name)
+        self.validation_scores_path = global_config.validation_scores_path.replace(
+            global_config.experiment_timestamp, self.experiment_name)
+
+        self.status = "pending"
+        self.process = None
+        self.log_file = None
+        self.validation_records = list()
+
+    def start(self, training_args, cpu_affinity, cpus_per_trial, sweep_directory):
+        self.log_file = open(os.path.join(sweep_directory, "trial-{:03d}.log".format(self.trial_number)), 'w')
+        command = [sys.executable, "-u", main_file_path, "--train-model"] + training_args + [
+            "--experiment-name", self.experiment_name,
+            "--model-config-overrides", json.dumps(self.model_config_overrides),
+            "--dataset-cache-directory", global_config.dataset_cache_directory,
+            "--intra-op-parallelism-threads", str(cpus_per_trial),
+            "--cpu-affinity", cpu_affinity]
+        self.process = subprocess.Popen(command, stdout=self.log_file, stderr=subprocess.STDOUT)
+        self.status = "running"
+        logger.info("Started trial {} on CPUs {}: {}".format(
+            self.trial_number, cpu_affinity, self.model_config_overrides))
+
+    def read_validation_records(self):
+        """Returns the validation records written since the last call"""
+        if not os.path.exists(self.validation_scores_path):
+            return list()
+
+        with open(self.validation_scores_path) as validation_scores_file:
+            # a line without its newline is still being written
+            validation_records = [json.loads(x) for x in validation_scores_file.readlines() if x.endswith("\n")]
+        new_validation_records = validation_records[len(self.validation_records):]
+        self.validation_records = validation_records
+
+        return new_validation_records
+
+    def prune(self):
+        # a trial stops after its current step on SIGTERM, with a final checkpoint
+        self.process.send_signal(signal.SIGTERM)
+        self.status = "pruned"
+
+    def finish(self, return_code):
+        self.log_file.close()
+        if self.status == "running":
+            self.status = "completed" if return_code == 0 else "failed"
+        logger.info("Trial {} {}".format(self.trial_number, self.status))
+
+    def get_best_validation_record(self):
+        if not self.validation_records:
+            return None
+
+        return max(self.validation_records, key=lambda x: x["composite"])
+
+
+def run_sweep(trials, training_args, cpu_slots, cpus_per_trial, pruner, sweep_directory):
+    pending_trials = list(trials)
+    running_trials = dict()
+    try:
+        while pending_trials or running_trials:
+            for cpu_slot in cpu_slots:
+                if cpu_slot not in running_trials and pending_trials:
+                    running_trials[cpu_slot] = pending_trials.pop(0)
+                    running_trials[cpu_slot].start(training_args, cpu_slot, cpus_per_trial, sweep_directory)
+
+            time.sleep(poll_seconds)
+
+            for cpu_slot, trial in list(running_trials.items()):
+                # records are read after polling, so that none written before the exit are missed
+                return_code = trial.process.poll()
+                for validation_record in trial.read_validation_records():
+                    if trial.status == "running" and \
+                            not pruner.report(validation_record["epoch"], validation_record["composite"]):
+                        logger.info("Pruning trial {} at epoch {} with a composite score of {:.4f}".format(
+                            trial.trial_number, validation_record["epoch"], validation_record["composite"]))
+                        trial.prune()
+                if return_code is not None:
+                    trial.finish(return_code)
+                    del running_trials[cpu_slot]
+    finally:
+        for trial in running_trials.values():
+            if trial.process.poll() is None:
+                trial.process.terminate()
+
+
+def write_results(trials, sweep_directory):
+    fields = sorted({field for trial in trials for field in trial.model_config_overrides})
+    header = ["trial", "status", "epochs", "best_epoch", "composite",
+              "style-transfer", "content-preservation", "word-overlap"] + fields + ["save_directory"]
+
+    rows = list()
+    for trial in trials:
+        best_validation_record = trial.get_best_validation_record() or dict()
+        rows.append(
+            [trial.trial_number, trial.status, len(trial.validation_records), best_validation_record.get("epoch")] +
+            [best_validation_record.get(x) for x in ["composite", "style-transfer", "content-preservation",
+                                                     "word-overlap"]] +
+            [trial.model_config_overrides.get(x) for x in fields] + [trial.save_directory])
+    # best trials first, trials without a validation last
+    rows.sort(key=lambda x: -np.inf if x[4] is None else x[4], reverse=True)
+
+    results_file_path = os.path.join(sweep_directory, results_file)
+    with file_helper.atomic_open(results_file_path) as results_tsv_file:
+        for row in [header] + rows:
+            results_tsv_file.write("\t".join("" if x is None else str(x) for x in row) + "\n")
+
+    table_rows = [" ".join("{:>14}".format(x) for x in header[:-1])]
+    for row in rows:
+        table_rows.append(" ".join(
+            "{:>14.4f}".format(x) if isinstance(x, float) else "{:>14}".format(str(x)) for x in row[:-1]))
+    logger.info("Sweep results, see {} for the model folders:\n{}".format(results_file_path, "\n".join(table_rows)))
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Arguments not listed here are passed to every training run of main.py")
+    parser.add_argument("--search-space-file-path", type=str, required=True)
+    parser.add_argument("--num-trials", type=int, default=16)
+    parser.add_argument("--cpu-budget", type=int, default=0)
+    parser.add_argument("--cpus-per-trial", type=int, default=4)
+    parser.add_argument("--min-epochs", type=int, default=1)
+    parser.add_argument("--reduction-factor", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--sweep-directory", type=str, default="output/{}-sweep".format(
+        global_config.experiment_timestamp))
+    parser.add_argument("--dataset-cache-directory", type=str, default=global_config.dataset_cache_directory)
+    parser.add_argument("--logging-level", type=str, default="INFO")
+    [options, training_args] = parser.parse_known_args(args=argv)
+
+    if options.min_epochs < 1 or options.reduction_factor < 2:
+        parser.error("--min-epochs must be at least 1 and --reduction-factor at least 2")
+    cpu_slots = get_cpu_slots(options.cpu_budget, options.cpus_per_trial)
+    if not cpu_slots:
+        parser.error("--cpu-budget does not fit a single trial of --cpus-per-trial")
+
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, options.logging_level)
+    training_args += ["--logging-level", options.logging_level]
+
+    try:
+        search_space = load_search_space(options.search_space_file_path)
+    except ValueError as error:
+        parser.error(str(error))
+
+    os.makedirs(options.sweep_directory, exist_ok=True)
+    global_config.dataset_cache_directory = options.dataset_cache_directory
+    prepare_dataset_cache(training_args)
+
+    random_state = np.random.RandomState(options.seed)
+    trials = [Trial(trial_number, sample_model_config_overrides(search_space, random_state))
+              for trial_number in range(options.num_trials)]
+    logger.info("Running {} trials, {} at a time".format(len(trials), len(cpu_slots)))
+
+    run_sweep(trials, training_args, cpu_slots, options.cpus_per_trial,
+              SuccessiveHalvingPruner(options.min_epochs, options.reduction_factor), options.sweep_directory)
+    write_results(trials, options.sweep_directory)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
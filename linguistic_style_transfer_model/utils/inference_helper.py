@@ -0,0 +1,166 @@
+import sys
+
+import json
+import logging
+import numpy as np
+import os
+import pickle
+import tensorflow as tf
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.models import adversarial_autoencoder
+from linguistic_style_transfer_model.utils import bpe_tokenizer, checkpoint_writer, data_processor, \
+    tf_session_helper, word_embedder
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def load_inference_artifacts(saved_model_path):
+    # subwords come first, so that a saved sequence length replaces their default one
+    bpe_merges_file_path = os.path.join(saved_model_path, global_config.bpe_merges_file)
+    if os.path.exists(bpe_merges_file_path):
+        bpe_tokenizer.configure_subword_tokenization(bpe_merges_file_path)
+
+    with open(os.path.join(saved_model_path,
+                           global_config.model_config_file), 'r') as json_file:
+        model_config_dict = json.load(json_file)
+        mconf.init_from_dict(model_config_dict)
+        logger.info("Restored model config from saved JSON")
+
+    with open(os.path.join(saved_model_path,
+                           global_config.vocab_save_file), 'r') as json_file:
+        word_index = json.load(json_file)
+    with open(os.path.join(saved_model_path,
+                           global_config.index_to_label_dict_file), 'r') as json_file:
+        index_to_label_map = json.load(json_file)
+    with open(os.path.join(saved_model_path,
+                           global_config.average_label_embeddings_file), 'rb') as pickle_file:
+        average_label_embeddings = pickle.load(pickle_file)
+
+    global_config.vocab_size = len(word_index)
+
+    return [word_index, index_to_label_map, average_label_embeddings]
+
+
+def configure_decoding(beam_width=None, length_penalty_weight=None, sampling=None,
+                       sampling_temperature=None, sampling_top_k=None, sampling_top_p=None,
+                       shortlist_size=None, shortlist_comparison=None,
+                       max_decode_length_ratio=None, max_decode_length_slack=None):
+    # arguments left as None keep the current setting
+    if beam_width is not None:
+        global_config.beam_width = beam_width
+    if length_penalty_weight is not None:
+        global_config.length_penalty_weight = length_penalty_weight
+    if sampling is not None:
+        global_config.sampling = sampling
+    if sampling_temperature is not None:
+        global_config.sampling_temperature = sampling_temperature
+    if sampling_top_k is not None:
+        global_config.sampling_top_k = sampling_top_k
+    if sampling_top_p is not None:
+        global_config.sampling_top_p = sampling_top_p
+    if shortlist_size is not None:
+        global_config.shortlist_size = shortlist_size
+    if shortlist_comparison is not None:
+        global_config.shortlist_comparison = shortlist_comparison
+    if max_decode_length_ratio is not None:
+        global_config.max_decode_length_ratio = max_decode_length_ratio
+    if max_decode_length_slack is not None:
+        global_config.max_decode_length_slack = max_decode_length_slack
+
+
+def get_decoding_config():
+    return {
+        "beam_width": global_config.beam_width,
+        "length_penalty_weight": global_config.length_penalty_weight,
+        "sampling": global_config.sampling,
+        "sampling_temperature": global_config.sampling_temperature,
+        "sampling_top_k": global_config.sampling_top_k,
+        "sampling_top_p": global_config.sampling_top_p,
+        "shortlist_size": global_config.shortlist_size,
+        "shortlist_comparison": global_config.shortlist_comparison,
+        "max_decode_length_ratio": global_config.max_decode_length_ratio,
+        "max_decode_length_slack": global_config.max_decode_length_slack,
+    }
+
+
+def get_text_tokenizer(word_index):
+    if global_config.bpe_merges_file_path:
+        text_tokenizer = bpe_tokenizer.SubwordTokenizer(
+            bpe_tokenizer.load_merges(global_config.bpe_merges_file_path))
+    else:
+        text_tokenizer = tf.keras.preprocessing.text.Tokenizer(
+            num_words=global_config.vocab_size, filters=global_config.tokenizer_filters)
+    text_tokenizer.word_index = word_index
+
+    return text_tokenizer
+
+
+def restore_inference_network(saved_model_path, weight_getter=None):
+    [word_index, index_to_label_map, average_label_embeddings] = \
+        load_inference_artifacts(saved_model_path)
+    num_labels = len(index_to_label_map)
+    data_processor.populate_word_blacklist(word_index)
+
+    logger.info("Building model architecture ...")
+    network = adversarial_autoencoder.AdversarialAutoencoder()
+    encoder_embedding_matrix, decoder_embedding_matrix = \
+        word_embedder.get_word_embeddings(None, word_index)
+    if weight_getter is None:
+        network.build_model(
+            word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels)
+    else:
+        # the graph reads its weights through the custom getter, so there are no variables to restore
+        with tf.variable_scope(tf.get_variable_scope(), custom_getter=weight_getter):
+            network.build_model(
+                word_index, encoder_embedding_matrix, decoder_embedding_matrix, num_labels)
+
+    sess = tf_session_helper.get_tensorflow_session()
+    if weight_getter is None:
+        network.restore_model(sess, checkpoint_writer.get_latest_checkpoint_path(saved_model_path))
+
+    return [network, sess, word_index, index_to_label_map, average_label_embeddings]
+
+
+def write_transformed_text(network, sess, text_file, output_file, word_index,
+                           style_embedding, num_labels):
+    text_tokenizer = get_text_tokenizer(word_index)
+    inverse_word_index = {v: k for k, v in word_index.items()}
+
+    num_transformed = 0
+    sequence_batches = data_processor.stream_test_sequences(
+        text_file, text_tokenizer, word_index, mconf.batch_size)
+    for _, generated_sequences, final_sequence_lengths in \
+            network.transform_sentence_stream(sess, sequence_batches, style_embedding, num_labels):
+        trimmed_generated_sequences = data_processor.trim_generated_sequences(
+            generated_sequences, final_sequence_lengths)
+        for sequence in trimmed_generated_sequences:
+            output_file.write(" ".join(
+                data_processor.generate_words_from_indices(sequence, inverse_word_index)) + "\n")
+        output_file.flush()
+
+        num_transformed += len(generated_sequences)
+        logger.debug("Transformed {} sentences".format(num_transformed))
+
+    return num_transformed
+
+
+def stream_transformed_text(saved_model_path, label_index, text_file_path=None):
+    """Transforms the sentences of a file, or of stdin, to a style and writes them to stdout batch by batch"""
+    [network, sess, word_index, index_to_label_map, average_label_embeddings] = \
+        restore_inference_network(saved_model_path)
+
+    style_embedding = np.asarray(average_label_embeddings[label_index])
+    logger.info("Streaming transformation to style {}".format(index_to_label_map[str(label_index)]))
+
+    text_file = open(text_file_path) if text_file_path else sys.stdin
+    try:
+        num_transformed = write_transformed_text(
+            network, sess, text_file, sys.stdout, word_index, style_embedding, len(index_to_label_map))
+    finally:
+        if text_file is not sys.stdin:
+            text_file.close()
+        sess.close()
+
+    logger.info("Streamed {} transformed sentences".format(num_transformed))
@@ -0,0 +1,131 @@
+import functools
+import itertools
+import json
+import logging
+import numpy as np
+import os
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import file_helper, inference_helper, inference_pool
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def get_manifest_path(job_directory):
+    return os.path.join(job_directory, global_config.inference_job_manifest_file)
+
+
+def get_shard_path(job_directory, shards_folder, shard_name):
+    return os.path.join(job_directory, shards_folder, shard_name)
+
+
+def save_manifest(job_directory, manifest):
+    with file_helper.atomic_open(get_manifest_path(job_directory)) as manifest_file:
+        json.dump(obj=manifest, fp=manifest_file, indent=4, sort_keys=True)
+
+
+def create_input_shards(text_file_path, job_directory, shard_size):
+    os.makedirs(os.path.join(job_directory, global_config.inference_job_input_shards_folder), exist_ok=True)
+    os.makedirs(os.path.join(job_directory, global_config.inference_job_output_shards_folder), exist_ok=True)
+
+    shard_names = list()
+    with open(text_file_path) as text_file:
+        while True:
+            lines = list(itertools.islice(text_file, shard_size))
+            if not lines:
+                break
+            shard_name = global_config.inference_job_shard_file.format(len(shard_names))
+            with file_helper.atomic_open(get_shard_path(
+                    job_directory, global_config.inference_job_input_shards_folder, shard_name)) as shard_file:
+                shard_file.writelines(lines)
+            shard_names.append(shard_name)
+    logger.info("Split {} into {} shards".format(text_file_path, len(shard_names)))
+
+    return shard_names
+
+
+def initialize_job(options):
+    job_parameters = {
+        "text_file_path": os.path.abspath(options.evaluation_text_file_path),
+        "saved_model_path": os.path.abspath(options.saved_model_path),
+        "label_index": options.label_index,
+        "shard_size": options.shard_size,
+    }
+
+    manifest_path = get_manifest_path(options.job_directory)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["parameters"] != job_parameters:
+            raise Exception("Job directory {} was created with different parameters: {}".format(
+                options.job_directory, manifest["parameters"]))
+        logger.info("Resuming inference job from {}".format(manifest_path))
+        return manifest
+
+    # the manifest is only written once every input shard exists,
+    # so an interrupted split is simply redone on restart
+    shard_names = create_input_shards(
+        options.evaluation_text_file_path, options.job_directory, options.shard_size)
+    manifest = {
+        "parameters": job_parameters,
+        "shards": {shard_name: {"complete": False} for shard_name in shard_names}
+    }
+    save_manifest(options.job_directory, manifest)
+    logger.info("Created inference job manifest at {}".format(manifest_path))
+
+    return manifest
+
+
+def is_shard_complete(job_directory, manifest, shard_name):
+    return manifest["shards"][shard_name]["complete"] and os.path.exists(get_shard_path(
+        job_directory, global_config.inference_job_output_shards_folder, shard_name))
+
+
+def transform_shard(job_directory, label_index, shard_name):
+    input_shard_path = get_shard_path(
+        job_directory, global_config.inference_job_input_shards_folder, shard_name)
+    output_shard_path = get_shard_path(
+        job_directory, global_config.inference_job_output_shards_folder, shard_name)
+
+    worker_state = inference_pool.worker_state
+    style_embedding = np.asarray(worker_state["average_label_embeddings"][label_index])
+    with open(input_shard_path) as text_file, file_helper.atomic_open(output_shard_path) as output_file:
+        num_transformed = inference_helper.write_transformed_text(
+            worker_state["network"], worker_state["sess"], text_file, output_file,
+            worker_state["word_index"], style_embedding, worker_state["num_labels"])
+
+    return shard_name, num_transformed
+
+
+def record_shard_results(job_directory, manifest, shard_results):
+    # only the parent process writes the manifest, so workers never race on it
+    for shard_name, num_transformed in shard_results:
+        manifest["shards"][shard_name] = {"complete": True, "num_sentences": num_transformed}
+        save_manifest(job_directory, manifest)
+        logger.info("Completed shard {} ({} sentences)".format(shard_name, num_transformed))
+
+
+def run_inference_job(options):
+    manifest = initialize_job(options)
+
+    pending_shard_names = [
+        shard_name for shard_name in sorted(manifest["shards"])
+        if not is_shard_complete(options.job_directory, manifest, shard_name)]
+    logger.info("{} of {} shards pending".format(len(pending_shard_names), len(manifest["shards"])))
+    if not pending_shard_names:
+        return
+
+    shard_transformer = functools.partial(transform_shard, options.job_directory, options.label_index)
+    num_workers = min(options.workers, len(pending_shard_names))
+    if num_workers == 1:
+        inference_pool.load_worker_state(options.saved_model_path)
+        record_shard_results(options.job_directory, manifest, map(shard_transformer, pending_shard_names))
+        inference_pool.worker_state["sess"].close()
+    else:
+        with inference_pool.create_worker_pool(
+                options.saved_model_path, num_workers, options.logging_level) as pool:
+            record_shard_results(options.job_directory, manifest,
+                                 pool.imap_unordered(shard_transformer, pending_shard_names))
+
+    logger.info("Inference job complete. Output shards are in {}".format(os.path.join(
+        options.job_directory, global_config.inference_job_output_shards_folder)))
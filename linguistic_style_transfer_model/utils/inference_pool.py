@@ -0,0 +1,182 @@
+import json
+import logging
+import multiprocessing
+import numpy as np
+import os
+import tensorflow as tf
+from tensorflow.python.ops import gen_array_ops
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import checkpoint_writer, file_helper, inference_helper, \
+    log_initializer, tf_session_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+# per-process model state, restored once by each worker before it receives any work
+worker_state = dict()
+
+
+def get_worker_session_config(num_workers):
+    # split the cores between workers instead of letting every session claim all of them
+    session_config = tf_session_helper.get_session_config()
+    if not session_config["intra_op_parallelism_threads"]:
+        session_config["intra_op_parallelism_threads"] = \
+            max(1, tf_session_helper.get_available_cpu_count() // num_workers)
+    if not session_config["inter_op_parallelism_threads"]:
+        session_config["inter_op_parallelism_threads"] = 1
+
+    return session_config
+
+
+def export_shared_weights(saved_model_path):
+    """
+    Writes the weights of the latest checkpoint of a model folder as raw files, which every inference worker
+    maps read-only instead of restoring a copy of its own, so that the page cache holds them once for all workers.
+    Optimizer slots are left out. Returns the folder of the files, which is only written once per checkpoint.
+    """
+    checkpoint_path = checkpoint_writer.get_latest_checkpoint_path(saved_model_path)
+    shared_weights_directory = os.path.join(saved_model_path, "{}-{}".format(
+        global_config.shared_weights_folder, os.path.basename(checkpoint_path)))
+    shared_weights_index_path = os.path.join(shared_weights_directory, global_config.shared_weights_index_file)
+    if os.path.exists(shared_weights_index_path):
+        return shared_weights_directory
+
+    # the checkpoint is read without a session, so nothing of a tensorflow runtime is started in this process
+    checkpoint_reader = tf.train.load_checkpoint(checkpoint_path)
+    variable_shapes = checkpoint_reader.get_variable_to_shape_map()
+    variable_dtypes = checkpoint_reader.get_variable_to_dtype_map()
+
+    os.makedirs(shared_weights_directory, exist_ok=True)
+    shared_weights_index = dict()
+    for variable_name in sorted(variable_shapes):
+        # slots are named after the variable they belong to, e.g. dense/kernel/Adam
+        if any(variable_name.startswith(x + "/") for x in variable_shapes):
+            continue
+        weight_file = "{}.bin".format(len(shared_weights_index))
+        with file_helper.atomic_open(os.path.join(shared_weights_directory, weight_file), 'wb') as output_file:
+            checkpoint_reader.get_tensor(variable_name).tofile(output_file)
+        shared_weights_index[variable_name] = {
+            "file": weight_file,
+            "dtype": variable_dtypes[variable_name].name,
+            "shape": variable_shapes[variable_name],
+        }
+
+    # the index is written last, so that a folder is only reused once all of its weights are complete
+    with file_helper.atomic_open(shared_weights_index_path) as json_file:
+        json.dump(shared_weights_index, json_file)
+    logger.info("Exported {} shared weights to {}".format(len(shared_weights_index), shared_weights_directory))
+
+    return shared_weights_directory
+
+
+def get_shared_weight_getter(shared_weights_directory):
+    """
+    Returns a custom variable getter that maps each weight from its file in `shared_weights_directory`
+    instead of creating a variable for it.
+    """
+    with open(os.path.join(shared_weights_directory, global_config.shared_weights_index_file), 'r') as json_file:
+        shared_weights_index = json.load(json_file)
+    shared_weights = dict()
+
+    def get_shared_weight(getter, name, *args, **kwargs):
+        if name not in shared_weights_index:
+            raise Exception("{} has no weight named {}".format(shared_weights_directory, name))
+
+        if name not in shared_weights:
+            shared_weight = shared_weights_index[name]
+            # layers built inside a decoding loop or a conditional still map their weights outside of it
+            with tf.control_dependencies(None):
+                shared_weights[name] = gen_array_ops.immutable_const(
+                    dtype=tf.as_dtype(shared_weight["dtype"]), shape=shared_weight["shape"],
+                    memory_region_name=os.path.join(shared_weights_directory, shared_weight["file"]))
+
+        return shared_weights[name]
+
+    return get_shared_weight
+
+
+def load_worker_state(saved_model_path, shared_weights_directory=None):
+    weight_getter = None
+    if shared_weights_directory:
+        weight_getter = get_shared_weight_getter(shared_weights_directory)
+
+    [network, sess, word_index, index_to_label_map, average_label_embeddings] = \
+        inference_helper.restore_inference_network(saved_model_path, weight_getter)
+
+    worker_state["network"] = network
+    worker_state["sess"] = sess
+    worker_state["word_index"] = word_index
+    worker_state["num_labels"] = len(index_to_label_map)
+    worker_state["average_label_embeddings"] = average_label_embeddings
+
+
+def initialize_worker(saved_model_path, shared_weights_directory, session_config, decoding_config,
+                      inference_metrics_path, logging_level):
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, logging_level)
+    # spawned workers start from a fresh config module, so the parent's settings are replayed
+    tf_session_helper.configure_session(**session_config)
+    inference_helper.configure_decoding(**decoding_config)
+    global_config.inference_metrics_path = inference_metrics_path
+    load_worker_state(saved_model_path, shared_weights_directory)
+
+
+def create_worker_pool(saved_model_path, num_workers, logging_level):
+    session_config = get_worker_session_config(num_workers)
+    logger.info("Starting {} inference workers with session config {}".format(num_workers, session_config))
+
+    shared_weights_directory = export_shared_weights(saved_model_path)
+
+    # tensorflow runtimes are not fork-safe, so each worker builds its own graph, on the shared weights
+    context = multiprocessing.get_context("spawn")
+    return context.Pool(
+        processes=num_workers, initializer=initialize_worker,
+        initargs=(saved_model_path, shared_weights_directory, session_config,
+                  inference_helper.get_decoding_config(), global_config.inference_metrics_path, logging_level))
+
+
+def transform_slice(padded_sequences, text_sequence_lengths, style_embedding):
+    return worker_state["network"].run_transformation(
+        worker_state["sess"], padded_sequences, text_sequence_lengths, style_embedding,
+        worker_state["num_labels"])
+
+
+def get_slice_boundaries(data_size, num_slices):
+    # slices are aligned to whole batches so that only the last slice can end in a partial batch
+    num_batches = data_size // mconf.batch_size
+    if data_size % mconf.batch_size:
+        num_batches += 1
+    batches_per_slice = num_batches // num_slices
+    if num_batches % num_slices:
+        batches_per_slice += 1
+
+    boundaries = list()
+    for start_batch in range(0, num_batches, max(batches_per_slice, 1)):
+        boundaries.append((start_batch * mconf.batch_size,
+                           min((start_batch + batches_per_slice) * mconf.batch_size, data_size)))
+
+    return boundaries
+
+
+def transform_sentences(pool, num_workers, padded_sequences, text_sequence_lengths, style_embedding):
+    if pool is None:
+        # single worker mode: the model was restored in this process by `load_worker_state`
+        return transform_slice(padded_sequences, text_sequence_lengths, style_embedding)
+
+    padded_sequences = np.asarray(padded_sequences)
+    text_sequence_lengths = np.asarray(text_sequence_lengths)
+
+    # starmap returns results in submission order, so contiguous slices merge back in input order
+    slice_results = pool.starmap(
+        transform_slice,
+        [(padded_sequences[start_index:end_index], text_sequence_lengths[start_index:end_index],
+          style_embedding)
+         for (start_index, end_index) in get_slice_boundaries(len(padded_sequences), num_workers)])
+
+    merged_results = [list(), list(), list(), list(), list(), list()]
+    for slice_result in slice_results:
+        for merged_result, result in zip(merged_results, slice_result):
+            merged_result.extend(result)
+
+    return merged_results
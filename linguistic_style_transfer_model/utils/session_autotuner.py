@@ -0,0 +1,110 @@
+import sys
+
+import argparse
+import itertools
+import json
+import logging
+import multiprocessing
+import numpy as np
+import os
+import time
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import data_processor, file_helper, inference_helper, \
+    log_initializer, tf_session_helper
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def get_candidate_session_configs(include_xla_jit):
+    cpu_count = tf_session_helper.get_available_cpu_count()
+    intra_op_thread_counts = sorted({cpu_count, max(1, cpu_count // 2), max(1, cpu_count // 4), 1})
+    inter_op_thread_counts = [1, 2]
+    xla_jit_settings = [False, True] if include_xla_jit else [False]
+
+    return [
+        {
+            "intra_op_parallelism_threads": intra_op_threads,
+            "inter_op_parallelism_threads": inter_op_threads,
+            "use_xla_jit": use_xla_jit
+        }
+        for intra_op_threads, inter_op_threads, use_xla_jit in itertools.product(
+            intra_op_thread_counts, inter_op_thread_counts, xla_jit_settings)]
+
+
+def measure_throughput(saved_model_path, text_file_path, num_batches, session_config, logging_level):
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, logging_level)
+    tf_session_helper.configure_session(**session_config)
+
+    [network, sess, word_index, index_to_label_map, average_label_embeddings] = \
+        inference_helper.restore_inference_network(saved_model_path)
+    text_tokenizer = inference_helper.get_text_tokenizer(word_index)
+    with open(text_file_path) as text_file:
+        sequence_batches = list(itertools.islice(data_processor.stream_test_sequences(
+            text_file, text_tokenizer, word_index, mconf.batch_size), num_batches))
+
+    style_embedding = np.asarray(average_label_embeddings[0])
+    num_labels = len(index_to_label_map)
+
+    # warm up once so that graph optimization and allocations are not timed
+    list(network.transform_sentence_stream(sess, sequence_batches[:1], style_embedding, num_labels))
+
+    num_sentences = 0
+    start_time = time.time()
+    for _, generated_sequences, _ in \
+            network.transform_sentence_stream(sess, sequence_batches, style_embedding, num_labels):
+        num_sentences += len(generated_sequences)
+    elapsed_time = time.time() - start_time
+    sess.close()
+
+    return num_sentences / elapsed_time
+
+
+def autotune_session_config(saved_model_path, text_file_path, num_batches, include_xla_jit, logging_level):
+    # thread pools are process-wide in tensorflow, so every candidate runs in a fresh process
+    context = multiprocessing.get_context("spawn")
+
+    results = list()
+    for session_config in get_candidate_session_configs(include_xla_jit):
+        with context.Pool(processes=1) as pool:
+            throughput = pool.apply(
+                measure_throughput,
+                (saved_model_path, text_file_path, num_batches, session_config, logging_level))
+        logger.info("{:.1f} sentences/s with {}".format(throughput, session_config))
+        results.append((throughput, session_config))
+
+    best_throughput, best_session_config = max(results, key=lambda x: x[0])
+    logger.info("Best session config: {} ({:.1f} sentences/s)".format(best_session_config, best_throughput))
+
+    session_config_path = os.path.join(saved_model_path, global_config.session_config_file)
+    with file_helper.atomic_open(session_config_path) as json_file:
+        json.dump(obj=best_session_config, fp=json_file, indent=4)
+    logger.info("Recorded session config to {}".format(session_config_path))
+
+    return best_session_config
+
+
+def main(argv):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--saved-model-path", type=str, required=True)
+    parser.add_argument("--text-file-path", type=str, required=True)
+    parser.add_argument("--num-batches", type=int, default=20)
+    parser.add_argument("--include-xla-jit", action="store_true", default=False)
+    parser.add_argument("--cpu-affinity", type=str)
+    parser.add_argument("--logging-level", type=str, default="INFO")
+    options = vars(parser.parse_args(args=argv))
+
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, options['logging_level'])
+    # the affinity mask is inherited by the trial processes
+    tf_session_helper.configure_session(cpu_affinity=options['cpu_affinity'])
+
+    autotune_session_config(
+        options['saved_model_path'], options['text_file_path'], options['num_batches'],
+        options['include_xla_jit'], options['logging_level'])
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
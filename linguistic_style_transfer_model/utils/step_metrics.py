@@ -0,0 +1,95 @@
+import collections
+import contextlib
+import json
+import logging
+import numpy as np
+import os
+import tensorflow as tf
+import threading
+import time
+
+from linguistic_style_transfer_model.config import global_config
+
+logger = logging.getLogger(global_config.logger_name)
+
+summary_percentiles = [50, 90, 99]
+
+
+class StepMetrics:
+    """
+    Records the wall time of every step, split into named phases, along with its throughput.
+    Phases timed by concurrent threads, e.g. training worker threads, are summed over the threads.
+    Each step is appended to a JSONL file and can be written as TensorBoard scalars.
+    """
+
+    def __init__(self, name, metrics_file_path=None, summary_writer=None):
+        self.name = name
+        self.summary_writer = summary_writer
+        self.metrics_file = None
+        if metrics_file_path:
+            os.makedirs(os.path.dirname(metrics_file_path), exist_ok=True)
+            # line buffered, so that processes appending to the same file write whole records
+            self.metrics_file = open(metrics_file_path, 'a', buffering=1)
+
+        self.lock = threading.Lock()
+        self.records = list()
+        self.phase_times = collections.defaultdict(float)
+        self.step_start_time = time.perf_counter()
+
+    def start_step(self):
+        with self.lock:
+            self.phase_times = collections.defaultdict(float)
+            self.step_start_time = time.perf_counter()
+
+    @contextlib.contextmanager
+    def time_phase(self, phase):
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.phase_times[phase] += time.perf_counter() - start_time
+
+    def end_step(self, step, num_examples, num_tokens, write_summary=False):
+        wall_time = time.perf_counter() - self.step_start_time
+
+        record = collections.OrderedDict([("name", self.name), ("step", int(step)), ("wall_time", wall_time)])
+        with self.lock:
+            for phase, phase_time in sorted(self.phase_times.items()):
+                record[phase + "_time"] = phase_time
+        record["examples_per_second"] = num_examples / wall_time
+        record["tokens_per_second"] = num_tokens / wall_time
+        self.records.append(record)
+
+        if self.metrics_file is not None:
+            self.metrics_file.write(json.dumps(record) + "\n")
+
+        if self.summary_writer is not None and write_summary:
+            self.summary_writer.add_summary(
+                tf.Summary(value=[
+                    tf.Summary.Value(tag="{}/{}".format(self.name, key), simple_value=value)
+                    for key, value in record.items() if key not in ["name", "step"]]),
+                step)
+
+    def log_summary(self):
+        if not self.records:
+            return
+
+        metrics = [key for key in self.records[0] if key not in ["name", "step"]]
+        for record in self.records:
+            metrics.extend(key for key in record if key not in metrics and key not in ["name", "step"])
+
+        header = "{:<28}".format("metric") + "".join(
+            "{:>14}".format(x) for x in ["mean"] + ["p{}".format(x) for x in summary_percentiles] + ["max"])
+        rows = [header]
+        for metric in metrics:
+            values = np.asarray([record.get(metric, 0.0) for record in self.records])
+            rows.append("{:<28}".format(metric) + "".join(
+                "{:>14.4f}".format(x) for x in
+                [np.mean(values)] + list(np.percentile(values, summary_percentiles)) + [np.max(values)]))
+
+        logger.info("{} metrics over {} steps:\n{}".format(self.name, len(self.records), "\n".join(rows)))
+
+    def close(self):
+        if self.metrics_file is not None:
+            self.metrics_file.close()
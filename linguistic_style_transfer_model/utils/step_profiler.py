@@ -0,0 +1,143 @@
+import collections
+import logging
+import os
+import re
+import tensorflow as tf
+import threading
+
+from tensorflow.python.client import timeline
+
+from linguistic_style_transfer_model.config import global_config
+
+logger = logging.getLogger(global_config.logger_name)
+
+# the first matching pattern assigns an op to a part of the model, gradient ops are reported separately
+model_components = [
+    ("optimizers", re.compile(r"(^|/)(Adam|RMSProp|sync_replicas)[^/]*/")),
+    ("adversaries", re.compile(r"(style|content)_adversary")),
+    ("projection", re.compile(r"sequence_prediction/.*/(dense|shortlist_projection)[^/]*/")),
+    ("decoder while loop", re.compile(r"sequence_prediction/.*/while/")),
+    ("decoder", re.compile(r"sequence_prediction/")),
+    ("encoder", re.compile(r"(^|/)(sentence_embedding|style_embedding|content_embedding|embeddings)[^/]*/")),
+    ("multitask and reconstruction losses", re.compile(r"(multitask_objectives|reconstruction_loss)/")),
+]
+op_type_pattern = re.compile(r"= (\w+)\(")
+report_size = 40
+
+
+def parse_profile_steps(profile_steps):
+    """Parses "START:END" into the half-open range of step numbers to profile"""
+    start_step, end_step = [int(x) for x in profile_steps.split(":")]
+    if start_step < 0 or end_step <= start_step:
+        raise ValueError("Invalid profile steps: {}".format(profile_steps))
+
+    return [start_step, end_step]
+
+
+def get_model_component(node_name):
+    component_prefix = ""
+    if node_name.startswith("gradients"):
+        component_prefix = "backward: "
+        node_name = node_name.split("/", 1)[-1]
+
+    for component, pattern in model_components:
+        if pattern.search(node_name):
+            return component_prefix + component
+
+    return component_prefix + "other"
+
+
+class StepProfiler:
+    """
+    Traces the session runs of steps `start_step` to `end_step - 1`, counted from 0 as `start_step` is called.
+    Every traced run is written as a Chrome trace, and the op times of the whole window are aggregated
+    into a report once it closes. Outside the window, runs are passed straight to the session.
+    """
+
+    def __init__(self, profile_steps, profile_directory):
+        self.start_step_number, self.end_step_number = profile_steps or [0, 0]
+        self.profile_directory = profile_directory
+        self.step_number = -1
+        self.active = False
+        self.reported = False
+        self.num_profiled_steps = 0
+
+        self.lock = threading.Lock()
+        self.step_run_metadata = list()
+        self.op_times = collections.defaultdict(int)
+        self.op_counts = collections.defaultdict(int)
+        self.op_types = dict()
+
+    def start_step(self):
+        self.step_number += 1
+        self.active = self.start_step_number <= self.step_number < self.end_step_number
+        if self.active and self.step_number == self.start_step_number:
+            os.makedirs(self.profile_directory, exist_ok=True)
+            logger.info("Profiling steps {} to {}".format(self.start_step_number, self.end_step_number - 1))
+
+    def run(self, sess, fetches, feed_dict):
+        if not self.active:
+            return sess.run(fetches=fetches, feed_dict=feed_dict)
+
+        run_metadata = tf.RunMetadata()
+        results = sess.run(
+            fetches=fetches, feed_dict=feed_dict,
+            options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE), run_metadata=run_metadata)
+        with self.lock:
+            self.step_run_metadata.append(run_metadata)
+
+        return results
+
+    def end_step(self):
+        if not self.active:
+            return
+        self.active = False
+        self.num_profiled_steps += 1
+
+        for run_number, run_metadata in enumerate(self.step_run_metadata):
+            trace_file_path = os.path.join(
+                self.profile_directory, "timeline_step_{:05d}_{}.json".format(self.step_number, run_number))
+            with open(trace_file_path, 'w') as trace_file:
+                trace_file.write(timeline.Timeline(run_metadata.step_stats).generate_chrome_trace_format())
+
+            for device_stats in run_metadata.step_stats.dev_stats:
+                for node_stats in device_stats.node_stats:
+                    self.op_times[node_stats.node_name] += node_stats.all_end_rel_micros
+                    self.op_counts[node_stats.node_name] += 1
+                    if node_stats.node_name not in self.op_types:
+                        op_type = op_type_pattern.search(node_stats.timeline_label)
+                        self.op_types[node_stats.node_name] = op_type.group(1) if op_type else ""
+        self.step_run_metadata = list()
+
+        if self.step_number == self.end_step_number - 1:
+            self.write_report()
+
+    def close(self):
+        # reports a window cut short by the end of the run
+        if self.op_times and not self.reported:
+            self.write_report()
+
+    def write_report(self):
+        self.reported = True
+        total_time = max(sum(self.op_times.values()), 1)
+        component_times = collections.defaultdict(int)
+        for node_name, op_time in self.op_times.items():
+            component_times[get_model_component(node_name)] += op_time
+
+        component_rows = ["{:<48}{:>14}{:>14}{:>10}".format("component", "total ms", "ms/step", "share")]
+        for component, op_time in sorted(component_times.items(), key=lambda x: -x[1]):
+            component_rows.append("{:<48}{:>14.2f}{:>14.2f}{:>10.1%}".format(
+                component, op_time / 1000, op_time / 1000 / self.num_profiled_steps, op_time / total_time))
+
+        op_rows = ["{:<96}{:<24}{:>8}{:>14}{:>10}".format("op", "type", "runs", "total ms", "share")]
+        for node_name, op_time in sorted(self.op_times.items(), key=lambda x: -x[1])[:report_size]:
+            op_rows.append("{:<96}{:<24}{:>8}{:>14.2f}{:>10.1%}".format(
+                node_name, self.op_types[node_name], self.op_counts[node_name], op_time / 1000,
+                op_time / total_time))
+
+        report = "\n".join(component_rows) + "\n\n" + "\n".join(op_rows) + "\n"
+        report_file_path = os.path.join(self.profile_directory, "op_report.txt")
+        with open(report_file_path, 'w') as report_file:
+            report_file.write(report)
+        logger.info("Op times of {} profiled steps by model component, see {} for the slowest ops:\n{}".format(
+            self.num_profiled_steps, report_file_path, "\n".join(component_rows)))
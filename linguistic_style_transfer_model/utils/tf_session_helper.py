@@ -1,10 +1,106 @@
+import json
+import logging
+import os
 import tensorflow as tf
 
+from linguistic_style_transfer_model.config import global_config
+
+logger = logging.getLogger(global_config.logger_name)
+
+
+def parse_cpu_affinity(cpu_affinity):
+    """
+    Parses a CPU list such as "0-3,8,10-11" into a set of CPU ids.
+    """
+    cpu_ids = set()
+    for cpu_range in cpu_affinity.split(","):
+        cpu_range = cpu_range.strip()
+        if not cpu_range:
+            continue
+        if "-" in cpu_range:
+            first_cpu, last_cpu = cpu_range.split("-")
+            cpu_ids.update(range(int(first_cpu), int(last_cpu) + 1))
+        else:
+            cpu_ids.add(int(cpu_range))
+
+    return cpu_ids
+
+
+def get_available_cpu_count():
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count()
+
+
+def set_cpu_affinity(cpu_affinity):
+    if not hasattr(os, "sched_setaffinity"):
+        logger.warning("CPU affinity is not supported on this platform, ignoring {}".format(cpu_affinity))
+        return
+
+    # tensorflow thread pools inherit the affinity of the thread that creates them
+    os.sched_setaffinity(0, parse_cpu_affinity(cpu_affinity))
+    logger.info("Pinned process to CPUs {}".format(sorted(os.sched_getaffinity(0))))
+
+
+def configure_session(intra_op_parallelism_threads=None, inter_op_parallelism_threads=None,
+                      cpu_affinity=None, use_xla_jit=None):
+    # arguments left as None keep the current setting
+    if intra_op_parallelism_threads is not None:
+        global_config.intra_op_parallelism_threads = intra_op_parallelism_threads
+    if inter_op_parallelism_threads is not None:
+        global_config.inter_op_parallelism_threads = inter_op_parallelism_threads
+    if cpu_affinity:
+        global_config.cpu_affinity = cpu_affinity
+        set_cpu_affinity(cpu_affinity)
+    if use_xla_jit is not None:
+        global_config.use_xla_jit = use_xla_jit
+
+
+def get_session_config():
+    return {
+        "intra_op_parallelism_threads": global_config.intra_op_parallelism_threads,
+        "inter_op_parallelism_threads": global_config.inter_op_parallelism_threads,
+        "cpu_affinity": global_config.cpu_affinity,
+        "use_xla_jit": global_config.use_xla_jit,
+    }
+
+
+def load_session_config(saved_model_path):
+    session_config_path = os.path.join(saved_model_path, global_config.session_config_file)
+    if not os.path.exists(session_config_path):
+        return dict()
+
+    with open(session_config_path, 'r') as json_file:
+        session_config = json.load(json_file)
+    logger.info("Loaded tuned session config: {}".format(session_config))
+
+    return session_config
+
+
+def add_session_arguments(parser):
+    parser.add_argument("--intra-op-parallelism-threads", type=int)
+    parser.add_argument("--inter-op-parallelism-threads", type=int)
+    parser.add_argument("--cpu-affinity", type=str)
+    parser.add_argument("--xla-jit", action="store_true", default=None)
+
+
+def get_config_proto(intra_op_parallelism_threads=None, inter_op_parallelism_threads=None):
+    if intra_op_parallelism_threads is None:
+        intra_op_parallelism_threads = global_config.intra_op_parallelism_threads
+    if inter_op_parallelism_threads is None:
+        inter_op_parallelism_threads = global_config.inter_op_parallelism_threads
 
-def get_tensorflow_session():
     gpu_options = tf.GPUOptions(allow_growth=True)
     config_proto = tf.ConfigProto(
         log_device_placement=False, allow_soft_placement=True,
-        gpu_options=gpu_options)
+        gpu_options=gpu_options,
+        intra_op_parallelism_threads=intra_op_parallelism_threads,
+        inter_op_parallelism_threads=inter_op_parallelism_threads)
+    if global_config.use_xla_jit:
+        config_proto.graph_options.optimizer_options.global_jit_level = tf.OptimizerOptions.ON_1
+
+    return config_proto
+
 
-    return tf.Session(config=config_proto)
+def get_tensorflow_session(intra_op_parallelism_threads=None, inter_op_parallelism_threads=None):
+    return tf.Session(config=get_config_proto(intra_op_parallelism_threads, inter_op_parallelism_threads))
@@ -0,0 +1,114 @@
+import sys
+
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import time
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import log_initializer
+
+logger = logging.getLogger(global_config.logger_name)
+
+main_file_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+poll_seconds = 5
+
+
+def read_step_records(training_metrics_path):
+    if not os.path.exists(training_metrics_path):
+        return list()
+
+    with open(training_metrics_path) as training_metrics_file:
+        # a line without its newline is still being written
+        return [json.loads(x) for x in training_metrics_file.readlines() if x.endswith("\n")]
+
+
+def get_examples_per_second(step_records):
+    """Throughput over a run of steps, i.e. their examples divided by their summed wall time"""
+    num_examples = sum(x["examples_per_second"] * x["wall_time"] for x in step_records)
+
+    return num_examples / sum(x["wall_time"] for x in step_records)
+
+
+def measure_training_throughput(training_args, training_workers, warmup_steps, num_steps, benchmark_directory):
+    """
+    Trains with `training_workers` worker threads until `warmup_steps + num_steps` steps are recorded,
+    then stops the run with SIGTERM. Returns the examples/s of the steps after the warm-up, or None.
+    """
+    experiment_name = "{}-benchmark-workers-{}".format(global_config.experiment_timestamp, training_workers)
+    training_metrics_path = global_config.training_metrics_path.replace(
+        global_config.experiment_timestamp, experiment_name)
+    command = [sys.executable, "-u", main_file_path, "--train-model"] + training_args + [
+        "--experiment-name", experiment_name, "--training-workers", str(training_workers)]
+
+    log_file_path = os.path.join(benchmark_directory, "workers-{}.log".format(training_workers))
+    with open(log_file_path, 'w') as log_file:
+        process = subprocess.Popen(command, stdout=log_file, stderr=subprocess.STDOUT)
+        while process.poll() is None:
+            time.sleep(poll_seconds)
+            if len(read_step_records(training_metrics_path)) >= warmup_steps + num_steps:
+                process.send_signal(signal.SIGTERM)
+                process.wait()
+
+    step_records = read_step_records(training_metrics_path)[warmup_steps: warmup_steps + num_steps]
+    if not step_records:
+        logger.error("The run with {} workers recorded no steps after the warm-up, see {}".format(
+            training_workers, log_file_path))
+        return None
+
+    return get_examples_per_second(step_records)
+
+
+def benchmark_training_workers(training_args, training_worker_counts, warmup_steps, num_steps,
+                               benchmark_directory):
+    results = list()
+    for training_workers in training_worker_counts:
+        logger.info("Training with {} workers ...".format(training_workers))
+        results.append((training_workers, measure_training_throughput(
+            training_args, training_workers, warmup_steps, num_steps, benchmark_directory)))
+
+    baseline_throughput = results[0][1]
+    table_rows = ["{:>10}{:>16}{:>12}".format("workers", "examples/s", "speedup")]
+    for training_workers, throughput in results:
+        if throughput is None:
+            table_rows.append("{:>10}{:>16}{:>12}".format(training_workers, "failed", ""))
+        elif baseline_throughput is None:
+            table_rows.append("{:>10}{:>16.1f}{:>12}".format(training_workers, throughput, ""))
+        else:
+            table_rows.append("{:>10}{:>16.1f}{:>11.2f}x".format(
+                training_workers, throughput, throughput / baseline_throughput))
+    logger.info("Training throughput over {} steps after {} warm-up steps:\n{}".format(
+        num_steps, warmup_steps, "\n".join(table_rows)))
+
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Arguments not listed here are passed to every training run of main.py")
+    parser.add_argument("--training-worker-counts", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--warmup-steps", type=int, default=5)
+    parser.add_argument("--num-steps", type=int, default=50)
+    parser.add_argument("--benchmark-directory", type=str, default="output/{}-training-benchmark".format(
+        global_config.experiment_timestamp))
+    parser.add_argument("--logging-level", type=str, default="INFO")
+    [options, training_args] = parser.parse_known_args(args=argv)
+
+    if min(options.training_worker_counts) < 1 or options.warmup_steps < 0 or options.num_steps < 1:
+        parser.error("--training-worker-counts and --num-steps must be at least 1, --warmup-steps at least 0")
+
+    global logger
+    logger = log_initializer.setup_custom_logger(global_config.logger_name, options.logging_level)
+    training_args += ["--logging-level", options.logging_level]
+
+    os.makedirs(options.benchmark_directory, exist_ok=True)
+    benchmark_training_workers(
+        training_args, options.training_worker_counts, options.warmup_steps, options.num_steps,
+        options.benchmark_directory)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,7 @@
 import logging
 
 import gensim
+import numpy as np
 
 from linguistic_style_transfer_model.config import global_config
 
@@ -29,3 +30,24 @@ def add_word_vectors_to_embeddings(word_index, encoder_embedding_matrix, decoder
     del embedding_model
 
     return encoder_embedding_matrix, decoder_embedding_matrix
+
+
+def get_word_embeddings(embedding_model_path, word_index):
+    encoder_embedding_matrix = np.random.uniform(
+        size=(global_config.vocab_size, global_config.embedding_size),
+        low=-0.05, high=0.05).astype(dtype=np.float32)
+    logger.debug("encoder_embedding_matrix: {}".format(encoder_embedding_matrix.shape))
+
+    decoder_embedding_matrix = np.random.uniform(
+        size=(global_config.vocab_size, global_config.embedding_size),
+        low=-0.05, high=0.05).astype(dtype=np.float32)
+    logger.debug("decoder_embedding_matrix: {}".format(decoder_embedding_matrix.shape))
+
+    if embedding_model_path:
+        logger.info("Loading pretrained embeddings")
+        encoder_embedding_matrix, decoder_embedding_matrix = \
+            add_word_vectors_to_embeddings(
+                word_index, encoder_embedding_matrix, decoder_embedding_matrix,
+                embedding_model_path)
+
+    return encoder_embedding_matrix, decoder_embedding_matrix
@@ -0,0 +1,54 @@
+#!/usr/bin/env bash
+
+# Starts a training cluster of local processes: one chief, NUM_PS_TASKS parameter servers and NUM_WORKERS workers.
+# All arguments are passed to every task, e.g. `./scripts/run_local_cluster.sh --train-model ... --sync-replicas`
+# The other tasks are stopped when the chief exits.
+
+PROJECT_DIR_PATH="$PWD/$(dirname $0)/../"
+cd ${PROJECT_DIR_PATH}
+
+NUM_PS_TASKS=${NUM_PS_TASKS:-1}
+NUM_WORKERS=${NUM_WORKERS:-1}
+BASE_PORT=${BASE_PORT:-2222}
+CLUSTER_LOG_DIRECTORY=${CLUSTER_LOG_DIRECTORY:-"./cluster-logs"}
+
+get_hosts() {
+    local first_port=$1
+    local num_hosts=$2
+    local hosts=""
+    for ((i = 0; i < num_hosts; i++)); do
+        hosts="${hosts}${hosts:+, }\"localhost:$((first_port + i))\""
+    done
+    echo "[${hosts}]"
+}
+
+CLUSTER_SPEC="{\"chief\": $(get_hosts ${BASE_PORT} 1), \
+\"ps\": $(get_hosts $((BASE_PORT + 1)) ${NUM_PS_TASKS}), \
+\"worker\": $(get_hosts $((BASE_PORT + 1 + NUM_PS_TASKS)) ${NUM_WORKERS})}"
+echo "Cluster spec: ${CLUSTER_SPEC}"
+
+mkdir -p ${CLUSTER_LOG_DIRECTORY}
+TASK_PIDS=()
+trap 'kill ${TASK_PIDS[@]} 2> /dev/null' EXIT
+
+start_task() {
+    local job_name=$1
+    local task_index=$2
+    shift 2
+    PYTHONPATH=${PROJECT_DIR_PATH} \
+    python -u linguistic_style_transfer_model/main.py "$@" \
+    --cluster-spec "${CLUSTER_SPEC}" --job-name ${job_name} --task-index ${task_index} \
+    > ${CLUSTER_LOG_DIRECTORY}/${job_name}-${task_index}.log 2>&1 &
+    TASK_PIDS+=($!)
+}
+
+for ((task_index = 0; task_index < NUM_PS_TASKS; task_index++)); do
+    start_task ps ${task_index} "$@"
+done
+for ((task_index = 0; task_index < NUM_WORKERS; task_index++)); do
+    start_task worker ${task_index} "$@"
+done
+
+PYTHONPATH=${PROJECT_DIR_PATH} \
+python -u linguistic_style_transfer_model/main.py "$@" \
+--cluster-spec "${CLUSTER_SPEC}" --job-name chief --task-index 0
@@ -0,0 +1,56 @@
+import collections
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.utils import bpe_tokenizer
+
+word_counts = collections.Counter({"low": 5, "lower": 2, "newest": 6, "widest": 3, "wide": 1})
+
+
+def learn_merges_by_recounting(word_counts, num_merges, min_frequency):
+    """Reference implementation that recounts every pair after every merge"""
+    words = {word: list(word[:-1]) + [word[-1] + bpe_tokenizer.end_of_word_marker] for word in word_counts}
+    merges = list()
+    while len(merges) < num_merges:
+        pair_counts = collections.Counter()
+        for word, symbols in words.items():
+            for pair in zip(symbols, symbols[1:]):
+                pair_counts[pair] += word_counts[word]
+        if not pair_counts:
+            break
+        pair = min(pair_counts, key=lambda x: (-pair_counts[x], x))
+        if pair_counts[pair] < min_frequency:
+            break
+        merges.append(pair)
+        words = {word: bpe_tokenizer.merge_symbol_pair(symbols, pair, pair[0] + pair[1])
+                 for word, symbols in words.items()}
+
+    return merges
+
+
+def test_learn_merges_starts_with_the_most_frequent_pairs():
+    merges = bpe_tokenizer.learn_merges(word_counts, 3, 1)
+
+    assert merges == [("e", "s"), ("es", "t</w>"), ("l", "o")]
+
+
+def test_learn_merges_matches_recounting_every_pair():
+    assert bpe_tokenizer.learn_merges(word_counts, 100, 2) == learn_merges_by_recounting(word_counts, 100, 2)
+
+
+def test_learn_merges_stops_below_the_min_frequency():
+    merges = bpe_tokenizer.learn_merges(word_counts, 100, 7)
+
+    # after ("l", "o"), which occurs 7 times, no pair occurs more than 6 times
+    assert merges == [("e", "s"), ("es", "t</w>"), ("l", "o")]
+
+
+def test_subwords_merge_back_into_words():
+    tokenizer = bpe_tokenizer.SubwordTokenizer(bpe_tokenizer.learn_merges(word_counts, 4, 1))
+    words = ["lowest", "newer", "x"]
+
+    subwords = [subword for word in words for subword in tokenizer.encode_word(word)]
+
+    assert len(subwords) > len(words)
+    assert bpe_tokenizer.merge_subwords(subwords) == words
@@ -0,0 +1,49 @@
+import os
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import checkpoint_writer
+
+
+def save_checkpoints(checkpoint_directory, global_steps, max_to_keep):
+    with tf.Graph().as_default():
+        variables = [tf.Variable(initial_value=[1.0, 2.0], name="weights")]
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            checkpointer = checkpoint_writer.CheckpointWriter(
+                variables, os.path.join(checkpoint_directory, global_config.model_save_file), max_to_keep)
+            for global_step in global_steps:
+                checkpointer.save(
+                    sess, global_step, {global_config.vocab_save_file: {"a": 1}},
+                    {global_config.training_state_file: {"global_step": global_step}})
+            checkpointer.close()
+
+
+def test_training_states_are_kept_with_their_checkpoints(tmpdir):
+    save_checkpoints(str(tmpdir), [10, 20, 30], 2)
+
+    training_state_files = sorted(x for x in os.listdir(str(tmpdir)) if x.startswith("training_state"))
+    assert training_state_files == ["training_state-20.pkl", "training_state-30.pkl"]
+
+    [checkpoint_path, training_state] = checkpoint_writer.get_resumable_checkpoint(str(tmpdir))
+    assert checkpoint_path == os.path.join(str(tmpdir), global_config.model_save_file + "-30")
+    assert training_state["global_step"] == 30
+
+
+def test_a_checkpoint_without_its_training_state_falls_back_to_the_one_before(tmpdir):
+    save_checkpoints(str(tmpdir), [10, 20], 2)
+    # as if training had been stopped between saving the checkpoint and its training state
+    os.remove(checkpoint_writer.get_step_artifact_path(str(tmpdir), global_config.training_state_file, 20))
+
+    [checkpoint_path, training_state] = checkpoint_writer.get_resumable_checkpoint(str(tmpdir))
+    assert checkpoint_path == os.path.join(str(tmpdir), global_config.model_save_file + "-10")
+    assert training_state["global_step"] == 10
+
+
+def test_a_folder_without_training_states_is_not_resumable(tmpdir):
+    save_checkpoints(str(tmpdir), [10], 1)
+    os.remove(checkpoint_writer.get_step_artifact_path(str(tmpdir), global_config.training_state_file, 10))
+
+    assert checkpoint_writer.get_resumable_checkpoint(str(tmpdir)) is None
@@ -0,0 +1,38 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.utils import custom_decoder
+
+
+def test_latent_projection_cell_matches_the_gru_cell_fed_the_concatenated_latent_vector():
+    random_state = np.random.RandomState(0)
+    embedded_inputs = random_state.randn(2, 3).astype(np.float32)
+    latent_vector = random_state.randn(2, 4).astype(np.float32)
+    state = random_state.randn(2, 5).astype(np.float32)
+
+    with tf.Graph().as_default():
+        gru_cell = tf.nn.rnn_cell.GRUCell(num_units=5)
+        gru_output, gru_state = gru_cell(tf.constant(np.concatenate([embedded_inputs, latent_vector], axis=1)),
+                                         tf.constant(state))
+
+        latent_projection_cell = custom_decoder.LatentProjectionGRUCell(cell=gru_cell, latent_size=4)
+        latent_projection = latent_projection_cell.project_latent_vector(tf.constant(latent_vector))
+        projected_output, projected_state = latent_projection_cell(
+            tf.concat([tf.constant(embedded_inputs), latent_projection], axis=1), tf.constant(state))
+
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            [gru_output, gru_state, projected_output, projected_state] = sess.run(
+                [gru_output, gru_state, projected_output, projected_state])
+
+    # the wrapper shares the GRU cell's variables, so only the summation order differs
+    np.testing.assert_allclose(projected_output, gru_output, rtol=1e-5, atol=1e-6)
+    np.testing.assert_allclose(projected_state, gru_state, rtol=1e-5, atol=1e-6)
+
+
+def test_latent_projection_cell_requires_a_built_gru_cell():
+    with tf.Graph().as_default():
+        with pytest.raises(Exception):
+            custom_decoder.LatentProjectionGRUCell(cell=tf.nn.rnn_cell.GRUCell(num_units=5), latent_size=4)
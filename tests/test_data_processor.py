@@ -0,0 +1,113 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.config.model_config import mconf
+from linguistic_style_transfer_model.utils import data_processor
+
+
+def test_deduplicate_examples_counts_copies_of_the_same_sentence_and_label():
+    padded_sequences = np.asarray([[4, 5, 0], [6, 0, 0], [4, 5, 0], [4, 5, 0], [4, 5, 0]])
+    text_sequence_lengths = np.asarray([2, 1, 2, 2, 2])
+    one_hot_labels = np.asarray([[1, 0], [1, 0], [1, 0], [0, 1], [1, 0]])
+
+    [unique_sequences, unique_lengths, unique_labels, example_weights] = data_processor.deduplicate_examples(
+        padded_sequences, text_sequence_lengths, one_hot_labels)
+
+    # the same sentence with another label is a different example, and first occurrences keep their order
+    np.testing.assert_array_equal(unique_sequences, [[4, 5, 0], [6, 0, 0], [4, 5, 0]])
+    np.testing.assert_array_equal(unique_lengths, [2, 1, 2])
+    np.testing.assert_array_equal(unique_labels, [[1, 0], [1, 0], [0, 1]])
+    np.testing.assert_array_equal(example_weights, [3, 1, 1])
+    assert example_weights.dtype == np.float32
+
+
+def test_partial_average_label_embeddings_weigh_examples_by_their_copies():
+    style_embeddings = np.asarray([[0.0, 0.0], [4.0, 8.0], [1.0, 1.0]])
+    one_hot_labels = np.asarray([[1, 0], [1, 0], [1, 0]])
+
+    average_label_embeddings = data_processor.get_partial_average_label_embeddings(
+        style_embeddings, one_hot_labels, [3.0, 1.0, 0.0], {1: np.asarray([5.0, 5.0])})
+
+    np.testing.assert_allclose(average_label_embeddings[0], [1.0, 2.0])
+    # a label without embeddings in this epoch yet keeps its previous average
+    np.testing.assert_allclose(average_label_embeddings[1], [5.0, 5.0])
+
+
+def test_deduplicated_weights_reproduce_the_average_of_the_full_corpus():
+    style_embeddings = np.asarray([[1.0, 3.0], [2.0, 2.0], [1.0, 3.0], [1.0, 3.0]])
+    one_hot_labels = np.asarray([[0, 1]] * 4)
+
+    [_, _, unique_labels, example_weights] = data_processor.deduplicate_examples(
+        style_embeddings, np.asarray([2, 2, 2, 2]), one_hot_labels)
+    average_label_embeddings = data_processor.get_partial_average_label_embeddings(
+        np.asarray([[1.0, 3.0], [2.0, 2.0]]), unique_labels, example_weights, dict())
+
+    np.testing.assert_allclose(average_label_embeddings[1], np.mean(style_embeddings, axis=0))
+
+
+def test_covering_sequence_length_counts_the_eos_token():
+    # 8 of 10 sequences have at most 4 tokens
+    text_sequence_lengths = np.asarray([1, 2, 2, 3, 3, 3, 4, 4, 9, 12])
+
+    assert data_processor.get_covering_sequence_length(text_sequence_lengths, 80) == 5
+    assert data_processor.get_covering_sequence_length(text_sequence_lengths, 81) == 10
+    assert data_processor.get_covering_sequence_length(text_sequence_lengths, 100) == 13
+
+
+def test_covering_sequence_length_is_raised_to_the_minimum():
+    text_sequence_lengths = np.asarray([1, 1, 2, 2])
+
+    assert data_processor.get_covering_sequence_length(text_sequence_lengths, 50) == 2
+    assert data_processor.get_covering_sequence_length(text_sequence_lengths, 50, min_sequence_length=5) == 5
+
+
+def test_length_sorted_indices_keep_equal_lengths_in_file_order():
+    text_sequence_lengths = [5, 2, 7, 2, 5, 1]
+
+    np.testing.assert_array_equal(data_processor.get_length_sorted_indices(text_sequence_lengths), [5, 1, 3, 0, 4, 2])
+
+
+def test_restore_original_order_inverts_the_length_sort():
+    sentences = ["e", "bb", "ccccccc", "dd", "aaaaa", "f"]
+    text_sequence_lengths = [len(x) for x in sentences]
+
+    sorted_indices = data_processor.get_length_sorted_indices(text_sequence_lengths)
+    sorted_sentences = [sentences[x] for x in sorted_indices]
+
+    assert data_processor.restore_original_order(sorted_sentences, sorted_indices) == sentences
+
+
+def test_decode_length_caps_scale_with_the_input_and_stop_at_the_padded_length(monkeypatch):
+    monkeypatch.setattr(global_config, "max_decode_length_ratio", 1.5)
+    monkeypatch.setattr(global_config, "max_decode_length_slack", 2)
+    monkeypatch.setattr(mconf, "max_sequence_length", 12)
+
+    decode_length_caps = data_processor.get_decode_length_caps([1, 3, 6, 10])
+
+    np.testing.assert_array_equal(decode_length_caps, [4, 7, 11, 12])
+    assert decode_length_caps.dtype == np.int32
+
+
+def test_count_capped_sequences_ignores_rows_that_ended_with_eos():
+    eos_index = global_config.predefined_word_index[global_config.eos_token]
+    generated_sequences = [[5, 6, 7], [5, eos_index, 0], [5, 6, eos_index], [5, 0, 0]]
+
+    # the first row was cut off at its cap, the others ended or stopped short of it
+    assert data_processor.count_capped_sequences(generated_sequences, [3, 2, 3, 1], [3, 2, 3, 3]) == 1
+
+
+def test_sampled_bow_loss_indexes_the_bow_words_in_vocabulary_order(monkeypatch):
+    monkeypatch.setattr(global_config, "filter_sentiment_words", False)
+    monkeypatch.setattr(global_config, "filter_stopwords", False)
+    monkeypatch.setattr(mconf, "bow_sampled_loss", "sampled_softmax")
+    monkeypatch.setattr(global_config, "bow_size", None)
+    monkeypatch.setattr(data_processor, "bow_filtered_vocab_indices", dict())
+    word_index = {"the": 4, "song": 7, "a": 5, "love": 6}
+
+    data_processor.populate_word_blacklist(word_index)
+
+    assert data_processor.bow_filtered_vocab_indices == {4: 0, 5: 1, 6: 2, 7: 3}
+    assert global_config.bow_size == 4
@@ -0,0 +1,64 @@
+import pytest
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import early_stopping
+
+
+def test_stops_after_patience_validations_without_an_improvement():
+    stopping = early_stopping.EarlyStopping(patience=2, min_delta=0.0)
+
+    assert stopping.update(0.5)
+    assert not stopping.update(0.4)
+    assert not stopping.should_stop()
+    assert not stopping.update(0.5)
+    assert stopping.should_stop()
+
+
+def test_an_improvement_resets_the_count():
+    stopping = early_stopping.EarlyStopping(patience=2, min_delta=0.0)
+
+    for score, is_best in [(0.5, True), (0.4, False), (0.6, True), (0.6, False)]:
+        assert stopping.update(score) == is_best
+
+    assert stopping.best_score == 0.6
+    assert stopping.validations_without_improvement == 1
+    assert not stopping.should_stop()
+
+
+def test_gains_within_min_delta_do_not_count_as_improvements():
+    stopping = early_stopping.EarlyStopping(patience=1, min_delta=0.1)
+
+    stopping.update(0.5)
+    assert not stopping.update(0.55)
+    assert stopping.best_score == 0.5
+    assert stopping.should_stop()
+
+
+def test_a_patience_of_zero_never_stops():
+    stopping = early_stopping.EarlyStopping(patience=0, min_delta=0.0)
+
+    stopping.update(0.5)
+    for _ in range(10):
+        stopping.update(0.1)
+
+    assert not stopping.should_stop()
+
+
+def test_the_state_carries_over_to_a_resumed_run():
+    stopping = early_stopping.EarlyStopping(patience=2, min_delta=0.0)
+    stopping.update(0.5)
+    stopping.update(0.4)
+
+    resumed_stopping = early_stopping.EarlyStopping(2, 0.0, **stopping.get_state())
+    resumed_stopping.update(0.3)
+
+    assert resumed_stopping.best_score == 0.5
+    assert resumed_stopping.should_stop()
+
+
+def test_composite_score_is_the_weighted_mean_of_the_validation_scores(monkeypatch):
+    monkeypatch.setattr(global_config, "validation_score_weights",
+                        {"style-transfer": 2.0, "content-preservation": 1.0, "word-overlap": 1.0})
+    validation_record = {"style-transfer": 0.8, "content-preservation": 0.4, "word-overlap": 0.0, "epoch": 3}
+
+    assert early_stopping.get_composite_score(validation_record) == pytest.approx(0.5)
@@ -0,0 +1,45 @@
+import os
+import pickle
+import pytest
+
+from linguistic_style_transfer_model.utils import file_helper
+
+
+def test_atomic_open_replaces_the_file_on_success(tmpdir):
+    file_path = os.path.join(str(tmpdir), "vocab.json")
+    with open(file_path, 'w') as existing_file:
+        existing_file.write("old")
+
+    with file_helper.atomic_open(file_path) as new_file:
+        new_file.write("new")
+        # readers keep seeing the old contents until the write is complete
+        with open(file_path) as existing_file:
+            assert existing_file.read() == "old"
+
+    with open(file_path) as replaced_file:
+        assert replaced_file.read() == "new"
+    assert os.listdir(str(tmpdir)) == ["vocab.json"]
+
+
+def test_atomic_open_keeps_the_old_file_when_writing_fails(tmpdir):
+    file_path = os.path.join(str(tmpdir), "average_label_embeddings.pkl")
+    with open(file_path, 'wb') as existing_file:
+        pickle.dump({0: [1.0]}, existing_file)
+
+    with pytest.raises(RuntimeError):
+        with file_helper.atomic_open(file_path, 'wb') as new_file:
+            pickle.dump({0: [2.0]}, new_file)
+            raise RuntimeError("interrupted")
+
+    with open(file_path, 'rb') as existing_file:
+        assert pickle.load(existing_file) == {0: [1.0]}
+    assert os.listdir(str(tmpdir)) == ["average_label_embeddings.pkl"]
+
+
+def test_atomic_open_creates_a_missing_file(tmpdir):
+    file_path = os.path.join(str(tmpdir), "model_config.json")
+    with file_helper.atomic_open(file_path) as new_file:
+        new_file.write("{}")
+
+    with open(file_path) as created_file:
+        assert created_file.read() == "{}"
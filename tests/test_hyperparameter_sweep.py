@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.utils import hyperparameter_sweep
+
+
+def test_rungs_are_at_geometrically_spaced_epochs():
+    pruner = hyperparameter_sweep.SuccessiveHalvingPruner(min_epochs=2, reduction_factor=3)
+
+    assert [x for x in range(1, 20) if pruner.is_rung(x)] == [2, 6, 18]
+
+
+def test_trials_continue_between_rungs():
+    pruner = hyperparameter_sweep.SuccessiveHalvingPruner(min_epochs=1, reduction_factor=2)
+    pruner.report(1, 0.9)
+
+    assert pruner.report(3, 0.0)
+
+
+def test_only_the_top_fraction_of_a_rung_continues():
+    pruner = hyperparameter_sweep.SuccessiveHalvingPruner(min_epochs=1, reduction_factor=2)
+
+    # the first trial at a rung always continues, later ones are ranked against all scores reported so far
+    assert pruner.report(1, 0.5)
+    assert not pruner.report(1, 0.4)
+    assert pruner.report(1, 0.7)
+    assert not pruner.report(1, 0.45)
+    assert pruner.report(1, 0.6)
+
+
+def test_rungs_rank_their_scores_separately():
+    pruner = hyperparameter_sweep.SuccessiveHalvingPruner(min_epochs=1, reduction_factor=2)
+    pruner.report(1, 0.9)
+    pruner.report(2, 0.1)
+
+    assert not pruner.report(1, 0.2)
+    assert pruner.report(4, 0.2)
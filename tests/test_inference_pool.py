@@ -0,0 +1,46 @@
+import os
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.config import global_config
+from linguistic_style_transfer_model.utils import inference_pool
+
+kernel = np.arange(6, dtype=np.float32).reshape([2, 3])
+
+
+def save_checkpoint(saved_model_path):
+    with tf.Graph().as_default():
+        outputs = tf.layers.dense(
+            inputs=tf.ones(shape=[1, 2]), units=3, kernel_initializer=tf.constant_initializer(kernel), name="dense")
+        tf.train.AdamOptimizer().minimize(tf.reduce_sum(outputs))
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            tf.train.Saver().save(sess, os.path.join(saved_model_path, global_config.model_save_file), global_step=7)
+
+
+def test_exported_weights_leave_out_the_optimizer_slots(tmpdir):
+    save_checkpoint(str(tmpdir))
+
+    shared_weights_directory = inference_pool.export_shared_weights(str(tmpdir))
+
+    getter = inference_pool.get_shared_weight_getter(shared_weights_directory)
+    with pytest.raises(Exception):
+        getter(None, "dense/kernel/Adam")
+    # a second export of the same checkpoint reuses the folder
+    assert inference_pool.export_shared_weights(str(tmpdir)) == shared_weights_directory
+
+
+def test_shared_weights_compute_what_the_restored_variables_do(tmpdir):
+    save_checkpoint(str(tmpdir))
+    shared_weights_directory = inference_pool.export_shared_weights(str(tmpdir))
+
+    with tf.Graph().as_default():
+        with tf.variable_scope(tf.get_variable_scope(),
+                               custom_getter=inference_pool.get_shared_weight_getter(shared_weights_directory)):
+            outputs = tf.layers.dense(inputs=tf.ones(shape=[1, 2]), units=3, name="dense")
+
+        assert not tf.global_variables()
+        with tf.Session() as sess:
+            np.testing.assert_allclose(sess.run(outputs), np.ones(shape=[1, 2]).dot(kernel))
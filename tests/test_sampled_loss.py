@@ -0,0 +1,40 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+tf = pytest.importorskip("tensorflow")
+
+from linguistic_style_transfer_model.models import adversarial_autoencoder
+
+
+def get_sampled_and_full_losses(num_classes):
+    random_state = np.random.RandomState(0)
+    inputs = tf.constant(random_state.normal(size=(5, 3)), dtype=tf.float32)
+    labels = tf.constant(random_state.randint(num_classes, size=(5, 1)), dtype=tf.int64)
+    output_layer = tf.layers.Dense(units=num_classes)
+    full_losses = tf.nn.sparse_softmax_cross_entropy_with_logits(labels=labels[:, 0], logits=output_layer(inputs))
+
+    # every class is a candidate with an expected count of 1, so that no sampling correction applies
+    sampled_values = (tf.range(num_classes, dtype=tf.int64), tf.ones(shape=[5, 1]), tf.ones(shape=[num_classes]))
+    sampled_losses = adversarial_autoencoder.AdversarialAutoencoder().get_sampled_loss(
+        "sampled_softmax", output_layer, labels, inputs, num_classes, sampled_values)
+
+    return [sampled_losses, full_losses]
+
+
+def test_sampled_softmax_over_the_whole_vocabulary_matches_the_full_softmax():
+    with tf.Graph().as_default():
+        [sampled_losses, full_losses] = get_sampled_and_full_losses(7)
+        with tf.Session() as sess:
+            sess.run(tf.global_variables_initializer())
+            [sampled_loss_values, full_loss_values] = sess.run([sampled_losses, full_losses])
+
+    np.testing.assert_allclose(sampled_loss_values, full_loss_values, rtol=1e-5)
+
+
+def test_sampled_loss_rejects_an_output_activation():
+    with tf.Graph().as_default():
+        output_layer = tf.layers.Dense(units=4, activation=tf.nn.leaky_relu)
+        output_layer(tf.zeros(shape=[1, 3]))
+        with pytest.raises(Exception, match="linear output layer"):
+            adversarial_autoencoder.AdversarialAutoencoder().get_sampled_loss(
+                "sampled_softmax", output_layer, tf.zeros(shape=[1, 1], dtype=tf.int64), tf.zeros(shape=[1, 3]), 2)